@@ -0,0 +1,89 @@
+"""
+Streaming CSV and Excel exports.
+
+Rows are read with `.iterator(chunk_size=...)` so only one chunk of orders
+is in memory at a time. CSV is written straight into a StreamingHttpResponse,
+so the first bytes leave before the query has finished. An .xlsx file is a
+zip and can't be sent until it is complete, so the workbook is built in
+xlsxwriter's constant_memory mode (rows are flushed to disk as they are
+written) into a temporary file, which is then streamed back.
+"""
+import csv
+import tempfile
+
+import xlsxwriter
+from django.http import FileResponse, StreamingHttpResponse
+
+
+CHUNK_SIZE = 2000
+
+ORDER_HEADERS = ['Order ID', 'User', 'Amount', 'Status', 'Payment Method', 'Date']
+SALES_HEADERS = ['Order ID', 'Customer', 'Date', 'Total Amount', 'Discount', 'Payment Method']
+
+
+class Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def iterate_orders(orders):
+    return (orders.select_related('user')
+            .only('id', 'total_price', 'discount_amount', 'status', 'payment_method',
+                  'created_at', 'user__username', 'user__first_name', 'user__last_name')
+            .iterator(chunk_size=CHUNK_SIZE))
+
+
+def order_rows(orders):
+    for order in iterate_orders(orders):
+        yield [
+            order.id,
+            order.user.get_full_name() or order.user.username,
+            order.total_price,
+            order.status,
+            order.payment_method,
+            order.created_at.strftime('%Y-%m-%d %H:%M'),
+        ]
+
+
+def sales_rows(orders):
+    for order in iterate_orders(orders):
+        yield [
+            order.id,
+            order.user.username,
+            order.created_at.strftime('%Y-%m-%d'),
+            float(order.total_price),
+            float(order.discount_amount),
+            order.payment_method,
+        ]
+
+
+def csv_response(headers, rows, filename):
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(headers)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def write_xlsx(output, headers, rows, sheet_name='Sheet1'):
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, headers)
+    for row, values in enumerate(rows, start=1):
+        worksheet.write_row(row, 0, values)
+    workbook.close()
+
+
+def xlsx_response(headers, rows, filename, sheet_name='Sheet1'):
+    output = tempfile.TemporaryFile()
+    write_xlsx(output, headers, rows, sheet_name)
+    output.seek(0)
+    # FileResponse sends the file in blocks and closes (deletes) it afterwards
+    return FileResponse(output, as_attachment=True, filename=filename)
@@ -248,7 +248,18 @@ class BannerForm(forms.ModelForm):
     class Meta:
         model = Banner
         fields = ['title', 'image', 'link',
-                  'is_active', 'age_min', 'age_max', 'gender']
+                  'is_active', 'age_min', 'age_max', 'gender',
+                  'starts_at', 'ends_at']
+        widgets = {
+            'starts_at': forms.DateTimeInput(attrs={
+                'type': 'datetime-local',
+                'class': 'w-full border p-2 rounded'
+            }),
+            'ends_at': forms.DateTimeInput(attrs={
+                'type': 'datetime-local',
+                'class': 'w-full border p-2 rounded'
+            }),
+        }
 
     def clean(self):
         cleaned_data = super().clean()
@@ -257,6 +268,10 @@ class BannerForm(forms.ModelForm):
         if age_min and age_max and age_min > age_max:
             raise forms.ValidationError(
                 "Minimum age cannot be greater than maximum age.")
+        starts_at = cleaned_data.get('starts_at')
+        ends_at = cleaned_data.get('ends_at')
+        if starts_at and ends_at and ends_at <= starts_at:
+            self.add_error('ends_at', "End time must be after start time.")
         return cleaned_data
 
 
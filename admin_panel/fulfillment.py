@@ -0,0 +1,76 @@
+"""
+Bulk fulfillment: move many order items along ORDER_FLOW at once.
+
+Items are handled in batches of BATCH_SIZE, each in its own transaction.
+A batch locks its items, checks each one against the same rules as the
+single item form (no moving backwards), moves the rest with
+orders.status.transition - one UPDATE for the items and a set-wise status
+refresh of their orders - and gives back the stock of newly cancelled items
+in one UPDATE. Items that can't move are reported and the rest carry on; a
+batch that fails in the database is reported item by item and skipped.
+"""
+import logging
+from collections import namedtuple
+
+from django.db import DatabaseError, transaction
+
+from orders import status, stock
+from orders.models import ORDER_STATUS, OrderItem
+
+
+logger = logging.getLogger(__name__)
+
+ORDER_FLOW = ['Pending', 'Processing', 'Shipped', 'Delivered', 'Cancelled', 'Returned', 'Completed']
+BATCH_SIZE = 500
+
+Failure = namedtuple('Failure', ['item_id', 'order_id', 'reason'])
+Result = namedtuple('Result', ['moved', 'order_ids', 'failures'])
+
+
+def refusal(current, new_status):
+    """Why an item in `current` can't move to `new_status`, or None."""
+    if current == new_status:
+        return f"Already {new_status}."
+    if current in ORDER_FLOW and new_status in ORDER_FLOW and \
+            ORDER_FLOW.index(new_status) < ORDER_FLOW.index(current):
+        return f"Can't move from {current} back to {new_status}."
+    return None
+
+
+def _move_batch(item_ids, new_status):
+    with transaction.atomic():
+        rows = list(OrderItem.objects.select_for_update().filter(id__in=item_ids)
+                    .values_list('id', 'order_id', 'status', 'product_variant_id', 'quantity'))
+        movable, restock, failures = [], {}, []
+        for item_id, order_id, current, variant_id, quantity in rows:
+            reason = refusal(current, new_status)
+            if reason:
+                failures.append(Failure(item_id, order_id, reason))
+                continue
+            movable.append(item_id)
+            if new_status == 'Cancelled' and current not in ('Cancelled', 'Returned') \
+                    and variant_id:
+                restock[variant_id] = restock.get(variant_id, 0) + quantity
+        moved = status.transition(movable, new_status)
+        stock.give_back(restock)
+    return moved, failures
+
+
+def move(items, new_status, batch_size=BATCH_SIZE):
+    """Move an OrderItem queryset to `new_status`. Returns a Result."""
+    if new_status not in dict(ORDER_STATUS):
+        raise ValueError(f"Unknown status {new_status!r}")
+    item_ids = list(items.order_by('id').values_list('id', flat=True))
+    moved, order_ids, failures = 0, set(), []
+    for start in range(0, len(item_ids), batch_size):
+        batch = item_ids[start:start + batch_size]
+        try:
+            by_order, refused = _move_batch(batch, new_status)
+        except DatabaseError as exc:
+            logger.exception("Bulk move of %d items to %s failed", len(batch), new_status)
+            failures.extend(Failure(item_id, None, f"Not updated: {exc}") for item_id in batch)
+            continue
+        failures.extend(refused)
+        moved += sum(len(ids) for ids in by_order.values())
+        order_ids.update(by_order)
+    return Result(moved, sorted(order_ids), failures)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from admin_panel.rollups import rebuild
+from utils.cache import bump
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales rollups from delivered orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_date', help="First day (YYYY-MM-DD).")
+        parser.add_argument('--to', dest='to_date', help="Last day (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        dates = {}
+        for name in ('from_date', 'to_date'):
+            value = options[name]
+            dates[name] = parse_date(value) if value else None
+            if value and dates[name] is None:
+                raise CommandError(f"Invalid date: {value}")
+        count = rebuild(**dates)
+        bump('dashboard')
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {count} delivered orders."))
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:05
+
+from collections import defaultdict
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill(apps, schema_editor):
+    # Same sharing as admin_panel.rollups._item_rows
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    DailyProductSales = apps.get_model('admin_panel', 'DailyProductSales')
+
+    discounts = defaultdict(Decimal)
+    rows = (OrderItem.objects.filter(order__status='Delivered')
+            .order_by('order_id', 'id')
+            .values_list('order_id', 'order__created_at', 'order__discount_amount',
+                         'product_id', 'quantity', 'price'))
+    for _, lines in groupby(rows.iterator(), key=itemgetter(0)):
+        lines = list(lines)
+        subtotal = sum(quantity * price for *_, quantity, price in lines)
+        for _, created_at, discount, product_id, quantity, price in lines:
+            if product_id is None or not subtotal or not discount:
+                continue
+            day = timezone.localdate(created_at) if timezone.is_aware(created_at) else created_at.date()
+            share = discount * quantity * price / subtotal
+            discounts[day, product_id] += share.quantize(Decimal('0.01'))
+
+    for (day, product_id), discount in discounts.items():
+        DailyProductSales.objects.filter(day=day, product_id=product_id).update(discount=discount)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0004_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyproductsales',
+            name='discount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password, check_password
+from shop.models import Brand, Category, Product
 
 
 class AdminUser(models.Model):
@@ -18,3 +19,70 @@ class AdminUser(models.Model):
 
     def __str__(self):
         return self.username
+
+
+class ReportJob(models.Model):
+    PDF = 'pdf'
+    EXCEL = 'xlsx'
+    KIND_CHOICES = [(PDF, 'PDF'), (EXCEL, 'Excel')]
+
+    QUEUED = 'Queued'
+    RUNNING = 'Running'
+    DONE = 'Done'
+    FAILED = 'Failed'
+    STATUS_CHOICES = [(QUEUED, QUEUED), (RUNNING, RUNNING), (DONE, DONE), (FAILED, FAILED)]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    from_date = models.DateField(null=True, blank=True)
+    to_date = models.DateField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.PositiveSmallIntegerField(default=0)
+    file = models.FileField(upload_to='reports/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def filename(self):
+        return f'sales_report.{self.kind}'
+
+    def __str__(self):
+        return f'{self.get_kind_display()} report #{self.pk} ({self.status})'
+
+
+class DailySales(models.Model):
+    """Delivered orders per day and payment method, see admin_panel.rollups."""
+    day = models.DateField()
+    payment_method = models.CharField(max_length=20)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'payment_method'], name='daily_sales_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.day} {self.payment_method}: {self.orders} orders'
+
+
+class DailyProductSales(models.Model):
+    """Items of delivered orders per day and product, with the product's
+    category and brand when first counted."""
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
+    brand = models.ForeignKey(Brand, on_delete=models.SET_NULL, null=True)
+    quantity = models.IntegerField(default=0)
+    sales = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # The items' share of their orders' discounts
+    discount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='daily_product_sales_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.day} product {self.product_id}: {self.quantity} sold'
@@ -0,0 +1,168 @@
+"""
+Sales reports and the background jobs that build them.
+
+Large reports are generated on a small in-process thread pool instead of in
+the request thread. A ReportJob row carries the status and progress that the
+sales report page polls, and the finished file is saved under MEDIA_ROOT
+for download. Nothing survives a restart: jobs that were queued or running
+at the time stay that way and have to be requested again.
+"""
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.files import File
+from django.db import connections, transaction
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from orders.models import Order
+
+from . import exports
+from .models import ReportJob
+
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 2
+PROGRESS_STEP = 500
+RETENTION = timedelta(days=7)
+
+EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='reports')
+
+
+def sales_orders(from_date=None, to_date=None):
+    orders = Order.objects.filter(status='Delivered')
+    if from_date and to_date:
+        orders = orders.filter(created_at__date__range=(from_date, to_date))
+    return orders
+
+
+def write_sales_pdf(orders, output, from_date=None, to_date=None):
+    p = canvas.Canvas(output, pagesize=A4)
+    width, height = A4
+    y = height - 40
+
+    # 🧾 Header
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(50, y, "📄 BabyMuse Sales Report")
+    y -= 25
+
+    p.setFont("Helvetica", 11)
+    date_range = f"From: {from_date}   To: {to_date}" if from_date and to_date else "All Delivered Orders"
+    p.drawString(50, y, date_range)
+    y -= 30
+
+    # 📊 Table Headers
+    headers = ["Order ID", "Customer", "Date", "Total ₹", "Discount ₹", "Payment"]
+    x_positions = [50, 110, 200, 290, 380, 470]
+    p.setFont("Helvetica-Bold", 10)
+    for i, header in enumerate(headers):
+        p.drawString(x_positions[i], y, header)
+    y -= 15
+    p.line(50, y, width - 50, y)
+    y -= 20
+
+    # 🧾 Table Rows
+    p.setFont("Helvetica", 10)
+    total_amount = 0
+    total_discount = 0
+
+    for order in orders:
+        if y < 80:
+            p.showPage()
+            y = height - 50
+            p.setFont("Helvetica-Bold", 10)
+            for i, header in enumerate(headers):
+                p.drawString(x_positions[i], y, header)
+            y -= 15
+            p.line(50, y, width - 50, y)
+            y -= 20
+            p.setFont("Helvetica", 10)
+
+        values = [
+            str(order.id),
+            order.user.username,
+            str(order.created_at.date()),
+            f"₹{order.total_price:.2f}",
+            f"₹{order.discount_amount:.2f}",
+            order.payment_method
+        ]
+        for i, value in enumerate(values):
+            p.drawString(x_positions[i], y, value)
+        y -= 20
+
+        total_amount += order.total_price
+        total_discount += order.discount_amount
+
+    # 📈 Summary
+    y -= 30
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(50, y, f"Total Sales: ₹{total_amount:.2f}")
+    p.drawString(250, y, f"Total Discounts: ₹{total_discount:.2f}")
+
+    # 🖋️ Footer
+    p.setFont("Helvetica-Oblique", 9)
+    p.drawString(50, 30, f"Generated by BabyMuse Admin • {timezone.now().strftime('%Y-%m-%d %H:%M')}")
+
+    p.save()
+
+
+def enqueue(kind, from_date=None, to_date=None):
+    """Create a ReportJob and start it once the current transaction commits."""
+    purge_old_jobs()
+    job = ReportJob.objects.create(kind=kind, from_date=from_date, to_date=to_date)
+    transaction.on_commit(lambda: EXECUTOR.submit(_work, job.pk))
+    return job
+
+
+def _work(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # Worker threads open their own connections
+        connections.close_all()
+
+
+def _tracked(items, job_id, total):
+    """Yield from `items`, recording progress every PROGRESS_STEP items."""
+    for done, item in enumerate(items, start=1):
+        if done % PROGRESS_STEP == 0:
+            ReportJob.objects.filter(pk=job_id).update(progress=min(99, done * 100 // total))
+        yield item
+
+
+def run_job(job_id):
+    job = ReportJob.objects.get(pk=job_id)
+    ReportJob.objects.filter(pk=job_id).update(status=ReportJob.RUNNING)
+    try:
+        orders = sales_orders(job.from_date, job.to_date)
+        total = orders.count() or 1
+        with tempfile.TemporaryFile() as output:
+            if job.kind == ReportJob.PDF:
+                write_sales_pdf(_tracked(exports.iterate_orders(orders), job_id, total),
+                                output, job.from_date, job.to_date)
+            else:
+                exports.write_xlsx(output, exports.SALES_HEADERS,
+                                   _tracked(exports.sales_rows(orders), job_id, total),
+                                   sheet_name='Sales Report')
+            output.seek(0)
+            job.file.save(job.filename, File(output), save=False)
+    except Exception as exc:
+        logger.exception('Report job %s failed', job_id)
+        ReportJob.objects.filter(pk=job_id).update(
+            status=ReportJob.FAILED, error=str(exc), finished_at=timezone.now())
+        return
+
+    job.status = ReportJob.DONE
+    job.progress = 100
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'progress', 'file', 'finished_at'])
+
+
+def purge_old_jobs():
+    for job in ReportJob.objects.filter(created_at__lt=timezone.now() - RETENTION):
+        job.file.delete(save=False)
+        job.delete()
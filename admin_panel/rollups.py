@@ -0,0 +1,206 @@
+"""
+Daily sales rollups behind the dashboard and the sales report.
+
+DailySales holds delivered orders, revenue and discount per day and payment
+method; DailyProductSales holds units, item sales and discount per day and
+product, tagged with the product's category and brand. An order's discount
+is shared between its items in proportion to their value (`_item_rows`).
+
+An order counts on the day it was placed while its status is Delivered, so
+the rollups are moved by order_status_changed (see admin_panel/signals.py):
+orders becoming Delivered are added, orders leaving it or deleted while in
+it subtracted, with F() updates on a handful of rows. Items whose product is
+gone only count towards DailySales. Status writes that bypass orders.status
+(raw .update() calls) aren't seen; `rebuild` (`manage.py
+backfill_sales_rollups`) recomputes a date range from the raw orders.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractMonth, TruncDate
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+
+from .models import DailyProductSales, DailySales
+
+
+DELIVERED = 'Delivered'
+CENT = Decimal('0.01')
+TOP_FIELDS = {'product': 'product__name', 'category': 'category__name', 'brand': 'brand__name'}
+
+
+def _day(moment):
+    return timezone.localdate(moment) if timezone.is_aware(moment) else moment.date()
+
+
+def _add(model, key, deltas, defaults=None):
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**key).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **(defaults or {}), **deltas)
+    except IntegrityError:
+        # Created by a concurrent writer since the update above
+        model.objects.filter(**key).update(**changes)
+
+
+def _item_rows(items):
+    """
+    (day, product_id, category_id, brand_id, quantity, sales, discount) for
+    each item with a product of an OrderItem queryset, its order's discount
+    shared between all of the order's items by value. Every item of an
+    order must be in `items`.
+    """
+    rows = items.order_by('order_id', 'id').values_list(
+        'order_id', 'order__created_at', 'order__discount_amount', 'product_id',
+        'product__category_id', 'product__brand_id', 'quantity', 'price')
+    for _, lines in groupby(rows.iterator(), key=itemgetter(0)):
+        lines = list(lines)
+        subtotal = sum(quantity * price for *_, quantity, price in lines)
+        for _, created_at, discount, product_id, category_id, brand_id, quantity, price in lines:
+            if product_id is None:
+                continue
+            amount = quantity * price
+            share = (discount or 0) * amount / subtotal if subtotal else Decimal(0)
+            yield (_day(created_at), product_id, category_id, brand_id,
+                   quantity, amount, share.quantize(CENT))
+
+
+def deltas(order_ids, sign=1):
+    """Read what adding (sign=1) or subtracting (sign=-1) orders moves in the
+    rollups, for `write`."""
+    sales = defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+    for created_at, method, total, discount in Order.objects.filter(id__in=order_ids).values_list(
+            'created_at', 'payment_method', 'total_price', 'discount_amount'):
+        row = sales[_day(created_at), method]
+        row[0] += sign
+        row[1] += sign * total
+        row[2] += sign * discount
+
+    products = defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+    tags = {}
+    for day, product_id, category_id, brand_id, quantity, amount, discount in _item_rows(
+            OrderItem.objects.filter(order_id__in=order_ids)):
+        row = products[day, product_id]
+        row[0] += sign * quantity
+        row[1] += sign * amount
+        row[2] += sign * discount
+        tags[day, product_id] = {'category_id': category_id, 'brand_id': brand_id}
+    return sales, products, tags
+
+
+def write(changes):
+    """Apply what `deltas` read."""
+    sales, products, tags = changes
+    with transaction.atomic():
+        for (day, method), (orders, revenue, discount) in sales.items():
+            _add(DailySales, {'day': day, 'payment_method': method},
+                 {'orders': orders, 'revenue': revenue, 'discount': discount})
+        for (day, product_id), (quantity, amount, discount) in products.items():
+            _add(DailyProductSales, {'day': day, 'product_id': product_id},
+                 {'quantity': quantity, 'sales': amount, 'discount': discount},
+                 tags[day, product_id])
+
+
+def apply(order_ids, sign=1):
+    """Add (sign=1) or subtract (sign=-1) orders to the rollups."""
+    write(deltas(order_ids, sign))
+
+
+def status_changed(changes):
+    """Move the rollups for [(order_id, old_status, new_status), ...]."""
+    delivered = [order_id for order_id, old, new in changes if new == DELIVERED != old]
+    undelivered = [order_id for order_id, old, new in changes if old == DELIVERED != new]
+    if delivered:
+        apply(delivered)
+    if undelivered:
+        apply(undelivered, -1)
+    return bool(delivered or undelivered)
+
+
+def rebuild(from_date=None, to_date=None):
+    """Recompute the rollups of a date range (all days if open-ended) from
+    the delivered orders. Returns the number of orders counted."""
+    orders = Order.objects.filter(status=DELIVERED)
+    sales = DailySales.objects.all()
+    products = DailyProductSales.objects.all()
+    if from_date:
+        orders = orders.filter(created_at__date__gte=from_date)
+        sales, products = sales.filter(day__gte=from_date), products.filter(day__gte=from_date)
+    if to_date:
+        orders = orders.filter(created_at__date__lte=to_date)
+        sales, products = sales.filter(day__lte=to_date), products.filter(day__lte=to_date)
+
+    daily = (orders.annotate(day=TruncDate('created_at'))
+             .values('day', 'payment_method')
+             .annotate(orders=Count('id'), revenue=Sum('total_price'),
+                       discount=Sum('discount_amount'))
+             .order_by())
+    # Discount shares are computed per order, as in `deltas`
+    per_product = {}
+    for day, product_id, category_id, brand_id, quantity, amount, discount in _item_rows(
+            OrderItem.objects.filter(order__in=orders)):
+        row = per_product.setdefault((day, product_id), DailyProductSales(
+            day=day, product_id=product_id, category_id=category_id, brand_id=brand_id,
+            sales=Decimal(0), discount=Decimal(0)))
+        row.quantity += quantity
+        row.sales += amount
+        row.discount += discount
+
+    with transaction.atomic():
+        sales.delete()
+        products.delete()
+        rows = [DailySales(**row) for row in daily]
+        DailySales.objects.bulk_create(rows, batch_size=1000)
+        DailyProductSales.objects.bulk_create(per_product.values(), batch_size=1000)
+    return sum(row.orders for row in rows)
+
+
+def _between(queryset, from_date=None, to_date=None):
+    if from_date:
+        queryset = queryset.filter(day__gte=from_date)
+    if to_date:
+        queryset = queryset.filter(day__lte=to_date)
+    return queryset
+
+
+def totals(from_date=None, to_date=None):
+    """{'orders', 'revenue', 'discount'} of delivered orders in a range."""
+    result = _between(DailySales.objects, from_date, to_date).aggregate(
+        orders=Sum('orders'), revenue=Sum('revenue'), discount=Sum('discount'))
+    return {name: value or 0 for name, value in result.items()}
+
+
+def by_payment_method(from_date=None, to_date=None):
+    return list(_between(DailySales.objects, from_date, to_date)
+                .values('payment_method')
+                .annotate(orders=Sum('orders'), revenue=Sum('revenue'), discount=Sum('discount'))
+                .order_by('-revenue'))
+
+
+def monthly(year):
+    """[{'month', 'total'}] revenue per month of `year`."""
+    return list(DailySales.objects.filter(day__year=year)
+                .annotate(month=ExtractMonth('day'))
+                .values('month')
+                .annotate(total=Sum('revenue'))
+                .order_by('month'))
+
+
+def top(dimension, limit=5, from_date=None, to_date=None):
+    """[{'name', 'total_sold', 'discount'}] best sellers by 'product',
+    'category' or 'brand'."""
+    return list(_between(DailyProductSales.objects, from_date, to_date)
+                .values(name=F(TOP_FIELDS[dimension]))
+                .annotate(total_sold=Sum('quantity'), discount=Sum('discount'))
+                .order_by('-total_sold')[:limit])
+
+
+def years():
+    return [day.year for day in DailySales.objects.dates('day', 'year')]
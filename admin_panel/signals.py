@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+
+from orders.models import Order, OrderItem
+from orders.signals import order_status_changed
+from shop.models import Product
+from user.models import WalletTransaction
+from utils.cache import bump, invalidate_on
+
+from . import rollups
+
+
+invalidate_on('dashboard', get_user_model(), Product, Order, OrderItem, WalletTransaction)
+
+
+@receiver(order_status_changed)
+def update_sales_rollups(sender, changes, **kwargs):
+    if rollups.status_changed(changes):
+        bump('dashboard')
+
+
+@receiver(pre_delete, sender=Order)
+def read_deleted_order_sales(sender, instance, **kwargs):
+    # Its items are deleted before the order itself, so read them now
+    if Order.objects.filter(pk=instance.pk, status=rollups.DELIVERED).exists():
+        instance._rollup_deltas = rollups.deltas([instance.pk], -1)
+
+
+@receiver(post_delete, sender=Order)
+def subtract_deleted_order_sales(sender, instance, **kwargs):
+    changes = getattr(instance, '_rollup_deltas', None)
+    if changes:
+        rollups.write(changes)
+        bump('dashboard')
@@ -1,3 +1,308 @@
-from django.test import TestCase
+import csv
+import io
+import tempfile
+import zipfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from admin_panel import fulfillment, reports, rollups
+from admin_panel.models import DailyProductSales, DailySales, ReportJob
+from orders import status
+from orders.models import Order, OrderItem
+from shop.models import Brand, Category, Product, ProductVariant
+from user.models import CustomUser
+
+
+class AdminListViewTests(TestCase):
+    def setUp(self):
+        session = self.client.session
+        session['admin_id'] = 1
+        session.save()
+        user = CustomUser.objects.create_user(
+            username='geetha', email='geetha@example.com', password='securepass')
+        for i in range(11):
+            Order.objects.create(user=user, total_price=100 + i)
+
+    def test_admin_lists_render_with_cursor_pagination(self):
+        for name in ('admin_orders', 'admin_customer_list', 'admin_products', 'admin-coupon-list',
+                     'sales_report'):
+            response = self.client.get(reverse(f'admin_panel:{name}'))
+            self.assertEqual(response.status_code, 200, name)
+
+    def test_admin_orders_next_page(self):
+        page = self.client.get(reverse('admin_panel:admin_orders')).context['page_obj']
+        self.assertEqual(len(page), 10)
+        page = self.client.get(reverse('admin_panel:admin_orders'),
+                               {'cursor': page.next_cursor}).context['page_obj']
+        self.assertEqual(len(page), 1)
+
+
+class AdminDashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        session = self.client.session
+        session['admin_id'] = 1
+        session.save()
+        self.user = CustomUser.objects.create_user(
+            username='geetha', email='geetha@example.com', password='securepass')
+
+    def test_dashboard_aggregates_cached_until_orders_change(self):
+        url = reverse('admin_panel:admin_dashboard')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.get(url)
+        self.assertLess(len(warm), 5)
+        self.assertEqual(response.context['total_orders'], 0)
+
+        Order.objects.create(user=self.user, total_price=100)
+        response = self.client.get(url)
+        self.assertEqual(response.context['total_orders'], 1)
+
+
+class AdminExportTests(TestCase):
+    def setUp(self):
+        session = self.client.session
+        session['admin_id'] = 1
+        session.save()
+        for i in range(5):
+            user = CustomUser.objects.create_user(
+                username=f'parent{i}', email=f'parent{i}@example.com', password='securepass')
+            Order.objects.create(user=user, total_price=100 + i, status='Delivered')
+
+    def test_orders_csv_streams_without_per_row_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin_panel:admin_orders'), {'export': 'csv'})
+            self.assertTrue(response.streaming)
+            content = b''.join(response.streaming_content).decode()
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0][0], 'Order ID')
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][1], 'parent4')
+        self.assertLess(len(queries), 5)
+
+    def test_sales_report_excel(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin_panel:sales_report_excel'))
+            content = b''.join(response.streaming_content)
+        self.assertLess(len(queries), 5)
+        with zipfile.ZipFile(io.BytesIO(content)) as workbook:
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row '), 6)
+        # constant_memory writes strings inline rather than to a shared table
+        self.assertIn('parent0', sheet)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ReportJobTests(TestCase):
+    def setUp(self):
+        session = self.client.session
+        session['admin_id'] = 1
+        session.save()
+        user = CustomUser.objects.create_user(
+            username='geetha', email='geetha@example.com', password='securepass')
+        for i in range(3):
+            Order.objects.create(user=user, total_price=100 + i, status='Delivered')
+
+    def queue(self, kind):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('admin_panel:report_job_create'), {'kind': kind})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(callbacks), 1)
+        return response.json()['id']
+
+    def test_pdf_job_runs_and_downloads(self):
+        job_id = self.queue('pdf')
+        status_url = reverse('admin_panel:report_job_status', args=[job_id])
+        self.assertEqual(self.client.get(status_url).json()['status'], 'Queued')
+
+        reports.run_job(job_id)
+        status = self.client.get(status_url).json()
+        self.assertEqual((status['status'], status['progress']), ('Done', 100))
+        response = self.client.get(status['download_url'])
+        self.assertEqual(b''.join(response.streaming_content)[:4], b'%PDF')
+
+    def test_excel_job(self):
+        job_id = self.queue('xlsx')
+        reports.run_job(job_id)
+        job = ReportJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, ReportJob.DONE)
+        with job.file.open('rb') as f, zipfile.ZipFile(f) as workbook:
+            self.assertEqual(workbook.read('xl/worksheets/sheet1.xml').decode().count('<row '), 4)
+
+    def test_failed_job_reports_error(self):
+        job_id = self.queue('pdf')
+        with mock.patch.object(reports, 'write_sales_pdf', side_effect=RuntimeError('disk full')):
+            reports.run_job(job_id)
+        status = self.client.get(reverse('admin_panel:report_job_status', args=[job_id])).json()
+        self.assertEqual((status['status'], status['error'], status['download_url']),
+                         ('Failed', 'disk full', None))
+
+    def test_unknown_kind_rejected(self):
+        response = self.client.post(reverse('admin_panel:report_job_create'), {'kind': 'doc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkFulfillmentTests(TestCase):
+    def setUp(self):
+        session = self.client.session
+        session['admin_id'] = 1
+        session.save()
+        user = CustomUser.objects.create_user(username='bulk', email='bulk@example.com')
+        product = Product.objects.create(name='Rattle')
+        self.variant = ProductVariant.objects.create(product=product, sku='R-1', price=100, stock=0)
+        self.orders = [Order.objects.create(user=user, total_price=200) for _ in range(3)]
+        for order in self.orders:
+            for _ in range(2):
+                OrderItem.objects.create(order=order, product=product,
+                                         product_variant=self.variant, quantity=1, price=100)
+
+    def test_move_reports_failures_and_carries_on(self):
+        delivered = OrderItem.objects.filter(order=self.orders[0]).first()
+        delivered.status = 'Delivered'
+        delivered.save()
+
+        result = fulfillment.move(OrderItem.objects.all(), 'Shipped', batch_size=2)
+        self.assertEqual(result.moved, 5)
+        self.assertEqual(result.order_ids, [order.id for order in self.orders])
+        self.assertEqual([(f.item_id, f.reason) for f in result.failures],
+                         [(delivered.id, "Can't move from Delivered back to Shipped.")])
+        statuses = dict(Order.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[self.orders[0].id], 'Partially Delivered')
+        self.assertEqual(statuses[self.orders[1].id], 'Shipped')
+
+    def test_cancel_restocks_in_one_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = fulfillment.move(OrderItem.objects.all(), 'Cancelled')
+        self.assertEqual(result.moved, 6)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 6)
+        stock_updates = [q for q in queries.captured_queries
+                         if q['sql'].startswith('UPDATE "shop_productvariant"')]
+        self.assertEqual(len(stock_updates), 1)
+
+        result = fulfillment.move(OrderItem.objects.all(), 'Cancelled')
+        self.assertEqual((result.moved, len(result.failures)), (0, 6))
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 6)
+
+    def test_view(self):
+        url = reverse('admin_panel:bulk_fulfillment')
+        response = self.client.post(url + '?format=json', {
+            'order_ids': [self.orders[0].id, self.orders[1].id], 'new_status': 'Processing'})
+        self.assertEqual(response.json(), {
+            'moved': 4, 'orders': [self.orders[0].id, self.orders[1].id], 'failures': []})
+
+        response = self.client.post(url, {'scope': 'filtered', 'item_status': 'Pending',
+                                          'new_status': 'Shipped'})
+        self.assertContains(response, '2 items in 1 order')
+        self.assertEqual(Order.objects.get(pk=self.orders[2].pk).status, 'Shipped')
+
+        response = self.client.post(url + '?format=json', {'new_status': 'Lost'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        session = self.client.session
+        session['admin_id'] = 1
+        session.save()
+        self.user = CustomUser.objects.create_user(username='rollup', email='rollup@example.com')
+        category = Category.objects.create(name='Toys')
+        brand = Brand.objects.create(name='Muse')
+        self.products = [Product.objects.create(name=f'Toy {i}', category=category, brand=brand)
+                         for i in range(2)]
+
+    def order(self, method='COD', quantities=(1, 2)):
+        order = Order.objects.create(user=self.user, total_price=250, discount_amount=50,
+                                     payment_method=method)
+        for product, quantity in zip(self.products, quantities):
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=100)
+        return order
+
+    def deliver(self, order):
+        status.transition(order.items.all(), 'Delivered')
+
+    def test_delivered_orders_rolled_up_incrementally(self):
+        first, second = self.order(), self.order('Wallet', (3,))
+        self.assertFalse(DailySales.objects.exists())
+
+        self.deliver(first)
+        self.deliver(second)
+        self.assertEqual(rollups.totals(), {'orders': 2, 'revenue': 500, 'discount': 100})
+        self.assertEqual([row['name'] for row in rollups.top('product')], ['Toy 0', 'Toy 1'])
+        self.assertEqual(rollups.top('brand'),
+                         [{'name': 'Muse', 'total_sold': 6, 'discount': Decimal('100.00')}])
+        self.assertEqual({row['payment_method']: row['orders']
+                          for row in rollups.by_payment_method()}, {'COD': 1, 'Wallet': 1})
+
+        item = first.items.first()
+        item.status = 'Returned'
+        item.save()
+        self.assertEqual(rollups.totals()['orders'], 1)
+        self.assertEqual(rollups.top('category'),
+                         [{'name': 'Toys', 'total_sold': 3, 'discount': Decimal('50.00')}])
+
+        incremental = sorted(DailyProductSales.objects.filter(quantity__gt=0)
+                             .values_list('product_id', 'quantity', 'sales', 'discount'))
+        self.assertEqual(rollups.rebuild(), 1)
+        self.assertEqual(sorted(DailyProductSales.objects.values_list(
+            'product_id', 'quantity', 'sales', 'discount')), incremental)
+
+    def test_order_discount_shared_between_products(self):
+        self.deliver(self.order())
+        self.assertEqual(sorted(DailyProductSales.objects.values_list('product_id', 'discount')),
+                         [(self.products[0].id, Decimal('16.67')),
+                          (self.products[1].id, Decimal('33.33'))])
+
+    def test_items_without_product_skipped(self):
+        order = self.order()
+        OrderItem.objects.create(order=order, product=None, quantity=4, price=10)
+        self.deliver(order)
+        self.assertFalse(DailyProductSales.objects.filter(product=None).exists())
+        self.products[0].delete()  # its rollup row keeps the units sold
+        self.assertEqual(DailyProductSales.objects.get(product=None).quantity, 1)
+
+        other = Order.objects.create(user=self.user, total_price=20, payment_method='COD')
+        OrderItem.objects.create(order=other, product=None, quantity=2, price=10)
+        self.deliver(other)
+        status.transition(other.items.all(), 'Returned')
+        self.assertEqual(DailyProductSales.objects.get(product=None).quantity, 1)
+        self.assertEqual(rollups.totals()['orders'], 1)
+
+    def test_deleting_delivered_order_subtracts_it(self):
+        kept, deleted = self.order(), self.order('Wallet', (3,))
+        self.deliver(kept)
+        self.deliver(deleted)
+        deleted.delete()
+        self.order().delete()  # never delivered
+        self.assertEqual(rollups.totals(), {'orders': 1, 'revenue': 250, 'discount': 50})
+        self.assertEqual(rollups.top('brand'),
+                         [{'name': 'Muse', 'total_sold': 3, 'discount': Decimal('50.00')}])
+
+    def test_dashboard_and_report_read_rollups(self):
+        self.deliver(self.order())
+        today = DailySales.objects.get().day
+        response = self.client.get(reverse('admin_panel:admin_dashboard'),
+                                   {'year': today.year - 3})
+        self.assertEqual(response.context['sales_chart_data'], {'labels': [], 'totals': []})
+        self.assertIn(today.year - 3, response.context['years'])
+        response = self.client.get(reverse('admin_panel:admin_dashboard'))
+        self.assertEqual(response.context['total_revenue'], 250)
+        self.assertEqual(response.context['top_brands'],
+                         [{'name': 'Muse', 'total_sold': 3, 'discount': Decimal('50.00')}])
+
+        response = self.client.get(reverse('admin_panel:sales_report'),
+                                   {'from': str(today), 'to': str(today)})
+        self.assertEqual((response.context['total_orders'], response.context['total_discount']),
+                         (1, 50))
+        self.assertEqual(len(response.context['page_obj']), 1)
+        response = self.client.get(reverse('admin_panel:sales_report'),
+                                   {'from': '2001-01-01', 'to': '2001-01-31'})
+        self.assertEqual(response.context['total_orders'], 0)
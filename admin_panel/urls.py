@@ -40,6 +40,7 @@ urlpatterns = [
 
     # Orders
     path('orders/', views.admin_orders, name='admin_orders'),
+    path('orders/fulfillment/', views.bulk_fulfillment, name='bulk_fulfillment'),
     path('orders/<int:order_id>/', views.admin_order_detail,
          name='admin_order_detail'),
     path('orders/<int:order_id>/invoice/',
@@ -76,10 +77,13 @@ urlpatterns = [
 
 
     path('sales_report/', views.sales_report_view, name='sales_report'),
-    path('sales-report/pdf/', views.download_sales_report_pdf,
-         name='sales_report_pdf'),
     path('sales-report/excel/', views.download_sales_report_excel,
          name='sales_report_excel'),
+    path('sales-report/jobs/', views.report_job_create, name='report_job_create'),
+    path('sales-report/jobs/<int:job_id>/', views.report_job_status,
+         name='report_job_status'),
+    path('sales-report/jobs/<int:job_id>/download/', views.report_job_download,
+         name='report_job_download'),
 
     # Banners
 
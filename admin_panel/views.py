@@ -3,24 +3,24 @@ from core.models import FAQ, Banner
 from orders.models import OrderItem, ORDER_STATUS
 from admin_panel.decorators import admin_login_required
 from django.shortcuts import get_object_or_404, redirect
-import csv
 from django.http import HttpResponse
 from orders.models import ORDER_STATUS, Coupon, Order, OrderItem, ReturnRequest
 from .forms import BannerForm, BrandForm, CouponForm, ProductForm, ProductOfferForm, VariantComboForm, CategoryOfferForm
 from django.utils.text import slugify
+from django.urls import reverse
 import json
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import get_user_model
 
 from .forms import CategoryForm, ProductForm, VariantComboForm
 from shop.models import Brand, Category, Product, ProductImage, ProductVariant, VariantOption, VariantAttribute
-from .models import AdminUser
+from .models import AdminUser, ReportJob
 from django.contrib.auth.hashers import check_password, make_password
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 import random
 import string
-from django.core.mail import send_mail
+from core.mail import queue_mail
 from django.conf import settings
 from .decorators import admin_login_required
 from django.views.decorators.http import require_POST
@@ -28,17 +28,20 @@ from django.core.paginator import Paginator
 from django.db.models import Sum, Q, Prefetch
 import base64
 from django.core.files.base import ContentFile
-import xlsxwriter
 from django.utils.dateparse import parse_date
-from django.http import HttpResponse, FileResponse
-from io import BytesIO
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
+from django.http import HttpResponse, FileResponse, JsonResponse
 from django.utils.timezone import now
-from django.db.models.functions import ExtractMonth
+from utils.cache import cached
+from utils.pagination import CursorPaginator
+from orders import stock
+from . import exports, fulfillment, reports, rollups
+from .fulfillment import ORDER_FLOW
 
 User = get_user_model()
 
+ADMIN_PAGE_SIZE = 10
+DASHBOARD_CACHE_TIMEOUT = 5 * 60
+
 # Create default admin user
 if not AdminUser.objects.filter(username='admin123').exists():
     admin = AdminUser(username='admin123', password=make_password(
@@ -82,12 +85,10 @@ def admin_forgot_password(request):
             admin.password = make_password(temp_password)
             admin.save()
 
-            send_mail(
+            queue_mail(
                 'BabyMuse Admin - Temporary Password',
                 f'Your temporary password is: {temp_password}\nPlease login and change it immediately.',
-                settings.DEFAULT_FROM_EMAIL,
                 [email],
-                fail_silently=False,
             )
 
             messages.success(request, "Temporary password sent to your email.")
@@ -100,98 +101,57 @@ def admin_forgot_password(request):
 
 User = get_user_model()
 
-@admin_login_required
-def admin_dashboard(request):
+@cached('dashboard', timeout=DASHBOARD_CACHE_TIMEOUT)
+def dashboard_stats(year):
+    """Aggregates shown on the dashboard, read from the daily sales rollups;
+    rebuilt when orders, users, products or wallet transactions change."""
     total_users = User.objects.count()
     total_products = Product.objects.count()
     total_orders = Order.objects.count()
-    total_revenue = Order.objects.filter(status="Delivered").aggregate(
-        total=Sum('total_price'))['total'] or 0
-
-    latest_orders = Order.objects.select_related('user').order_by('-created_at')[:5]
-
+    total_revenue = rollups.totals()['revenue']
 
-# Top 5 best-selling products
-    top_products = (
-        OrderItem.objects.filter(order__status='Delivered')
-    .values('product__name')
-    .annotate(total_sold=Sum('quantity'))
-    .order_by('-total_sold')[:5]
-)
-
-# Top 5 categories
-    top_categories = (
-    OrderItem.objects.filter(order__status='Delivered')
-    .values('product__category__name')
-    .annotate(total_sold=Sum('quantity'))
-    .order_by('-total_sold')[:5]
-)
-
-# Top 5 brands
-    top_brands = (
-    OrderItem.objects.filter(order__status='Delivered')
-    .values('product__brand__name')
-    .annotate(total_sold=Sum('quantity'))
-    .order_by('-total_sold')[:5]
-)
-
-    monthly_sales = (
-    Order.objects.filter(status='Delivered', created_at__year=now().year)
-    .annotate(month=ExtractMonth('created_at'))
-    .values('month')
-    .annotate(total=Sum('total_price'))
-    .order_by('month')
-)
-
-# Convert to chart-friendly format
+    monthly_sales = rollups.monthly(year)
     sales_chart_data = {
-    'labels': [f"{month['month']:02d}" for month in monthly_sales],
-    'totals': [float(month['total']) for month in monthly_sales],
-}
-
+        'labels': [f"{month['month']:02d}" for month in monthly_sales],
+        'totals': [float(month['total']) for month in monthly_sales],
+    }
 
-    sales_2024 = get_monthly_sales(2024)
-    sales_2025 = get_monthly_sales(2025)
+    ledger = WalletTransaction.objects.aggregate(
+        total_credit=Sum('amount', filter=Q(transaction_type='Credit')),
+        total_debit=Sum('amount', filter=Q(transaction_type='Debit')))
+    total_credit = ledger['total_credit'] or 0
+    total_debit = ledger['total_debit'] or 0
+    net_balance = total_credit - total_debit
 
+    return {
+        'total_users': total_users,
+        'total_products': total_products,
+        'total_orders': total_orders,
+        'total_revenue': total_revenue,
+        'top_products': rollups.top('product'),
+        'top_categories': rollups.top('category'),
+        'top_brands': rollups.top('brand'),
+        'sales_chart_data': sales_chart_data,
+        'total_credit': total_credit,
+        'total_debit': total_debit,
+        'net_balance': net_balance,
+        'years': sorted(set(rollups.years()) | {year, now().year}, reverse=True),
+    }
 
 
+@admin_login_required
+def admin_dashboard(request):
+    year = request.GET.get('year', '')
+    year = int(year) if year.isdigit() else now().year
+    latest_orders = Order.objects.select_related('user').order_by('-created_at')[:5]
     ledger = WalletTransaction.objects.all().order_by('-created_at')
 
-    total_credit = ledger.filter(transaction_type='Credit').aggregate(Sum('amount'))['amount__sum'] or 0
-    total_debit = ledger.filter(transaction_type='Debit').aggregate(Sum('amount'))['amount__sum'] or 0
-    net_balance = total_credit - total_debit
-    
     return render(request, 'admin_panel/dashboard.html', {
-    'total_users': total_users,
-    'total_products': total_products,
-    'total_orders': total_orders,
-    'total_revenue': total_revenue,
+    **dashboard_stats(year),
+    'year': year,
     'latest_orders': latest_orders,
-    'top_products': top_products,
-    'top_categories': top_categories,
-    'top_brands': top_brands,
-    'sales_chart_data': sales_chart_data,
-    'ledger': ledger[:5],  
-    'total_credit': total_credit,
-    'total_debit': total_debit,
-    'net_balance': net_balance,
-    'sales_2024': format_pie_data(sales_2024),
-    'sales_2025': format_pie_data(sales_2025),
-
+    'ledger': ledger[:5],
 })
-def format_pie_data(sales):
-    labels = [f"{month['month']:02d}" for month in sales]
-    totals = [float(month['total']) for month in sales]
-    return {'labels': labels, 'totals': totals}
-
-def get_monthly_sales(year):
-    return (
-        Order.objects.filter(status='Delivered', created_at__year=year)
-        .annotate(month=ExtractMonth('created_at'))
-        .values('month')
-        .annotate(total=Sum('total_price'))
-        .order_by('month')
-    )
 
 
 @admin_login_required
@@ -230,9 +190,8 @@ def admin_customer_list(request):
     if query:
         customers = customers.filter(Q(username__icontains=query) | Q(
             email__icontains=query) | Q(phone__icontains=query))
-    paginator = Paginator(customers, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(customers, ADMIN_PAGE_SIZE, ('-date_joined', '-id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     return render(request, 'admin_panel/customer_list.html', {'page_obj': page_obj, 'query': query, 'customers': customers})
 
 
@@ -338,9 +297,8 @@ def admin_products(request):
     ).order_by('-created_at')
 
     # Pagination
-    paginator = Paginator(products, 10)  # 10 per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(products, ADMIN_PAGE_SIZE, ('-created_at', '-id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     # All categories for dropdown
     categories = Category.objects.filter(is_deleted=False)
@@ -393,18 +351,11 @@ def save_product_and_variants(request, product, is_edit, size_qs, color_qs):
 
         product = form.save()
 
-        # Get IDs of images to keep
+        # Get IDs of images to keep; resized copies of the new ones are made
+        # after the request by utils.images
         keep_image_ids = request.POST.getlist('keep_image_ids')
-        cropped_images_data = request.POST.get('cropped_images_data')
-        new_images = []
-
-        if cropped_images_data:
-            images_data = json.loads(cropped_images_data)
-            for idx, img_str in enumerate(images_data):
-                format, imgstr = img_str.split(';base64,')
-                ext = format.split('/')[-1]
-                new_images.append(ContentFile(base64.b64decode(
-                    imgstr), name=f'cropped{idx+1}.{ext}'))
+        new_images = [decode_cropped_image(img_str, f'cropped{idx+1}')
+                      for idx, img_str in enumerate(new_images)]
 
         total_images = len(keep_image_ids) + len(new_images)
         if total_images == 0:
@@ -537,25 +488,23 @@ def get_existing_variant_data(product):
     return variants
 
 
+def decode_cropped_image(data_url, name):
+    """File from a cropper data URL ('data:image/png;base64,...')."""
+    format, imgstr = data_url.split(';base64,')
+    ext = format.split('/')[-1]
+    return ContentFile(base64.b64decode(imgstr), name=f'{name}.{ext}')
+
+
 def handle_cropped_images(product, cropped_data_list):
     for i, img_data in enumerate(cropped_data_list):
-        format, imgstr = img_data.split(';base64,')
-        ext = format.split('/')[-1]
-        image_file = ContentFile(base64.b64decode(
-            imgstr), name=f"product_{product.id}_{i}.{ext}")
-        ProductImage.objects.create(product=product, image=image_file)
+        ProductImage.objects.create(
+            product=product, image=decode_cropped_image(img_data, f"product_{product.id}_{i}"))
 
 # order management
 
 
-@admin_login_required
-def admin_orders(request):
-    query = request.GET.get('q', '').strip()
-    status_filter = request.GET.get('status', '').strip()
-    export_csv = request.GET.get('export') == 'csv'
-
-    # Fetch & filter orders
-    orders = Order.objects.select_related('user').all()
+def filter_orders(query='', status_filter=''):
+    orders = Order.objects.all()
 
     if query:
         orders = orders.filter(
@@ -568,42 +517,76 @@ def admin_orders(request):
     if status_filter:
         orders = orders.filter(status=status_filter)
 
-    orders = orders.order_by('-created_at')
+    return orders
+
+
+@admin_login_required
+def admin_orders(request):
+    query = request.GET.get('q', '').strip()
+    status_filter = request.GET.get('status', '').strip()
+    export_csv = request.GET.get('export') == 'csv'
+
+    orders = filter_orders(query, status_filter).select_related('user').order_by('-created_at')
 
     if export_csv:
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="orders.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow([
-            'Order ID', 'User', 'Amount',
-            'Status', 'Payment Method', 'Date'
-        ])
-
-        for order in orders:
-            user_name = order.user.get_full_name() or order.user.username
-            writer.writerow([
-                order.id,
-                user_name,
-                order.total_price,
-                order.status,
-                order.payment_method,
-                order.created_at.strftime('%Y-%m-%d %H:%M'),
-            ])
-
-        return response
-
-    paginator = Paginator(orders, 10)
-    page_obj = paginator.get_page(request.GET.get('page'))
+        return exports.csv_response(
+            exports.ORDER_HEADERS, exports.order_rows(orders), 'orders.csv')
+
+    paginator = CursorPaginator(orders, ADMIN_PAGE_SIZE, ('-created_at', '-id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     return render(request, 'admin_panel/orders.html', {
         'page_obj': page_obj,
         'query': query,
         'status_filter': status_filter,
+        'status_choices': ORDER_STATUS,
     })
 
 
-ORDER_FLOW = ['Pending', 'Processing', 'Shipped', 'Delivered', 'Cancelled','Returned','Completed']
+@admin_login_required
+@require_POST
+def bulk_fulfillment(request):
+    """Move the items of the selected orders, or of every order matching the
+    list filters, to a new status."""
+    new_status = request.POST.get('new_status')
+    order_ids = [pk for pk in request.POST.getlist('order_ids') if pk.isdigit()]
+    filtered = request.POST.get('scope') == 'filtered'
+    wants_json = request.GET.get('format') == 'json'
+
+    if new_status not in dict(ORDER_STATUS):
+        error = "Invalid status selected."
+    elif not order_ids and not filtered:
+        error = "Select some orders first."
+    else:
+        error = None
+    if error:
+        if wants_json:
+            return JsonResponse({'error': error}, status=400)
+        messages.error(request, error)
+        return redirect('admin_panel:admin_orders')
+
+    if filtered:
+        orders = filter_orders(request.POST.get('q', '').strip(),
+                               request.POST.get('status', '').strip())
+    else:
+        orders = Order.objects.filter(id__in=order_ids)
+    items = OrderItem.objects.filter(order__in=orders)
+    item_status = request.POST.get('item_status')
+    if item_status:
+        items = items.filter(status=item_status)
+
+    result = fulfillment.move(items, new_status)
+
+    if wants_json:
+        return JsonResponse({
+            'moved': result.moved,
+            'orders': result.order_ids,
+            'failures': [failure._asdict() for failure in result.failures],
+        })
+    return render(request, 'admin_panel/fulfillment_result.html', {
+        'result': result,
+        'new_status': new_status,
+    })
 
 
 @admin_login_required
@@ -650,18 +633,14 @@ def change_item_status(request, item_id):
 
         # Restock logic only if item is being cancelled and wasn't already
         if item.status not in ['Cancelled', 'Returned'] and new_status == 'Cancelled':
-            item.product_variant.stock += item.quantity
-            item.product_variant.save()
+            stock.give_back({item.product_variant_id: item.quantity})
 
         # Update item status and optional reason
         previous_status = item.status
         item.status = new_status
         if reason:
             item.status_reason = reason  # If you have a field like this
-        item.save()
-
-        # Recalculate overall order status
-        item.order.update_status_from_items()
+        item.save()  # Also moves the order's item counts and status
 
         messages.success(
             request, f"Item #{item.id} status updated to {new_status}")
@@ -711,9 +690,7 @@ def verify_return_request(request, return_id):
     )
 
     # Restock items
-    for item in returned_items:
-        item.product_variant.stock += item.quantity
-        item.product_variant.save()
+    stock.give_back(stock.quantities_for(returned_items))
 
     messages.success(
         request,
@@ -744,7 +721,6 @@ def admin_toggle_product_visibility(request, product_id):
 
 
 from django.db.models import Q, F
-from django.core.paginator import Paginator
 from django.shortcuts import render
 from orders.models import Coupon
 
@@ -765,10 +741,8 @@ def coupon_list(request):
         )
 
     # 📦 Pagination
-    coupons = coupons.order_by('-created_at')
-    paginator = Paginator(coupons, 10)
-    page = request.GET.get('page')
-    paginated_coupons = paginator.get_page(page)
+    paginator = CursorPaginator(coupons, ADMIN_PAGE_SIZE, ('-created_at', '-id'))
+    paginated_coupons = paginator.get_page(request.GET.get('cursor'))
 
     return render(request, 'admin_panel/coupon_list.html', {
         'coupons': paginated_coupons,
@@ -851,25 +825,22 @@ def update_category_offer(request, category_id):
 
 @admin_login_required
 def sales_report_view(request):
-    from_date = request.GET.get('from')
-    to_date = request.GET.get('to')
-    orders = Order.objects.filter(status='Delivered')
+    from_date = parse_date(request.GET.get('from') or '')
+    to_date = parse_date(request.GET.get('to') or '')
+    orders = reports.sales_orders(from_date, to_date)
+    if not (from_date and to_date):
+        from_date = to_date = None
 
-    if from_date and to_date:
-        from_date = parse_date(from_date)
-        to_date = parse_date(to_date)
-        orders = orders.filter(created_at__date__range=(from_date, to_date))
-
-    total_orders = Order.objects.filter(status='Delivered').count()
-    total_price = orders.aggregate(Sum('total_price'))['total_price__sum'] or 0
-    total_discount = orders.aggregate(Sum('discount_amount'))[
-        'discount_amount__sum'] or 0
+    totals = rollups.totals(from_date, to_date)
+    paginator = CursorPaginator(orders.select_related('user').order_by('-created_at'),
+                                ADMIN_PAGE_SIZE, ('-created_at', '-id'))
 
     context = {
-        'orders': orders,
-        'total_orders': total_orders,
-        'total_price': total_price,
-        'total_discount': total_discount,
+        'page_obj': paginator.get_page(request.GET.get('cursor')),
+        'total_orders': totals['orders'],
+        'total_price': totals['revenue'],
+        'total_discount': totals['discount'],
+        'payment_methods': rollups.by_payment_method(from_date, to_date),
         'from': request.GET.get('from', ''),
         'to': request.GET.get('to', ''),
     }
@@ -878,120 +849,48 @@ def sales_report_view(request):
 
 
 @admin_login_required
-def download_sales_report_pdf(request):
-    from_date = request.GET.get('from')
-    to_date = request.GET.get('to')
-
-    orders = Order.objects.filter(status='Delivered')
-    if from_date and to_date:
-        from_date = parse_date(from_date)
-        to_date = parse_date(to_date)
-        orders = orders.filter(created_at__date__range=(from_date, to_date))
-
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    y = height - 40
-
-    # 🧾 Header
-    p.setFont("Helvetica-Bold", 16)
-    p.drawString(50, y, "📄 BabyMuse Sales Report")
-    y -= 25
-
-    p.setFont("Helvetica", 11)
-    date_range = f"From: {from_date}   To: {to_date}" if from_date and to_date else "All Delivered Orders"
-    p.drawString(50, y, date_range)
-    y -= 30
-
-    # 📊 Table Headers
-    headers = ["Order ID", "Customer", "Date", "Total ₹", "Discount ₹", "Payment"]
-    x_positions = [50, 110, 200, 290, 380, 470]
-    p.setFont("Helvetica-Bold", 10)
-    for i, header in enumerate(headers):
-        p.drawString(x_positions[i], y, header)
-    y -= 15
-    p.line(50, y, width - 50, y)
-    y -= 20
-
-    # 🧾 Table Rows
-    p.setFont("Helvetica", 10)
-    total_amount = 0
-    total_discount = 0
-
-    for order in orders:
-        if y < 80:
-            p.showPage()
-            y = height - 50
-            p.setFont("Helvetica-Bold", 10)
-            for i, header in enumerate(headers):
-                p.drawString(x_positions[i], y, header)
-            y -= 15
-            p.line(50, y, width - 50, y)
-            y -= 20
-            p.setFont("Helvetica", 10)
-
-        values = [
-            str(order.id),
-            order.user.username,
-            str(order.created_at.date()),
-            f"₹{order.total_price:.2f}",
-            f"₹{order.discount_amount:.2f}",
-            order.payment_method
-        ]
-        for i, value in enumerate(values):
-            p.drawString(x_positions[i], y, value)
-        y -= 20
-
-        total_amount += order.total_price
-        total_discount += order.discount_amount
-
-    # 📈 Summary
-    y -= 30
-    p.setFont("Helvetica-Bold", 11)
-    p.drawString(50, y, f"Total Sales: ₹{total_amount:.2f}")
-    p.drawString(250, y, f"Total Discounts: ₹{total_discount:.2f}")
-
-    # 🖋️ Footer
-    p.setFont("Helvetica-Oblique", 9)
-    p.drawString(50, 30, f"Generated by BabyMuse Admin • {now().strftime('%Y-%m-%d %H:%M')}")
-
-    p.save()
-    buffer.seek(0)
-
-    return FileResponse(buffer, as_attachment=True, filename="sales_report.pdf")
+def download_sales_report_excel(request):
+    from_date = parse_date(request.GET.get('from') or '')
+    to_date = parse_date(request.GET.get('to') or '')
+    orders = reports.sales_orders(from_date, to_date)
+
+    return exports.xlsx_response(exports.SALES_HEADERS, exports.sales_rows(orders),
+                                 'sales_report.xlsx', sheet_name='Sales Report')
+
+
+def report_job_payload(job):
+    return {
+        'id': job.id,
+        'status': job.status,
+        'progress': job.progress,
+        'error': job.error,
+        'download_url': reverse('admin_panel:report_job_download', args=[job.id])
+        if job.status == ReportJob.DONE else None,
+    }
 
 
 @admin_login_required
-def download_sales_report_excel(request):
-    from_date = request.GET.get('from')
-    to_date = request.GET.get('to')
-    orders = Order.objects.filter(status='Delivered')
-
-    if from_date and to_date:
-        from_date = parse_date(from_date)
-        to_date = parse_date(to_date)
-        orders = orders.filter(created_at__date__range=(from_date, to_date))
-
-    output = BytesIO()
-    workbook = xlsxwriter.Workbook(output)
-    worksheet = workbook.add_worksheet("Sales Report")
-
-    headers = ['Order ID', 'Customer', 'Date',
-               'Total Amount', 'Discount', 'Payment Method']
-    for col, header in enumerate(headers):
-        worksheet.write(0, col, header)
-
-    for row, order in enumerate(orders, start=1):
-        worksheet.write(row, 0, order.id)
-        worksheet.write(row, 1, order.user.username)
-        worksheet.write(row, 2, order.created_at.strftime('%Y-%m-%d'))
-        worksheet.write(row, 3, float(order.total_price))
-        worksheet.write(row, 4, float(order.discount_amount))
-        worksheet.write(row, 5, order.payment_method)
-
-    workbook.close()
-    output.seek(0)
-    return FileResponse(output, as_attachment=True, filename='sales_report.xlsx')
+@require_POST
+def report_job_create(request):
+    kind = request.POST.get('kind')
+    if kind not in dict(ReportJob.KIND_CHOICES):
+        return JsonResponse({'error': 'Unknown report type.'}, status=400)
+    job = reports.enqueue(kind,
+                          parse_date(request.POST.get('from') or ''),
+                          parse_date(request.POST.get('to') or ''))
+    return JsonResponse(report_job_payload(job), status=202)
+
+
+@admin_login_required
+def report_job_status(request, job_id):
+    job = get_object_or_404(ReportJob, id=job_id)
+    return JsonResponse(report_job_payload(job))
+
+
+@admin_login_required
+def report_job_download(request, job_id):
+    job = get_object_or_404(ReportJob, id=job_id, status=ReportJob.DONE)
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.filename)
 
 # Banners
 
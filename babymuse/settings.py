@@ -57,6 +57,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -108,6 +109,38 @@ DATABASES = {
 }
 
 
+# Cache
+# CACHE_BACKEND is one of locmem (per process), file, db (run
+# `manage.py createcachetable` first) or redis; see utils/cache.py
+
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'babymuse',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / '.cache')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'babymuse_cache',
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_LOCATION', default='redis://127.0.0.1:6379'),
+    },
+}
+CACHES = {
+    'default': {
+        **CACHE_BACKENDS[CACHE_BACKEND],
+        'TIMEOUT': config('CACHE_TIMEOUT', default=900, cast=int),
+        'KEY_PREFIX': 'babymuse',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -184,6 +217,19 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = config("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
+# Queued mail (core/mail.py) is sent on a background thread after each
+# request; turn off when `manage.py send_queued_mail --loop` runs instead
+EMAIL_SEND_ON_COMMIT = config("EMAIL_SEND_ON_COMMIT", default=True, cast=bool)
+# Resized copies of uploaded images (utils/images.py) are generated on
+# background threads after each upload; turn off when
+# `manage.py generate_image_derivatives --loop` runs instead
+IMAGE_DERIVATIVES_ON_COMMIT = config("IMAGE_DERIVATIVES_ON_COMMIT", default=True, cast=bool)
+# Requests running more queries than QUERY_BUDGET, or one query shape more
+# than QUERY_REPEAT_LIMIT times, are logged (core/middleware.py); 0 turns
+# the check off. The headers report the counts on every response.
+QUERY_BUDGET = config("QUERY_BUDGET", default=50, cast=int)
+QUERY_REPEAT_LIMIT = config("QUERY_REPEAT_LIMIT", default=5, cast=int)
+QUERY_BUDGET_HEADERS = config("QUERY_BUDGET_HEADERS", default=DEBUG, cast=bool)
 RAZORPAY_KEY_SECRET = config("RAZORPAY_KEY_SECRET")
 RAZORPAY_KEY_ID = config("RAZORPAY_KEY_ID")
 
@@ -19,6 +19,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.views import media_blob
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -28,6 +30,7 @@ urlpatterns = [
     path('adminpanel/', include('admin_panel.urls')),
     path('auth/', include('social_django.urls', namespace='social')),
     path('orders/', include('orders.urls')),
+    path(f"{settings.MEDIA_URL.lstrip('/')}blobs/<path:path>", media_blob, name='media_blob'),
 
 
 
@@ -1,8 +1,14 @@
 from django.contrib import admin
-from .models import Banner
+from .models import Banner, OutboundEmail
 
 
 
 
 # Register your models here.
 admin.site.register(Banner)
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status',)
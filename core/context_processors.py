@@ -1,11 +1,12 @@
-from shop.models import CartItem, Wishlist
+from shop import counters
 
 
 def shared_counts(request):
     cart_count = wishlist_count = 0
     if request.user.is_authenticated:
-        cart_count = CartItem.objects.filter(user=request.user).count()
-        wishlist_count = Wishlist.objects.filter(user=request.user).count()
+        counts = counters.get_counts(request.user.id)
+        cart_count = counts[counters.CART]
+        wishlist_count = counts[counters.WISHLIST]
     return {
         'cart_count': cart_count,
         'wishlist_count': wishlist_count
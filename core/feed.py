@@ -0,0 +1,140 @@
+"""
+Home page feed.
+
+Babies are grouped into segments by (age in months, gender). Each segment's
+product ids are computed once with a bounded query and cached, and the
+banners for all of a user's segments are matched in one query and cached;
+a home render then only loads the listing rows for those ids. Product lists
+are dropped whenever a product's visibility, age range, gender, category or
+creation time changes (see core/signals.py) and banner lists whenever a
+banner changes.
+
+Cached banners are checked against their schedule on every render, so a
+campaign goes live on time without waiting for the cache to expire.
+"""
+from collections import namedtuple
+
+from django.db.models import Q
+from django.utils import timezone
+
+from shop import popularity
+from shop.models import ProductListing
+from utils.cache import get_or_set
+
+from .models import Banner
+
+
+FEED_SIZE = 12
+GENERIC_FEED_SIZE = 6
+TRENDING_FEED_SIZE = 4
+
+PRODUCTS_NAMESPACE = 'home_feed'
+BANNERS_NAMESPACE = 'banners'
+
+Segment = namedtuple('Segment', ['age', 'gender'])
+
+
+def segment_for(baby):
+    return Segment(baby.age_in_months(), baby.baby_gender or '')
+
+
+def _visible_listings():
+    return ProductListing.objects.filter(is_visible=True).order_by('-created_at', '-product_id')
+
+
+def segment_product_ids(segment):
+    def build():
+        # Products without an age range are for everyone, others must
+        # cover the baby's age and suit their gender
+        condition = Q(min_age__isnull=True, max_age__isnull=True, gender='Unisex')
+        if segment.age is not None:
+            condition |= Q(min_age__lte=segment.age, max_age__gte=segment.age,
+                           gender__in=[segment.gender, 'Unisex'])
+        return list(_visible_listings().filter(condition)
+                    .values_list('product_id', flat=True)[:FEED_SIZE])
+    return get_or_set(PRODUCTS_NAMESPACE, ['segment', *segment], build)
+
+
+def _scheduled_banners():
+    # Active banners that have not ended yet, including future ones
+    return Banner.objects.filter(
+        Q(ends_at__isnull=True) | Q(ends_at__gt=timezone.now()),
+        is_active=True,
+    ).order_by('-created_at', '-id')
+
+
+def _live(banners):
+    now = timezone.now()
+    return [banner for banner in banners if banner.is_live(now)]
+
+
+def targeted_banners(segments):
+    """Live banners suiting any of `segments`, newest first, matched with
+    one query per distinct set of segments."""
+    segments = sorted({segment for segment in segments if segment.age is not None})
+    if not segments:
+        return []
+
+    def build():
+        # Same rules as Banner.is_suitable_for
+        targeting = Q()
+        for age, gender in segments:
+            targeting |= (
+                (Q(age_min__isnull=True) | Q(age_min__lte=age)) &
+                (Q(age_max__isnull=True) | Q(age_max__gte=age)) &
+                Q(gender__in=['Unisex', gender])
+            )
+        return list(_scheduled_banners().filter(targeting))
+
+    parts = [f'{age}-{gender}' for age, gender in segments]
+    return _live(get_or_set(BANNERS_NAMESPACE, ['targeted', *parts], build))
+
+
+def live_banners():
+    """Every live banner, for visitors without a baby profile."""
+    return _live(get_or_set(BANNERS_NAMESPACE, ['all'],
+                            lambda: list(_scheduled_banners())))
+
+
+def generic_product_ids():
+    return get_or_set(PRODUCTS_NAMESPACE, ['generic'], lambda: list(
+        _visible_listings().values_list('product_id', flat=True)[:GENERIC_FEED_SIZE]))
+
+
+def _merge(id_lists, limit=None):
+    merged = list(dict.fromkeys(pk for ids in id_lists for pk in ids))
+    return merged[:limit] if limit else merged
+
+
+def load_cards(product_ids):
+    """Listing rows for `product_ids`, in that order, each with `price` set
+    to the offer price of its default variant."""
+    listings = ProductListing.objects.filter(
+        product_id__in=product_ids, is_visible=True,
+    ).select_related('category', 'default_variant').in_bulk()
+    cards = []
+    for product_id in product_ids:
+        listing = listings.get(product_id)
+        if listing is None:
+            continue
+        variant = listing.default_variant
+        listing.price = variant.offer_price if variant else listing.min_offer_price
+        cards.append(listing)
+    return cards
+
+
+def personalized_feed(babies):
+    """Return (cards, banners) for a user's baby profiles."""
+    segments = list(dict.fromkeys(segment_for(baby) for baby in babies))
+    product_ids = _merge([segment_product_ids(segment) for segment in segments], FEED_SIZE)
+    return load_cards(product_ids), targeted_banners(segments)
+
+
+def generic_feed():
+    """Return (cards, banners) for visitors without a baby profile."""
+    return load_cards(generic_product_ids()), live_banners()
+
+
+def trending_feed():
+    """Cards of the most viewed products of the last day."""
+    return load_cards(popularity.trending_ids()[:TRENDING_FEED_SIZE])
@@ -0,0 +1,117 @@
+"""
+Outbound email queue.
+
+`queue_mail` stores a message in the OutboundEmail table and returns
+straight away. Delivery happens off the request path: on a background
+thread started once the request's transaction commits, and from
+`manage.py send_queued_mail`, which can also run as a standalone worker.
+
+A sender claims a batch of due messages, sends them all over one SMTP
+connection and records the outcome of each. Failed sends are retried with
+exponential backoff until MAX_ATTEMPTS, after which they are marked Failed.
+A claimed message is leased for a few minutes, so one left behind by a
+crashed sender is picked up again later.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 30  # doubled after every failed attempt
+LEASE = timedelta(minutes=5)
+
+EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mail')
+
+
+def queue_mail(subject, message, recipient_list, from_email=None):
+    """Queue a plain text email; it is sent after the current transaction
+    commits unless EMAIL_SEND_ON_COMMIT is off."""
+    email = OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(recipient_list),
+    )
+    if getattr(settings, 'EMAIL_SEND_ON_COMMIT', True):
+        transaction.on_commit(lambda: EXECUTOR.submit(_work))
+    return email
+
+
+def _work():
+    try:
+        send_pending()
+    except Exception:
+        logger.exception('Sending queued mail failed')
+    finally:
+        # Worker threads open their own connections
+        connections.close_all()
+
+
+def backoff(attempts):
+    return timedelta(seconds=BACKOFF_SECONDS * 2 ** (attempts - 1))
+
+
+def _claim(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(OutboundEmail.objects.select_for_update(skip_locked=True).filter(
+            status=OutboundEmail.QUEUED, next_attempt_at__lte=now,
+        ).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+        OutboundEmail.objects.filter(id__in=ids).update(next_attempt_at=now + LEASE)
+    return list(OutboundEmail.objects.filter(id__in=ids).order_by('id'))
+
+
+def _deliver(email, connection):
+    attempts = email.attempts + 1
+    message = EmailMessage(email.subject, email.body, email.from_email, email.to,
+                           connection=connection)
+    try:
+        message.send()
+    except Exception as exc:
+        logger.warning('Email %s failed (attempt %s): %s', email.id, attempts, exc)
+        if attempts >= MAX_ATTEMPTS:
+            changes = {'status': OutboundEmail.FAILED}
+        else:
+            changes = {'next_attempt_at': timezone.now() + backoff(attempts)}
+        OutboundEmail.objects.filter(id=email.id).update(
+            attempts=attempts, last_error=str(exc), **changes)
+        # The connection may be broken; start the rest of the batch on a new one
+        connection.close()
+        try:
+            connection.open()
+        except Exception:
+            pass
+        return False
+
+    OutboundEmail.objects.filter(id=email.id).update(
+        status=OutboundEmail.SENT, attempts=attempts, last_error='', sent_at=timezone.now())
+    return True
+
+
+def send_pending(batch_size=BATCH_SIZE, connection=None):
+    """Send every due message, `batch_size` at a time, over one connection.
+    Returns (sent, failed)."""
+    sent = failed = 0
+    connection = connection or get_connection()
+    with connection:
+        while True:
+            batch = _claim(batch_size)
+            if not batch:
+                break
+            for email in batch:
+                if _deliver(email, connection):
+                    sent += 1
+                else:
+                    failed += 1
+    return sent, failed
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from utils.images import process_pending
+
+
+class Command(BaseCommand):
+    help = ("Generate resized WebP/JPEG copies of uploaded images that don't have them; "
+            "with --loop, keep polling for new uploads.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Regenerate the copies of every image.")
+        parser.add_argument('--loop', action='store_true')
+        parser.add_argument('--interval', type=float, default=10,
+                            help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        force = options['force']
+        while True:
+            done = process_pending(force=force)
+            if done or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Generated derivatives of {done} images."))
+            if not options['loop']:
+                break
+            force = False
+            time.sleep(options['interval'])
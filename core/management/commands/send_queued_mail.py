@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.mail import BATCH_SIZE, send_pending
+
+
+class Command(BaseCommand):
+    help = "Send queued outbound emails; with --loop, keep polling for new ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true')
+        parser.add_argument('--interval', type=float, default=5,
+                            help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_pending(batch_size=options['batch_size'])
+            if sent or failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Sent {sent} emails, {failed} failed."))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
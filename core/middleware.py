@@ -0,0 +1,43 @@
+import logging
+
+from django.conf import settings
+
+from utils.queries import QueryLog
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """
+    Log requests that run more than QUERY_BUDGET queries or repeat a query
+    shape more than QUERY_REPEAT_LIMIT times (an N+1), and with
+    QUERY_BUDGET_HEADERS add X-Query-Count, X-Query-Time (ms) and
+    X-Query-Repeats to every response. Queries run while a streaming
+    response is consumed are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        budget = getattr(settings, 'QUERY_BUDGET', 0)
+        if not budget:
+            return self.get_response(request)
+
+        with QueryLog() as log:
+            response = self.get_response(request)
+
+        limit = getattr(settings, 'QUERY_REPEAT_LIMIT', 5)
+        repeated = log.repeated(limit)
+        if getattr(settings, 'QUERY_BUDGET_HEADERS', False):
+            response['X-Query-Count'] = str(log.count)
+            response['X-Query-Time'] = f'{log.duration * 1000:.1f}'
+            response['X-Query-Repeats'] = str(max(repeated.values(), default=0))
+        if log.count > budget or repeated:
+            worst = next(iter(repeated.items()), None)
+            logger.warning(
+                "%s %s ran %d queries in %.1f ms (budget %d)%s",
+                request.method, request.path, log.count, log.duration * 1000, budget,
+                f"; repeated {worst[1]}x: {worst[0][:300]}" if worst else "")
+        return response
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_banner_age_max_banner_age_min_banner_gender'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='banner',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='banner',
+            name='starts_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='banner',
+            index=models.Index(fields=['is_active', 'gender', 'age_min', 'age_max'], name='banner_target_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='banner',
+            index=models.Index(fields=['is_active', 'ends_at'], name='banner_schedule_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:40
+
+import utils.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_mediablob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='banner',
+            name='image',
+            field=models.ImageField(storage=utils.storage.ContentAddressedStorage(), upload_to='banners/'),
+        ),
+    ]
@@ -1,9 +1,13 @@
 from django.db import models
+from django.utils import timezone
+
+from utils.storage import blob_storage
 
 
 class Banner(models.Model):
     title = models.CharField(max_length=200)
-    image = models.ImageField(upload_to='banners/')
+    image = models.ImageField(upload_to='banners/', storage=blob_storage)
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     link = models.URLField(blank=True, null=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -14,10 +18,24 @@ class Banner(models.Model):
                                        ('Female', 'Female'),
                                        ('Unisex', 'Unisex')],
                               default='Unisex')
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'gender', 'age_min', 'age_max'],
+                         name='banner_target_idx'),
+            models.Index(fields=['is_active', 'ends_at'], name='banner_schedule_idx'),
+        ]
+
+    def is_live(self, now=None):
+        now = now or timezone.now()
+        return ((self.starts_at is None or self.starts_at <= now) and
+                (self.ends_at is None or self.ends_at > now))
 
     def is_suitable_for(self, baby):
         age = baby.age_in_months()
-        if age is None:
+        if age is None or not self.is_live():
             return False
         return (
             (self.age_min is None or age >= self.age_min) and
@@ -46,3 +64,41 @@ class ContactMessage(models.Model):
 
     def __str__(self):
         return f"{self.name} - {self.email}"
+
+
+class OutboundEmail(models.Model):
+    QUEUED = 'Queued'
+    SENT = 'Sent'
+    FAILED = 'Failed'
+    STATUS_CHOICES = [(QUEUED, QUEUED), (SENT, SENT), (FAILED, FAILED)]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+
+
+class MediaBlob(models.Model):
+    """A stored file of utils.storage.ContentAddressedStorage and the number
+    of file fields referring to it; the file goes when the last one does."""
+    name = models.CharField(max_length=255, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    refs = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refs} refs)"
@@ -0,0 +1,30 @@
+from django.dispatch import receiver
+
+from shop.signals import catalog_changed
+from utils.cache import bump, invalidate_on
+from utils.images import derivatives_ready, derive
+from utils.storage import track_references
+
+from . import feed
+from .models import FAQ, Banner
+
+
+invalidate_on('banners', Banner)
+invalidate_on('faq', FAQ)
+
+derive(Banner, 'image', 'image_derivatives', (640, 1280, 1920))
+track_references(Banner, 'image')
+
+
+@receiver(derivatives_ready, sender=Banner)
+def banner_derived(sender, **kwargs):
+    # Cached banner lists hold the instances, derivatives included
+    bump(feed.BANNERS_NAMESPACE)
+
+
+@receiver(catalog_changed)
+def catalog_updated(sender, feed_changed=True, **kwargs):
+    # Runs after the listing rows are refreshed, so rebuilt feeds see them.
+    # Feeds cache product ids only; price, stock or review changes keep them
+    if feed_changed:
+        bump(feed.PRODUCTS_NAMESPACE)
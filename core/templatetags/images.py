@@ -0,0 +1,18 @@
+from django import template
+
+from utils import images
+
+
+register = template.Library()
+
+
+@register.filter
+def srcset(derivatives, fmt=None):
+    """srcset of a derivatives field, e.g. {{ image.derivatives|srcset:"webp" }}."""
+    return images.srcset(derivatives, fmt)
+
+
+@register.inclusion_tag('core/picture.html')
+def picture(src, derivatives, alt='', css='', sizes='100vw'):
+    """<picture> with WebP and fallback srcsets, the original as last resort."""
+    return {'src': src, 'derivatives': derivatives or {}, 'alt': alt, 'css': css, 'sizes': sizes}
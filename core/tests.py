@@ -1,3 +1,394 @@
-from django.test import TestCase
+import tempfile
+from io import BytesIO
+from unittest import mock
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import feed, mail
+from core.models import FAQ, Banner, MediaBlob, OutboundEmail
+from PIL import Image
+
+from shop.models import Category, Product, ProductImage, ProductListing, ProductVariant
+from user.models import BabyProfile, CustomUser
+from utils import images
+from utils.cache import bump, cached, get_or_set, get_version, versioned_key
+from utils.queries import QueryLog, shape
+from utils.storage import blob_storage
+from utils.testing import LocalSMTPServer
+
+
+class CacheHelperTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_orphans_versioned_keys(self):
+        key = versioned_key('widgets', 'list')
+        self.assertEqual(get_or_set('widgets', ['list'], lambda: [1, 2]), [1, 2])
+        self.assertEqual(get_or_set('widgets', ['list'], lambda: [3]), [1, 2])
+        bump('widgets')
+        self.assertNotEqual(versioned_key('widgets', 'list'), key)
+        self.assertEqual(get_or_set('widgets', ['list'], lambda: [3]), [3])
+
+    def test_culled_version_never_restarts_at_an_old_value(self):
+        bump('widgets')
+        seen = {get_version('widgets')}
+        for _ in range(3):
+            cache.delete('ns:widgets:version')  # culled by the backend
+            seen.add(get_version('widgets'))
+            bump('widgets')
+            seen.add(get_version('widgets'))
+        self.assertEqual(len(seen), 7)
+
+    def test_cached_decorator_keys_on_arguments(self):
+        calls = []
+
+        @cached('squares')
+        def square(n):
+            calls.append(n)
+            return n * n
+
+        self.assertEqual(square(3), 9)
+        self.assertEqual(square(3), 9)
+        self.assertEqual(square(4), 16)
+        self.assertEqual(calls, [3, 4])
+        square.invalidate()
+        square(3)
+        self.assertEqual(calls, [3, 4, 3])
+
+
+class FileCacheBackendTests(CacheHelperTests):
+    """The same helpers against the file-based backend."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory.name,
+        }})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        super().setUp()
+
+
+class CachedContentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        FAQ.objects.create(question='How long does delivery take?', answer='3-5 days')
+
+    def test_faq_answers_cached_until_faq_changes(self):
+        url = reverse('faq_bot_response')
+        self.client.get(url, {'q': 'How long does delivery take?'})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'q': 'How long does delivery take'})
+        self.assertEqual(response.json()['answer'], '3-5 days')
+
+        FAQ.objects.create(question='Do you ship abroad?', answer='Not yet')
+        response = self.client.get(url, {'q': 'Do you ship abroad?'})
+        self.assertEqual(response.json()['answer'], 'Not yet')
+
+    def test_home_banners_invalidated_on_save(self):
+        self.client.get(reverse('home'))
+        banner = Banner.objects.create(title='Summer sale', image='banners/summer.jpg')
+        response = self.client.get(reverse('home'))
+        self.assertIn(banner, list(response.context['banners']))
+
+        banner.is_active = False
+        banner.save()
+        response = self.client.get(reverse('home'))
+        self.assertNotIn(banner, list(response.context['banners']))
+
+
+class HomeFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username='parent', email='parent@example.com', password='pass12345')
+        self.client.force_login(self.user)
+        BabyProfile.objects.create(
+            user=self.user, baby_name='Mia', baby_gender='Female',
+            baby_dob=date.today() - timedelta(days=30 * 6))
+
+        category = Category.objects.create(name='Toys')
+        self.everyone = self.product('Blocks', category)
+        self.girls = self.product('Doll', category, min_age=3, max_age=12, gender='Female')
+        self.boys = self.product('Truck', category, min_age=3, max_age=12, gender='Male')
+        self.older = self.product('Bike', category, min_age=24, max_age=48, gender='Unisex')
+
+    def product(self, name, category, **kwargs):
+        product = Product.objects.create(name=name, category=category, **kwargs)
+        ProductVariant.objects.create(
+            product=product, sku=f'{name}-1', price=Decimal('100.00'), stock=5)
+        return product
+
+    def feed_ids(self):
+        response = self.client.get(reverse('home'))
+        return {listing.product_id for listing in response.context['products']}
+
+    def test_feed_matches_baby_segment(self):
+        self.assertEqual(self.feed_ids(), {self.everyone.id, self.girls.id})
+
+    def test_warm_feed_queries_are_bounded(self):
+        BabyProfile.objects.create(
+            user=self.user, baby_name='Leo', baby_gender='Male',
+            baby_dob=date.today() - timedelta(days=30 * 30))
+        self.assertEqual(self.feed_ids(), {self.everyone.id, self.girls.id, self.older.id})
+        # session, user, babies and listing rows; no banners target them
+        with self.assertNumQueries(4):
+            self.client.get(reverse('home'))
+
+    def test_feed_refreshed_when_catalog_changes(self):
+        self.feed_ids()
+        self.girls.status = 'Inactive'
+        self.girls.save()
+        self.assertEqual(self.feed_ids(), {self.everyone.id})
+
+        self.boys.gender = 'Unisex'
+        self.boys.save()
+        self.assertEqual(self.feed_ids(), {self.everyone.id, self.boys.id})
+
+    def test_feed_kept_when_only_prices_or_names_change(self):
+        self.feed_ids()
+        version = get_version(feed.PRODUCTS_NAMESPACE)
+        variant = self.girls.variants.get()
+        variant.price = Decimal('80.00')
+        variant.save()
+        self.girls.name = 'Rag doll'
+        self.girls.save()
+        self.assertEqual(get_version(feed.PRODUCTS_NAMESPACE), version)
+
+    def test_banners_targeted_by_segment(self):
+        Banner.objects.create(title='Toddler', image='b.jpg', age_min=12)
+        girls = Banner.objects.create(title='Girls', image='b.jpg', gender='Female', age_max=12)
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['banners'], [girls])
+        self.assertTrue(response.context['customized'])
+
+    def test_baby_without_birth_date(self):
+        BabyProfile.objects.all().update(baby_dob=None)
+        Banner.objects.create(title='Any', image='b.jpg')
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['banners'], [])
+        self.assertEqual({listing.product_id for listing in response.context['products']},
+                         {self.everyone.id})
+
+    def test_banners_for_many_segments_in_one_query(self):
+        infants = Banner.objects.create(title='Infants', image='b.jpg', age_max=12)
+        boys = Banner.objects.create(title='Boys', image='b.jpg', gender='Male', age_min=24)
+        Banner.objects.create(title='Girls', image='b.jpg', gender='Female', age_min=24)
+        segments = [feed.Segment(6, 'Female'), feed.Segment(30, 'Male'), feed.Segment(None, '')]
+        with self.assertNumQueries(1):
+            banners = feed.targeted_banners(segments)
+        self.assertEqual(banners, [boys, infants])
+        with self.assertNumQueries(0):
+            feed.targeted_banners(reversed(segments))
+
+    def test_scheduled_banners_go_live_on_time(self):
+        now = timezone.now()
+        upcoming = Banner.objects.create(
+            title='Upcoming', image='b.jpg', starts_at=now + timedelta(hours=1))
+        ended = Banner.objects.create(
+            title='Ended', image='b.jpg', ends_at=now - timedelta(hours=1))
+        running = Banner.objects.create(
+            title='Running', image='b.jpg', starts_at=now - timedelta(hours=1),
+            ends_at=now + timedelta(hours=1))
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('home')).context['banners'], [running])
+
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(hours=2)):
+            with self.assertNumQueries(1):  # listing rows only
+                response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['banners'], [upcoming])
+        self.assertFalse(ended.is_live())
+
+
+class OutboundEmailTests(TestCase):
+    def test_signup_otp_queued_not_sent_inline(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('user:signup_request'), {'email': 'new@example.com'})
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.to, email.status), (['new@example.com'], OutboundEmail.QUEUED))
+        self.assertEqual(len(callbacks), 1)
+
+    def test_batch_sent_over_one_connection(self):
+        for i in range(3):
+            mail.queue_mail('Hello', 'Body', [f'user{i}@example.com'])
+        with LocalSMTPServer() as server, server.settings():
+            self.assertEqual(mail.send_pending(batch_size=2), (3, 0))
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(sorted(m['To'] for m in server.messages),
+                         ['user0@example.com', 'user1@example.com', 'user2@example.com'])
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.SENT).count(), 3)
+
+    def test_failures_retried_with_backoff(self):
+        bad = mail.queue_mail('Hello', 'Body', ['bounce@example.com'])
+        good = mail.queue_mail('Hello', 'Body', ['ok@example.com'])
+        with LocalSMTPServer(rejected={'bounce@example.com'}) as server, server.settings():
+            self.assertEqual(mail.send_pending(), (1, 1))
+            # Not due yet
+            self.assertEqual(mail.send_pending(), (0, 0))
+        bad.refresh_from_db()
+        good.refresh_from_db()
+        self.assertEqual(good.status, OutboundEmail.SENT)
+        self.assertEqual((bad.status, bad.attempts), (OutboundEmail.QUEUED, 1))
+        self.assertGreater(bad.next_attempt_at, timezone.now() + mail.backoff(1) - timedelta(seconds=5))
+
+        OutboundEmail.objects.filter(pk=bad.pk).update(
+            attempts=mail.MAX_ATTEMPTS - 1, next_attempt_at=timezone.now())
+        with LocalSMTPServer(rejected={'bounce@example.com'}) as server, server.settings():
+            mail.send_pending()
+        bad.refresh_from_db()
+        self.assertEqual(bad.status, OutboundEmail.FAILED)
+        self.assertIn('bounce@example.com', bad.last_error)
+
+
+class QueryBudgetTests(TestCase):
+    def test_shape_collapses_literals_and_lists(self):
+        self.assertEqual(shape("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x'"),
+                         shape("SELECT * FROM t WHERE id IN (%s) AND name = 'yy'"))
+
+    def test_query_log_counts_repeats(self):
+        with QueryLog() as log:
+            for i in range(4):
+                list(Category.objects.filter(pk=i))
+            FAQ.objects.count()
+        self.assertEqual(log.count, 5)
+        self.assertEqual(list(log.repeated(3).values()), [4])
+        self.assertEqual(log.repeated(4), {})
+
+    @override_settings(QUERY_BUDGET=1, QUERY_REPEAT_LIMIT=5, QUERY_BUDGET_HEADERS=True)
+    def test_middleware_headers_and_log(self):
+        with mock.patch('core.middleware.logger') as logger:
+            response = self.client.get(reverse('home'))
+        self.assertGreater(int(response['X-Query-Count']), 1)
+        self.assertIn('X-Query-Time', response)
+        self.assertEqual(response['X-Query-Repeats'], '0')
+        logger.warning.assert_called_once()
+
+    @override_settings(QUERY_BUDGET=0)
+    def test_middleware_off(self):
+        response = self.client.get(reverse('home'))
+        self.assertNotIn('X-Query-Count', response)
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.product = Product.objects.create(name='Rattle')
+
+    def upload(self, size=(1200, 800), mode='RGB', fmt='JPEG', name='rattle.jpg'):
+        image = Image.new(mode, size, 'red')
+        exif = Image.Exif()
+        exif[0x010F] = 'CameraMaker'
+        buffer = BytesIO()
+        image.save(buffer, fmt, exif=exif)
+        with self.captureOnCommitCallbacks() as callbacks:
+            product_image = ProductImage.objects.create(
+                product=self.product, image=ContentFile(buffer.getvalue(), name=name))
+        self.assertEqual(len(callbacks), 1)  # handed to the worker pool
+        return product_image
+
+    def test_sizes_formats_and_metadata(self):
+        product_image = self.upload()
+        self.assertTrue(images.process('shop.ProductImage.image', product_image.pk))
+        product_image.refresh_from_db()
+        files = product_image.derivatives['files']
+        self.assertEqual([width for width, _ in files['webp']], [320, 640, 960])
+        self.assertEqual(sorted(files), ['jpeg', 'webp'])
+        with blob_storage.open(files['webp'][0][1]) as f:
+            derived = Image.open(f)
+            self.assertEqual((derived.format, derived.size), ('WEBP', (320, 213)))
+            self.assertEqual(dict(derived.getexif()), {})
+
+        listing = ProductListing.objects.get(product=self.product)
+        self.assertEqual(listing.primary_image_derivatives, product_image.derivatives)
+        html = Template('{% load images %}{{ d|srcset:"webp" }}|{% picture "x.jpg" d %}').render(
+            Context({'d': listing.primary_image_derivatives}))
+        self.assertRegex(html, r'\.webp 640w')
+        self.assertRegex(html, r'\.jpg 960w')
+        self.assertFalse(images.process('shop.ProductImage.image', product_image.pk))
+
+    def test_forced_run_keeps_one_reference_per_derivative(self):
+        product_image = self.upload()
+        images.process('shop.ProductImage.image', product_image.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(images.process('shop.ProductImage.image', product_image.pk, force=True))
+        product_image.refresh_from_db()
+        names = images.file_names(product_image.derivatives)
+        self.assertEqual(set(MediaBlob.objects.filter(name__in=names).values_list('refs', flat=True)), {1})
+        self.assertTrue(all(blob_storage.exists(name) for name in names))
+
+    def test_small_transparent_image_and_replacement(self):
+        product_image = self.upload((100, 50), 'RGBA', 'PNG', 'logo.png')
+        images.process('shop.ProductImage.image', product_image.pk)
+        product_image.refresh_from_db()
+        old = images.file_names(product_image.derivatives)
+        self.assertEqual(product_image.derivatives['files']['png'][0][0], 100)
+
+        product_image.image = ContentFile(b'not an image', name='broken.jpg')
+        product_image.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(images.process('shop.ProductImage.image', product_image.pk))
+        product_image.refresh_from_db()
+        self.assertIn('error', product_image.derivatives)
+        self.assertFalse(any(blob_storage.exists(name) for name in old))
+
+
+@override_settings(IMAGE_DERIVATIVES_ON_COMMIT=False)
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.products = [Product.objects.create(name=f'Rattle {i}') for i in range(2)]
+
+    def test_same_content_stored_once_and_released_with_last_reference(self):
+        first, second = [
+            ProductImage.objects.create(product=product, image=ContentFile(b'same photo', name=name))
+            for product, name in zip(self.products, ('cropped1.jpg', 'product_7_0.jpg'))]
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertRegex(name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 1)
+        self.assertTrue(blob_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+        self.assertFalse(blob_storage.exists(name))
+
+    def test_replacing_a_file_releases_the_old_one(self):
+        variant = ProductVariant.objects.create(
+            product=self.products[0], sku='R-1', price=10, image=ContentFile(b'old', name='a.png'))
+        old = variant.image.name
+        variant = ProductVariant.objects.get(pk=variant.pk)
+        variant.image = ContentFile(b'new', name='b.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            variant.save()
+        self.assertFalse(blob_storage.exists(old))
+        self.assertTrue(blob_storage.exists(variant.image.name))
+
+    def test_blobs_served_as_immutable(self):
+        name = blob_storage.save('products/x.txt', ContentFile(b'hello'))
+        response = self.client.get(blob_storage.url(name))
+        self.assertEqual(b''.join(response.streaming_content), b'hello')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get('/media/blobs/../settings.py').status_code, 404)
@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     path('', views.home_view, name='home'),
     path('search/', views.search, name='search'),
+    path('search/autocomplete/', views.search_autocomplete,
+         name='search_autocomplete'),
     path('about/', views.about, name='about'),
     path('contact/', views.contact, name='contact'),
     path('faq-bot/', views.faq_bot_response, name='faq_bot_response'),
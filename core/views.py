@@ -1,88 +1,68 @@
 from difflib import get_close_matches
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.shortcuts import render
-from shop.models import Product
-from .models import FAQ, Banner
-from user.models import BabyProfile
-from django.db.models import Q
+from django.views.static import serve
+from shop.models import ProductListing
+from shop.search import autocomplete, search as search_products
+from .models import FAQ
+from utils.cache import cached
+from utils.storage import PREFIX, blob_storage, is_blob
+from . import feed
 
+SEARCH_PAGE_SIZE = 48
+BLOB_MAX_AGE = 60 * 60 * 24 * 365
+
+
+@cached('faq')
+def active_faqs():
+    """Map question -> answer for the FAQ bot."""
+    return dict(FAQ.objects.filter(is_active=True).values_list('question', 'answer'))
 
-def home_view(request):
-    customized = False
-    product_data = []
-    has_baby_profile = False
-    babies = None
 
+def home_view(request):
+    babies = []
     if request.user.is_authenticated:
-        babies = request.user.babies.all()
-        has_baby_profile = babies.exists()
-
-        if has_baby_profile:
-            # Filter products based on baby profiles
-            age_gender_filters = []
-            for baby in babies:
-                age = baby.age_in_months()
-                gender = baby.baby_gender
-                age_gender_filters.append(
-                    Q(min_age__isnull=True, max_age__isnull=True, gender='Unisex') |
-                    Q(min_age__lte=age, max_age__gte=age, gender__in=[gender, 'Unisex'])
-                )
-
-            products_query = Q()
-            for f in age_gender_filters:
-                products_query |= f
-
-            products = Product.objects.filter(status='Active').filter(products_query).distinct()
-
-            # Filter banners based on baby profile
-            all_banners = Banner.objects.filter(is_active=True)
-            personalized_banners = set()
-
-            for baby in babies:
-                for banner in all_banners:
-                    if banner.is_suitable_for(baby):
-                        personalized_banners.add(banner)
-
-            banners = list(personalized_banners)
-            customized = True
-
-        else:
-            # No baby profile: show generic products and all banners
-            products = Product.objects.filter(status='Active')[:6]
-            banners = Banner.objects.filter(is_active=True)
+        babies = list(request.user.babies.all())
 
+    if babies:
+        # Cached (age, gender) segments of every baby profile
+        products, banners = feed.personalized_feed(babies)
     else:
-        # Anonymous user: show generic products and all banners
-        products = Product.objects.filter(status='Active')[:6]
-        banners = Banner.objects.filter(is_active=True)
-
-    # Enrich products with default variant and price
-    for product in products:
-        variant = product.get_default_variant()
-        price = variant.get_offer_price() if variant else product.min_offer_price
-        product_data.append({
-            'product': product,
-            'variant': variant,
-            'price': price,
-        })
+        # No baby profile or anonymous: show generic products and all banners
+        products, banners = feed.generic_feed()
 
     return render(request, 'core/home.html', {
-        'products': product_data,
+        'products': products,
+        'trending': feed.trending_feed(),
         'banners': banners,
-        'customized': customized,
-        'has_baby_profile': has_baby_profile,
-        'baby': babies.first() if has_baby_profile else None,
+        'customized': bool(babies),
+        'has_baby_profile': bool(babies),
+        'baby': babies[0] if babies else None,
     })
 
 def search(request):
-    query = request.GET.get('query', '')
+    query = request.GET.get('q', request.GET.get('query', '')).strip()
     results = []
+    if query:
+        hits = search_products(query, limit=SEARCH_PAGE_SIZE)
+        listings = ProductListing.objects.filter(
+            product_id__in=[hit.product_id for hit in hits], is_visible=True)
+        by_id = {listing.product_id: listing for listing in listings}
+        results = [by_id[hit.product_id] for hit in hits if hit.product_id in by_id]
     return render(request, 'core/search_results.html', {
         'query': query,
         'results': results
     })
 
 
+def search_autocomplete(request):
+    prefix = request.GET.get('q', '').strip()
+    suggestions = autocomplete(prefix) if len(prefix) >= 2 else []
+    return JsonResponse({
+        'suggestions': [{'id': pk, 'name': name} for pk, name in suggestions]
+    })
+
+
 def about(request):
     return render(request, 'core/about.html')
 
@@ -95,9 +75,20 @@ def contact(request):
 
 def faq_bot_response(request):
     query = request.GET.get('q', '').strip()
-    questions = FAQ.objects.filter(is_active=True).values_list('question', flat=True)
-    match = get_close_matches(query, questions, n=1, cutoff=0.6)
+    faqs = active_faqs()
+    match = get_close_matches(query, list(faqs), n=1, cutoff=0.6)
     if match:
-        answer = FAQ.objects.get(question=match[0]).answer
-        return JsonResponse({'answer': answer})
+        return JsonResponse({'answer': faqs[match[0]]})
     return JsonResponse({'answer': "Sorry, I couldn't find an answer. Would you like to talk to support?"})
+
+
+def media_blob(request, path):
+    """A content-addressed upload; its name changes with its content, so
+    clients may keep it for good."""
+    name = f'{PREFIX}/{path}'
+    if not is_blob(name):
+        raise Http404
+    response = serve(request, name, document_root=blob_storage.location)
+    response['Cache-Control'] = f'public, max-age={BLOB_MAX_AGE}, immutable'
+    response['ETag'] = '"%s"' % name.rsplit('/', 1)[1].split('.')[0]
+    return response
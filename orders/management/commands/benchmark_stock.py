@@ -0,0 +1,79 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from orders import stock
+from shop.models import Product, ProductVariant
+
+
+class Command(BaseCommand):
+    help = ("Hammer one variant with concurrent stock takes and report throughput "
+            "and overselling. Creates and removes its own product.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--stock', type=int, default=500)
+        parser.add_argument('--attempts', type=int, default=100,
+                            help="Takes per thread.")
+        parser.add_argument('--naive', action='store_true',
+                            help="Use the old read-modify-write save() for comparison.")
+
+    def handle(self, *args, **options):
+        initial = options['stock']
+        product = Product.objects.create(name=f'Stock benchmark {uuid.uuid4().hex[:8]}')
+        variant = ProductVariant.objects.create(
+            product=product, sku=f'BENCH-{uuid.uuid4().hex[:12]}', price=1, stock=initial)
+        counts = {'sold': 0, 'refused': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def naive_take():
+            current = ProductVariant.objects.get(pk=variant.pk)
+            if current.stock < 1:
+                raise stock.InsufficientStock([variant.pk])
+            current.stock -= 1
+            current.save(update_fields=['stock'])
+
+        take = naive_take if options['naive'] else lambda: stock.take({variant.pk: 1})
+
+        def worker():
+            try:
+                for _ in range(options['attempts']):
+                    try:
+                        take()
+                        outcome = 'sold'
+                    except stock.InsufficientStock:
+                        outcome = 'refused'
+                    except OperationalError:
+                        outcome = 'errors'
+                    with lock:
+                        counts[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            variant.refresh_from_db()
+        finally:
+            product.delete()
+
+        attempts = options['threads'] * options['attempts']
+        oversold = max(0, counts['sold'] - initial)
+        self.stdout.write(
+            f"{attempts} takes in {elapsed:.2f}s ({attempts / elapsed:.0f}/s): "
+            f"{counts['sold']} sold, {counts['refused']} refused, {counts['errors']} errors")
+        self.stdout.write(f"Stock {initial} -> {variant.stock}, units sold {counts['sold']}")
+        if oversold or variant.stock != initial - counts['sold']:
+            self.stdout.write(self.style.ERROR(
+                f"Oversold by {oversold}; stock drifted by "
+                f"{initial - counts['sold'] - variant.stock}."))
+        else:
+            self.stdout.write(self.style.SUCCESS("No overselling."))
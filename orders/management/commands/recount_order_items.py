@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from orders.status import recount
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-status item counts of every order from its items."
+
+    def handle(self, *args, **options):
+        count = recount()
+        self.stdout.write(self.style.SUCCESS(f"Recounted items of {count} orders."))
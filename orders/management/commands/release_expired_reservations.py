@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from orders.stock import release_expired
+
+
+class Command(BaseCommand):
+    help = "Give back stock reserved for online payments that never completed."
+
+    def handle(self, *args, **options):
+        count = release_expired()
+        self.stdout.write(self.style.SUCCESS(
+            f"Released reservations for {count} orders."))
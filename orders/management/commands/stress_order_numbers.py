@@ -0,0 +1,66 @@
+import threading
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, OperationalError, connection, transaction
+
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = ("Create orders from many threads at once and check that every order "
+            "number is unique. Creates and removes its own user and orders.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=50,
+                            help="Orders per thread.")
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        user = get_user_model().objects.create_user(
+            username=f'stress-{tag}', email=f'stress-{tag}@example.com')
+        counts = {'created': 0, 'duplicates': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                for _ in range(options['orders']):
+                    try:
+                        # Like checkout, number and insert in one transaction
+                        with transaction.atomic():
+                            Order.objects.create(user=user, total_price=0)
+                        outcome = 'created'
+                    except IntegrityError:
+                        outcome = 'duplicates'
+                    except OperationalError:
+                        outcome = 'errors'
+                    with lock:
+                        counts[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            numbers = list(Order.objects.filter(user=user).values_list('order_id', flat=True))
+        finally:
+            user.delete()
+
+        total = options['threads'] * options['orders']
+        self.stdout.write(
+            f"{total} orders in {elapsed:.2f}s ({total / elapsed:.0f}/s): "
+            f"{counts['created']} created, {counts['duplicates']} duplicate numbers, "
+            f"{counts['errors']} errors")
+        if counts['duplicates'] or len(set(numbers)) != len(numbers):
+            self.stdout.write(self.style.ERROR("Order numbers collided."))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"All {len(numbers)} order numbers unique ({min(numbers)}..{max(numbers)})."))
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:20
+
+import re
+
+from django.db import migrations, models
+
+
+# Must match orders.numbers.BLOCK_SIZE and SEQUENCE
+BLOCK_SIZE = 20
+SEQUENCE = 'orders_order_number_seq'
+
+
+def seed_order_numbers(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderNumberCounter = apps.get_model('orders', 'OrderNumberCounter')
+
+    last = Order.objects.count()
+    for order_id in Order.objects.exclude(order_id=None).values_list('order_id', flat=True).iterator():
+        match = re.fullmatch(r'BM(\d+)', order_id)
+        if match:
+            last = max(last, int(match.group(1)))
+
+    OrderNumberCounter.objects.create(pk=1, last_number=last)
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE} START WITH {last + 1} INCREMENT BY {BLOCK_SIZE}')
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_stockreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_number', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_order_numbers, drop_sequence),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+FIELDS = {
+    'Pending': 'pending_items',
+    'Processing': 'processing_items',
+    'Shipped': 'shipped_items',
+    'Delivered': 'delivered_items',
+    'Cancelled': 'cancelled_items',
+    'Returned': 'returned_items',
+    'Completed': 'completed_items',
+}
+
+
+def count_items(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    counts = {}
+    for order_id, status, count in (OrderItem.objects.values_list('order_id', 'status')
+                                    .annotate(count=Count('id')).order_by()):
+        if status in FIELDS:
+            counts.setdefault(order_id, {})[FIELDS[status]] = count
+    for order_id, fields in counts.items():
+        Order.objects.filter(id=order_id).update(**fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_order_number_counter'),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(
+                model_name='order',
+                name=field,
+                field=models.PositiveIntegerField(default=0),
+            )
+            for field in FIELDS.values()
+        ],
+        migrations.RunPython(count_items, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import F
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.conf import settings
@@ -18,6 +19,37 @@ ORDER_STATUS = [
     ('Completed', 'Completed')
 ]
 
+# Per-status item counts kept on each order, see orders.status
+ITEM_COUNT_FIELDS = {
+    'Pending': 'pending_items',
+    'Processing': 'processing_items',
+    'Shipped': 'shipped_items',
+    'Delivered': 'delivered_items',
+    'Cancelled': 'cancelled_items',
+    'Returned': 'returned_items',
+    'Completed': 'completed_items',
+}
+
+
+def status_from_counts(counts):
+    """Order status for {item status: count}."""
+    present = {status for status, count in counts.items() if count}
+    if not present:
+        return 'Pending'
+    if len(present) == 1:
+        status = present.pop()
+        return 'Processing' if status == 'Pending' else status
+    for status in ('Returned', 'Cancelled', 'Delivered'):
+        if status in present:
+            return f'Partially {status}'
+    return 'Processing'
+
+
+def item_count_deltas(moved):
+    """F() updates for {item status: delta}."""
+    return {ITEM_COUNT_FIELDS[status]: F(ITEM_COUNT_FIELDS[status]) + delta
+            for status, delta in moved.items() if status and delta}
+
 
 class Coupon(models.Model):
     code = models.CharField(max_length=20, unique=True)
@@ -78,6 +110,11 @@ class Coupon(models.Model):
         return min(discount, order_total)  # Prevent exceeding total
 
 
+class OrderNumberCounter(models.Model):
+    """Last order number handed out, on databases without sequences."""
+    last_number = models.BigIntegerField(default=0)
+
+
 class Order(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE)
@@ -99,50 +136,35 @@ class Order(models.Model):
     order_id = models.CharField(
         max_length=20, unique=True, blank=True, null=True)
 
+    pending_items = models.PositiveIntegerField(default=0)
+    processing_items = models.PositiveIntegerField(default=0)
+    shipped_items = models.PositiveIntegerField(default=0)
+    delivered_items = models.PositiveIntegerField(default=0)
+    cancelled_items = models.PositiveIntegerField(default=0)
+    returned_items = models.PositiveIntegerField(default=0)
+    completed_items = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the customer and admin order lists
+            models.Index(fields=['user', '-created_at', '-id'],
+                         name='order_user_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.order_id:
-            latest_id = Order.objects.count() + 1
-            self.order_id = f"BM{latest_id:06d}"  # BM000001 style
+            from .numbers import next_order_id
+            self.order_id = next_order_id()  # BM000001 style
         super().save(*args, **kwargs)
 
-    def update_status_from_items(self):
-        item_statuses = list(self.items.values_list('status', flat=True))
-        unique_statuses = set(item_statuses)
-
-        if not item_statuses:
-            self.status = 'Pending'
-
-        elif unique_statuses == {'Delivered'}:
-            self.status = 'Delivered'
-
-        elif unique_statuses == {'Completed'}:
-            self.status = 'Completed'
-
-        elif unique_statuses == {'Cancelled'}:
-            self.status = 'Cancelled'
-
-        elif unique_statuses == {'Returned'}:
-            self.status = 'Returned'
-
-        elif unique_statuses == {'Shipped'}:
-            self.status = 'Shipped'
-
-        elif unique_statuses == {'Processing'}:
-            self.status = 'Processing'
+    def item_counts(self):
+        return {status: getattr(self, field) for status, field in ITEM_COUNT_FIELDS.items()}
 
-        elif 'Returned' in unique_statuses and len(unique_statuses) > 1:
-            self.status = 'Partially Returned'
-
-        elif 'Cancelled' in unique_statuses and len(unique_statuses) > 1:
-            self.status = 'Partially Cancelled'
-
-        elif 'Delivered' in unique_statuses and len(unique_statuses) > 1:
-            self.status = 'Partially Delivered'
-
-        else:
-            self.status = 'Processing'
-
-        self.save(update_fields=['status'])
+    def update_status_from_items(self):
+        from .status import refresh
+        refresh([self.pk])
+        self.refresh_from_db(fields=['status', *ITEM_COUNT_FIELDS.values()])
 
     def __str__(self):
         return f"Order #{self.order_id or self.id} - {self.user.username}"
@@ -169,9 +191,40 @@ class OrderItem(models.Model):
     def subtotal(self):
         return self.quantity * self.price
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        item = super().from_db(db, field_names, values)
+        item._saved_status = item.__dict__.get('status')
+        return item
+
     def save(self, *args, **kwargs):
+        if self._state.adding:
+            previous = None
+        else:
+            previous = getattr(self, '_saved_status', None) or OrderItem.objects.filter(
+                pk=self.pk).values_list('status', flat=True).first()
         super().save(*args, **kwargs)
-        self.order.update_status_from_items()
+        self._saved_status = self.status
+        if previous != self.status:
+            Order.objects.filter(pk=self.order_id).update(
+                **item_count_deltas({previous: -1, self.status: 1}))
+            from .status import refresh
+            refresh([self.order_id])
+            if OrderItem.order.is_cached(self):
+                self.order.refresh_from_db(fields=['status', *ITEM_COUNT_FIELDS.values()])
+
+
+class StockReservation(models.Model):
+    """Stock taken for an order whose online payment hasn't completed yet;
+    given back if the payment fails or the reservation expires."""
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name='stock_reservations')
+    product_variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_variant_id} for order {self.order_id}"
 
 
 class ReturnRequest(models.Model):
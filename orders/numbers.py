@@ -0,0 +1,90 @@
+"""
+Order numbers (BM000001, BM000002, ...).
+
+Each process reserves numbers in blocks of BLOCK_SIZE and hands them out
+from memory, so most orders get their number without a query and
+concurrent checkouts never compute the same one.
+
+On PostgreSQL a block is one nextval() of a sequence that steps by
+BLOCK_SIZE. Sequences are not transactional, so a block stays taken even if
+the checkout that reserved it rolls back. Other databases bump the single
+OrderNumberCounter row instead. That update is undone along with its
+transaction, so inside one only a single number is taken and nothing is
+kept for later.
+
+Numbers are unique and increasing per process, not gap-free: whatever is
+left of a block when a process exits is skipped.
+"""
+import re
+import threading
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import Order, OrderNumberCounter
+
+
+BLOCK_SIZE = 20  # also the sequence's INCREMENT BY, see migration 0011
+SEQUENCE = 'orders_order_number_seq'
+FORMAT = 'BM{:06d}'
+
+_lock = threading.Lock()
+_block = {'next': 0, 'end': 0}
+
+
+def format_order_id(number):
+    return FORMAT.format(number)
+
+
+def last_used_number():
+    """The highest number among existing order ids."""
+    last = Order.objects.count()
+    for order_id in Order.objects.exclude(order_id=None).values_list('order_id', flat=True).iterator():
+        match = re.fullmatch(r'BM(\d+)', order_id)
+        if match:
+            last = max(last, int(match.group(1)))
+    return last
+
+
+def _counter_block(size):
+    with transaction.atomic():
+        if not OrderNumberCounter.objects.filter(pk=1).update(
+                last_number=F('last_number') + size):
+            # Counter missing (e.g. a flushed test database): seed it
+            OrderNumberCounter.objects.create(pk=1, last_number=last_used_number() + size)
+        end = OrderNumberCounter.objects.values_list('last_number', flat=True).get(pk=1)
+    return end - size + 1, end + 1
+
+
+def _sequence_block():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT nextval(%s)', [SEQUENCE])
+        start = cursor.fetchone()[0]
+    return start, start + BLOCK_SIZE
+
+
+def next_number():
+    with _lock:
+        if _block['next'] < _block['end']:
+            number = _block['next']
+            _block['next'] += 1
+            return number
+
+        if connection.vendor == 'postgresql':
+            start, end = _sequence_block()
+        elif connection.in_atomic_block:
+            return _counter_block(1)[0]
+        else:
+            start, end = _counter_block(BLOCK_SIZE)
+        _block['next'], _block['end'] = start + 1, end
+        return start
+
+
+def next_order_id():
+    return format_order_id(next_number())
+
+
+def reset():
+    """Forget the current block, e.g. after the counter was reseeded."""
+    with _lock:
+        _block['next'] = _block['end'] = 0
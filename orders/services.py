@@ -0,0 +1,94 @@
+"""
+Order placement.
+
+`place_order` writes an order, all of its items, the stock movement and, for
+COD and wallet orders, the wallet debit, coupon use and cart clearing in one
+transaction with a fixed number of statements however many items the cart
+holds. Items are written with bulk_create, which skips OrderItem.save and
+its per-item count update; a new order and its items all start out Pending,
+so the order is created with its pending_items count, and the status
+those counts give, already set.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from shop.models import CartItem
+from user.models import Wallet, WalletTransaction
+
+from . import stock
+from .models import Coupon, Order, OrderItem, status_from_counts
+
+
+PAYMENT_METHODS = ('COD', 'WALLET', 'RAZORPAY')
+
+
+class InsufficientBalance(Exception):
+    pass
+
+
+def place_order(user, address, cart_items, payment_method, total, coupon=None, discount=0):
+    """
+    Create an order from priced cart items (see shop.pricing.price_cart).
+    Razorpay orders only reserve their stock and are completed by
+    `complete_order` once paid. Raises stock.InsufficientStock or
+    InsufficientBalance, leaving nothing behind.
+    """
+    cart_items = list(cart_items)
+    paid_now = payment_method != 'RAZORPAY'
+    with transaction.atomic():
+        order = Order.objects.create(
+            user=user,
+            address=address,
+            total_price=total,
+            payment_method='Wallet' if payment_method == 'WALLET' else payment_method,
+            status=status_from_counts({'Pending': len(cart_items)}),
+            is_paid=paid_now,
+            coupon=coupon,
+            discount_amount=discount,
+            pending_items=len(cart_items),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=item.product_variant.product_id,
+                product_variant_id=item.product_variant_id,
+                quantity=item.quantity,
+                price=item.unit_price,
+            )
+            for item in cart_items
+        ])
+
+        quantities = stock.quantities_for(cart_items)
+        if not paid_now:
+            stock.reserve(order, quantities)
+            return order
+
+        stock.take(quantities)
+        if payment_method == 'WALLET':
+            debit_wallet(order)
+        complete_order(order)
+    return order
+
+
+def debit_wallet(order):
+    """Pay for `order` from its user's wallet with one conditional update."""
+    wallet_id = Wallet.objects.filter(user=order.user_id).values_list('id', flat=True).first()
+    updated = Wallet.objects.filter(id=wallet_id, balance__gte=order.total_price).update(
+        balance=F('balance') - order.total_price, updated_at=timezone.now())
+    if not updated:
+        raise InsufficientBalance()
+    WalletTransaction.objects.create(
+        wallet_id=wallet_id,
+        amount=order.total_price,
+        transaction_type='Debit',
+        reason=f'paymentfor order #{order.id}',
+        related_order=order,
+    )
+
+
+def complete_order(order):
+    """Count the coupon use and empty the cart of a paid order."""
+    if order.coupon_id:
+        Coupon.objects.filter(id=order.coupon_id).update(times_used=F('times_used') + 1)
+    CartItem.objects.filter(user=order.user_id).delete()
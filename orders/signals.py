@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+
+# Sent with changes=[(order_id, old_status, new_status), ...] when order
+# statuses are re-derived from their items (see orders.status.refresh)
+order_status_changed = Signal()
@@ -0,0 +1,85 @@
+"""
+Order item status transitions.
+
+Every order keeps a count of its items in each status (Order.pending_items,
+Order.shipped_items, ...). Saving an item moves those counts by F() deltas
+and the order status is derived from them (models.status_from_counts), so
+it never has to load the items.
+
+`transition` moves any number of items, across any number of orders, to a
+new status with one UPDATE for the items and one per affected order, then
+re-derives each order's status once. Orders whose status changed are sent
+in one order_status_changed signal. `recount` rebuilds the counts from the
+items of orders written around these paths (`manage.py recount_order_items`).
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import ITEM_COUNT_FIELDS, Order, OrderItem, item_count_deltas, status_from_counts
+from .signals import order_status_changed
+
+
+def refresh(order_ids):
+    """Re-derive the status of orders from their item counts."""
+    rows = Order.objects.filter(id__in=order_ids).values_list(
+        'id', 'status', *ITEM_COUNT_FIELDS.values())
+    changed, changes = defaultdict(list), []
+    for order_id, current, *counts in rows:
+        status = status_from_counts(dict(zip(ITEM_COUNT_FIELDS, counts)))
+        if status != current:
+            changed[status].append(order_id)
+            changes.append((order_id, current, status))
+    for status, ids in changed.items():
+        Order.objects.filter(id__in=ids).update(status=status)
+    if changes:
+        order_status_changed.send(sender=Order, changes=changes)
+
+
+def transition(items, new_status):
+    """
+    Move OrderItems (or their ids) to `new_status`. Items already in it are
+    skipped. Returns {order_id: [item ids moved]}.
+    """
+    item_ids = [getattr(item, 'pk', item) for item in items]
+    moved = defaultdict(list)
+    with transaction.atomic():
+        rows = (OrderItem.objects.select_for_update()
+                .filter(id__in=item_ids).exclude(status=new_status)
+                .values_list('id', 'order_id', 'status'))
+        deltas = defaultdict(Counter)
+        for item_id, order_id, status in rows:
+            moved[order_id].append(item_id)
+            deltas[order_id][status] -= 1
+            deltas[order_id][new_status] += 1
+        if not moved:
+            return {}
+        OrderItem.objects.filter(
+            id__in=[pk for ids in moved.values() for pk in ids]).update(status=new_status)
+        for order_id, delta in deltas.items():
+            Order.objects.filter(id=order_id).update(**item_count_deltas(delta))
+        refresh(list(moved))
+
+    moved_ids = {pk for ids in moved.values() for pk in ids}
+    for item in items:
+        if getattr(item, 'pk', None) in moved_ids:
+            item.status = item._saved_status = new_status
+    return dict(moved)
+
+
+def recount(order_ids=None):
+    """Rebuild item counts from the items, for the given or all orders."""
+    orders = Order.objects.all() if order_ids is None else Order.objects.filter(id__in=order_ids)
+    ids = list(orders.values_list('id', flat=True))
+    counts = defaultdict(dict)
+    for order_id, status, count in (OrderItem.objects.filter(order_id__in=ids)
+                                    .values_list('order_id', 'status')
+                                    .annotate(count=Count('id')).order_by()):
+        counts[order_id][status] = count
+    with transaction.atomic():
+        for order_id in ids:
+            Order.objects.filter(id=order_id).update(**{
+                field: counts[order_id].get(status, 0)
+                for status, field in ITEM_COUNT_FIELDS.items()})
+    return len(ids)
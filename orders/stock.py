@@ -0,0 +1,145 @@
+"""
+Stock movements.
+
+Stock is taken with a single conditional UPDATE:
+
+    UPDATE variant SET stock = stock - CASE id WHEN .. THEN qty .. END
+    WHERE id IN (..) AND stock >= CASE id WHEN .. THEN qty .. END
+
+The database re-checks the condition on each row it locks, so two checkouts
+racing for the last unit can't both succeed, and nothing is read first or
+held locked across Python code. If fewer rows than asked for were updated
+the whole statement is rolled back and InsufficientStock names the variants
+that ran short.
+
+Orders paid online take their stock up front as a StockReservation, which
+is confirmed when the payment succeeds and given back when it fails or
+expires (see release_expired and `manage.py release_expired_reservations`).
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from shop.models import ProductVariant
+from shop.signals import stock_changed
+
+from .models import OrderItem, StockReservation
+from .status import transition
+
+
+RESERVATION_TTL = timedelta(minutes=15)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, variant_ids):
+        self.variant_ids = list(variant_ids)
+        super().__init__(f"Not enough stock for variants {self.variant_ids}")
+
+
+def quantities_for(items):
+    """Total quantity per variant id for cart or order items."""
+    quantities = Counter()
+    for item in items:
+        quantities[item.product_variant_id] += item.quantity
+    return dict(quantities)
+
+
+def _per_variant(quantities):
+    return Case(*[When(id=variant_id, then=Value(quantity))
+                  for variant_id, quantity in quantities.items()])
+
+
+def _stock_changed(variant_ids):
+    product_ids = set(ProductVariant.objects.filter(
+        id__in=variant_ids).values_list('product_id', flat=True))
+    # Outside the checkout transaction, so listing rows aren't held locked
+    transaction.on_commit(lambda: stock_changed(product_ids))
+
+
+def take(quantities):
+    """Decrement stock by {variant_id: quantity}, all or nothing."""
+    quantities = {pk: qty for pk, qty in quantities.items() if qty}
+    if not quantities:
+        return
+    amount = _per_variant(quantities)
+    with transaction.atomic():
+        updated = ProductVariant.objects.filter(
+            id__in=quantities, stock__gte=amount,
+        ).update(stock=F('stock') - amount)
+        if updated != len(quantities):
+            transaction.set_rollback(True)
+    if updated != len(quantities):
+        enough = ProductVariant.objects.filter(
+            id__in=quantities, stock__gte=amount).values_list('id', flat=True)
+        raise InsufficientStock(sorted(set(quantities) - set(enough)))
+    _stock_changed(quantities)
+
+
+def give_back(quantities):
+    """Increment stock by {variant_id: quantity}."""
+    quantities = {pk: qty for pk, qty in quantities.items() if pk and qty}
+    if not quantities:
+        return
+    ProductVariant.objects.filter(id__in=quantities).update(
+        stock=F('stock') + _per_variant(quantities))
+    _stock_changed(quantities)
+
+
+def reserve(order, quantities, ttl=RESERVATION_TTL):
+    """Take stock for `order` until its payment completes."""
+    expires_at = timezone.now() + ttl
+    with transaction.atomic():
+        take(quantities)
+        StockReservation.objects.bulk_create([
+            StockReservation(order=order, product_variant_id=variant_id,
+                             quantity=quantity, expires_at=expires_at)
+            for variant_id, quantity in quantities.items()
+        ])
+
+
+def _claim(reservations):
+    """Delete reservations and return the (order_id, variant_id, quantity)
+    rows this call removed; concurrent callers never claim a row twice."""
+    with transaction.atomic():
+        rows = list(reservations.select_for_update(skip_locked=True)
+                    .values_list('id', 'order_id', 'product_variant_id', 'quantity'))
+        if rows:
+            StockReservation.objects.filter(id__in=[row[0] for row in rows]).delete()
+    return [row[1:] for row in rows]
+
+
+def _quantities(rows):
+    quantities = Counter()
+    for _, variant_id, quantity in rows:
+        quantities[variant_id] += quantity
+    return dict(quantities)
+
+
+def confirm(order):
+    """Keep the reserved stock of a paid order. If the reservation already
+    expired and was given back, take the stock again and reopen the items
+    release_expired cancelled. Call once per order, with the order locked
+    (see orders.views.razorpay_success)."""
+    if not _claim(order.stock_reservations.all()):
+        take(quantities_for(order.items.all()))
+        transition(order.items.filter(status='Cancelled'), 'Pending')
+
+
+def release(order):
+    """Give back the reserved stock of an order whose payment failed."""
+    give_back(_quantities(_claim(order.stock_reservations.all())))
+
+
+def release_expired(now=None):
+    """Give back expired reservations and cancel the items of their unpaid
+    orders. Returns the number of orders released."""
+    rows = _claim(StockReservation.objects.filter(expires_at__lte=now or timezone.now()))
+    give_back(_quantities(rows))
+    order_ids = {order_id for order_id, _, _ in rows}
+    # Through the item counts, so order status and sales rollups follow
+    transition(OrderItem.objects.filter(
+        order_id__in=order_ids, order__is_paid=False, status='Pending'), 'Cancelled')
+    return len(order_ids)
@@ -1,3 +1,334 @@
-from django.test import TestCase
+import json
+from datetime import datetime, timedelta, timezone
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from orders import numbers, services, status, stock
+from orders.models import (Coupon, Order, OrderItem, OrderNumberCounter, StockReservation,
+                           status_from_counts)
+from shop import facets
+from shop.models import CartItem, Category, Product, ProductListing, ProductVariant
+from user.models import Address, CustomUser, Wallet
+from utils.cache import get_versions
+from utils.testing import QueryBudgetMixin
+
+
+class OrderListViewTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='geetha', email='geetha@example.com', password='securepass')
+        self.client.login(username='geetha', password='securepass')
+        self.orders = [Order.objects.create(user=self.user, total_price=100 + i)
+                       for i in range(12)]
+
+    def test_orders_paged_newest_first(self):
+        page = self.client.get(reverse('orders:order')).context['orders']
+        self.assertEqual([order.id for order in page],
+                         [order.id for order in reversed(self.orders)][:10])
+
+        page = self.client.get(reverse('orders:order'), {'cursor': page.next_cursor}).context['orders']
+        self.assertEqual([order.id for order in page],
+                         [self.orders[1].id, self.orders[0].id])
+        self.assertFalse(page.has_next)
+
+    def test_cursor_keeps_microseconds(self):
+        # Rows created within one millisecond must not be skipped
+        for i, order in enumerate(self.orders):
+            Order.objects.filter(pk=order.pk).update(
+                created_at=datetime(2026, 1, 1, 12, 0, 0, 123100 + i, tzinfo=timezone.utc))
+        page = self.client.get(reverse('orders:order')).context['orders']
+        page = self.client.get(reverse('orders:order'), {'cursor': page.next_cursor}).context['orders']
+        self.assertEqual([order.id for order in page],
+                         [self.orders[1].id, self.orders[0].id])
+
+    def test_order_detail_query_budget(self):
+        product = Product.objects.create(name='Rattle')
+        for i in range(5):
+            variant = ProductVariant.objects.create(product=product, sku=f'R-{i}', price=10)
+            OrderItem.objects.create(order=self.orders[0], product=product,
+                                     product_variant=variant, quantity=1, price=10)
+        url = reverse('orders:order_detail', args=[self.orders[0].id])
+        with self.assertQueryBudget(10):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['items']), 5)
+
+    def test_json_variant(self):
+        data = self.client.get(reverse('orders:order'), {'format': 'json'}).json()
+        self.assertEqual(len(data['results']), 10)
+        self.assertEqual(data['results'][0]['id'], self.orders[-1].id)
+        self.assertTrue(data['has_next'])
+
+
+class StockTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='geetha', email='geetha@example.com', password='securepass')
+        self.client.login(username='geetha', password='securepass')
+        self.address = Address.objects.create(
+            user=self.user, name='Geetha', phone='9999999999', address_line1='1 Main St',
+            city='Kochi', state='Kerala', postal_code='682001')
+        product = Product.objects.create(name='Rattle', category=Category.objects.create(name='Toys'))
+        self.rattle = ProductVariant.objects.create(product=product, sku='R-1', price=100, stock=3)
+        self.ball = ProductVariant.objects.create(product=product, sku='R-2', price=200, stock=1)
+
+    def stock_of(self, variant):
+        variant.refresh_from_db()
+        return variant.stock
+
+    def checkout(self, payment_method, **quantities):
+        for name, quantity in quantities.items():
+            CartItem.objects.create(user=self.user, product_variant=getattr(self, name),
+                                    quantity=quantity)
+        return self.client.post(reverse('orders:checkout'), {
+            'place_order': '1', 'address': self.address.id, 'payment_method': payment_method})
+
+    def test_take_is_all_or_nothing(self):
+        with self.assertRaises(stock.InsufficientStock) as caught:
+            stock.take({self.rattle.id: 2, self.ball.id: 2})
+        self.assertEqual(caught.exception.variant_ids, [self.ball.id])
+        self.assertEqual((self.stock_of(self.rattle), self.stock_of(self.ball)), (3, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.take({self.rattle.id: 2, self.ball.id: 1})
+        self.assertEqual((self.stock_of(self.rattle), self.stock_of(self.ball)), (1, 0))
+        self.assertEqual(ProductListing.objects.get(product=self.rattle.product).total_stock, 1)
+
+    def test_stock_move_only_invalidates_stock_facet(self):
+        names = [facets._namespace(facets.ALL_SCOPE, name)
+                 for name in ('universe', facets.PRICE, facets.STOCK)]
+        before = get_versions(names)
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.take({self.ball.id: 1})
+        after = get_versions(names)
+        self.assertEqual([before[name] == after[name] for name in names], [True, True, False])
+        listing = ProductListing.objects.get(product=self.ball.product)
+        self.assertEqual((listing.total_stock, listing.default_variant_id), (3, self.rattle.id))
+
+    def test_cod_checkout_takes_stock(self):
+        response = self.checkout('COD', rattle=2)
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('orders:order_success', args=[order.id]),
+                             fetch_redirect_response=False)
+        self.assertEqual(self.stock_of(self.rattle), 1)
+
+    def test_sold_out_checkout_leaves_no_order(self):
+        CartItem.objects.create(user=self.user, product_variant=self.ball, quantity=1)
+        # Someone else buys the last one after it went into this cart
+        stock.take({self.ball.id: 1})
+        self.client.post(reverse('orders:checkout'), {
+            'place_order': '1', 'address': self.address.id, 'payment_method': 'COD'})
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_reservation_released_on_payment_failure(self):
+        order = Order.objects.create(user=self.user, total_price=100)
+        stock.reserve(order, {self.rattle.id: 2})
+        self.assertEqual(self.stock_of(self.rattle), 1)
+
+        self.client.post(reverse('orders:mark_payment_failed'),
+                         json.dumps({'order_id': order.id}), content_type='application/json')
+        self.assertEqual(self.stock_of(self.rattle), 3)
+        self.assertFalse(StockReservation.objects.exists())
+        # Releasing twice gives nothing back
+        stock.release(order)
+        self.assertEqual(self.stock_of(self.rattle), 3)
+
+    def test_expired_reservations_released(self):
+        order = Order.objects.create(user=self.user, total_price=100)
+        OrderItem.objects.create(order=order, product=self.rattle.product,
+                                 product_variant=self.rattle, quantity=2, price=100)
+        stock.reserve(order, {self.rattle.id: 2}, ttl=timedelta(minutes=-1))
+        self.assertEqual(stock.release_expired(), 1)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.cancelled_items, self.stock_of(self.rattle)),
+                         ('Cancelled', 1, 3))
+
+    def test_confirm_retakes_stock_after_expiry(self):
+        order = Order.objects.create(user=self.user, total_price=100)
+        OrderItem.objects.create(order=order, product=self.rattle.product,
+                                 product_variant=self.rattle, quantity=2, price=100)
+        stock.reserve(order, {self.rattle.id: 2}, ttl=timedelta(minutes=-1))
+        stock.release_expired()
+        stock.confirm(order)
+        self.assertEqual(self.stock_of(self.rattle), 1)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.pending_items), ('Processing', 1))
+
+
+class OrderPlacementTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='geetha', email='geetha@example.com', password='securepass')
+        self.address = Address.objects.create(
+            user=self.user, name='Geetha', phone='9999999999', address_line1='1 Main St',
+            city='Kochi', state='Kerala', postal_code='682001')
+        category = Category.objects.create(name='Toys')
+        self.variants = []
+        for i in range(6):
+            product = Product.objects.create(name=f'Toy {i}', category=category)
+            self.variants.append(ProductVariant.objects.create(
+                product=product, sku=f'T-{i}', price=100, stock=5))
+
+    def fill_cart(self, count):
+        CartItem.objects.filter(user=self.user).delete()
+        for variant in self.variants[:count]:
+            CartItem.objects.create(user=self.user, product_variant=variant, quantity=1)
+        items = list(CartItem.objects.filter(user=self.user).select_related(
+            'product_variant', 'product_variant__product'))
+        for item in items:
+            item.unit_price = item.product_variant.price
+        return items
+
+    def place(self, count, payment_method='COD', **kwargs):
+        items = self.fill_cart(count)
+        with CaptureQueriesContext(connection) as queries:
+            order = services.place_order(self.user, self.address, items, payment_method,
+                                         100 * count, **kwargs)
+        return order, len(queries)
+
+    def test_query_count_does_not_grow_with_items(self):
+        _, one = self.place(1)
+        order, many = self.place(6)
+        self.assertEqual(one, many)
+        self.assertEqual(order.items.count(), 6)
+        self.assertEqual(set(order.items.values_list('status', flat=True)), {'Pending'})
+        order.refresh_from_db()
+        self.assertEqual(order.status, status_from_counts({'Pending': 6}))
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+
+    def test_coupon_use_counted(self):
+        coupon = Coupon.objects.create(
+            code='BABY10', discount=10, valid_from=datetime(2026, 1, 1, tzinfo=timezone.utc),
+            valid_to=datetime(2030, 1, 1, tzinfo=timezone.utc))
+        self.place(2, coupon=coupon, discount=10)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.times_used, 1)
+
+    def test_wallet_payment(self):
+        Wallet.objects.filter(user=self.user).update(balance=250)
+        with self.assertRaises(services.InsufficientBalance):
+            self.place(3, 'WALLET')
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(ProductVariant.objects.get(pk=self.variants[0].pk).stock, 5)
+
+        order, _ = self.place(2, 'WALLET')
+        self.assertEqual((order.payment_method, order.is_paid), ('Wallet', True))
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, 50)
+        self.assertEqual(order.wallettransaction_set.get().amount, 200)
+
+    def test_razorpay_order_keeps_cart_until_paid(self):
+        order, _ = self.place(2, 'RAZORPAY')
+        self.assertFalse(order.is_paid)
+        self.assertEqual(order.stock_reservations.count(), 2)
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 2)
+
+    def test_replayed_razorpay_success_confirms_once(self):
+        coupon = Coupon.objects.create(
+            code='BABY10', discount=10, valid_from=datetime(2026, 1, 1, tzinfo=timezone.utc),
+            valid_to=datetime(2030, 1, 1, tzinfo=timezone.utc))
+        order, _ = self.place(2, 'RAZORPAY', coupon=coupon, discount=10)
+        # The reservation lapses, so confirming has to take the stock again
+        StockReservation.objects.update(expires_at=datetime(2026, 1, 1, tzinfo=timezone.utc))
+        stock.release_expired()
+
+        self.client.login(username='geetha', password='securepass')
+        payload = json.dumps({'order_id': order.id, 'razorpay_order_id': 'o',
+                              'razorpay_payment_id': 'p', 'razorpay_signature': 's'})
+        with mock.patch('orders.views.razorpay.Client'):
+            for _ in range(2):
+                response = self.client.post(reverse('orders:razorpay_success'), payload,
+                                            content_type='application/json')
+                self.assertEqual(response.json()['status'], 'success')
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.times_used, 1)
+        self.assertEqual(ProductVariant.objects.get(pk=self.variants[0].pk).stock, 4)
+
+
+class OrderStatusTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='status', email='status@example.com')
+        self.orders = [Order.objects.create(user=self.user, total_price=300) for _ in range(2)]
+        self.items = [OrderItem.objects.create(order=order, quantity=1, price=100)
+                      for order in self.orders for _ in range(3)]
+
+    def test_status_from_counts(self):
+        self.assertEqual(status_from_counts({}), 'Pending')
+        self.assertEqual(status_from_counts({'Pending': 2}), 'Processing')
+        self.assertEqual(status_from_counts({'Shipped': 2, 'Cancelled': 0}), 'Shipped')
+        self.assertEqual(status_from_counts({'Delivered': 1, 'Returned': 1}), 'Partially Returned')
+        self.assertEqual(status_from_counts({'Delivered': 1, 'Cancelled': 1}), 'Partially Cancelled')
+        self.assertEqual(status_from_counts({'Delivered': 1, 'Shipped': 1}), 'Partially Delivered')
+        self.assertEqual(status_from_counts({'Pending': 1, 'Shipped': 1}), 'Processing')
+
+    def test_item_save_moves_counts(self):
+        item = OrderItem.objects.get(pk=self.items[0].pk)
+        item.status = 'Cancelled'
+        with self.assertNumQueries(4):  # item, counts, read counts, status
+            item.save()
+        order = Order.objects.get(pk=self.orders[0].pk)
+        self.assertEqual((order.pending_items, order.cancelled_items), (2, 1))
+        self.assertEqual(order.status, 'Partially Cancelled')
+
+        with self.assertNumQueries(1):
+            item.save()  # status unchanged
+
+    def test_transition_recomputes_each_order_once(self):
+        with self.assertNumQueries(8):  # savepoint, lock, items, 2 x counts, read, status, release
+            moved = status.transition(self.items, 'Shipped')
+        self.assertEqual(sorted(moved), sorted(order.pk for order in self.orders))
+        self.assertEqual({item.status for item in self.items}, {'Shipped'})
+        for order in Order.objects.all():
+            self.assertEqual((order.pending_items, order.shipped_items, order.status),
+                             (0, 3, 'Shipped'))
+
+        status.transition([self.items[0].pk], 'Delivered')
+        order = Order.objects.get(pk=self.orders[0].pk)
+        self.assertEqual(order.item_counts()['Delivered'], 1)
+        self.assertEqual(order.status, 'Partially Delivered')
+        self.assertEqual(status.transition([self.items[0]], 'Delivered'), {})
+
+    def test_recount(self):
+        OrderItem.objects.filter(order=self.orders[0]).update(status='Delivered')
+        self.assertEqual(status.recount([self.orders[0].pk]), 1)
+        order = Order.objects.get(pk=self.orders[0].pk)
+        self.assertEqual((order.pending_items, order.delivered_items), (0, 3))
+
+
+class OrderNumberTests(TestCase):
+    def setUp(self):
+        numbers.reset()
+        self.user = CustomUser.objects.create_user(username='numbers', email='numbers@example.com')
+
+    def test_sequential_numbers(self):
+        first = Order.objects.create(user=self.user, total_price=10)
+        second = Order.objects.create(user=self.user, total_price=10)
+        self.assertEqual((first.order_id, second.order_id), ('BM000001', 'BM000002'))
+
+    def test_numbers_not_reused_after_delete(self):
+        Order.objects.create(user=self.user, total_price=10)
+        Order.objects.create(user=self.user, total_price=10).delete()
+        self.assertEqual(Order.objects.create(user=self.user, total_price=10).order_id, 'BM000003')
+
+    def test_missing_counter_seeded_from_existing_orders(self):
+        Order.objects.create(user=self.user, total_price=10, order_id='BM000041')
+        OrderNumberCounter.objects.all().delete()
+        self.assertEqual(Order.objects.create(user=self.user, total_price=10).order_id, 'BM000042')
+
+
+class OrderNumberBlockTests(TransactionTestCase):
+    def setUp(self):
+        numbers.reset()
+        self.addCleanup(numbers.reset)
+
+    def test_block_served_from_memory(self):
+        with self.assertNumQueries(4):  # begin, update, select, commit
+            first = numbers.next_number()
+        with self.assertNumQueries(0):
+            rest = [numbers.next_number() for _ in range(numbers.BLOCK_SIZE - 1)]
+        self.assertEqual(rest, list(range(first + 1, first + numbers.BLOCK_SIZE)))
+        self.assertEqual(OrderNumberCounter.objects.get().last_number, first + numbers.BLOCK_SIZE - 1)
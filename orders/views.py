@@ -1,3 +1,4 @@
+import logging
 import traceback
 from .models import Order, OrderItem
 from django.shortcuts import get_object_or_404, redirect, render
@@ -6,16 +7,19 @@ import json
 from django.shortcuts import render, redirect, get_object_or_404
 
 from shop.models import CartItem, Product, Review
-from user.models import Address, Wallet, WalletTransaction
+from user.models import Address
 from orders.models import Order, OrderItem, ReturnRequest
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from decimal import Decimal
+from django.db import transaction
 from django.db.models import Q
 from django.http import HttpResponse
 from django.template.loader import get_template
 from xhtml2pdf import pisa
-from django.core.paginator import Paginator
+from shop.pricing import price_cart
+from . import services, status, stock
+from utils.pagination import CursorPaginator, page_json_response
 
 
 from decimal import Decimal
@@ -57,6 +61,10 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
+ORDER_PAGE_SIZE = 10
+
 
 @login_required
 def checkout_view(request):
@@ -82,9 +90,8 @@ def checkout_view(request):
             request, f"The following items are unavailable: {', '.join(unavailable_products)}")
         return redirect('cart')
 
-    # Price calculation
-    subtotal = sum(item.product_variant.get_offer_price()
-                   * item.quantity for item in cart_items)
+    # Price calculation, one query for the whole cart
+    _, subtotal = price_cart(cart_items)
     shipping = Decimal('50.00') if subtotal < 500 else Decimal('0.00')
     tax = subtotal * Decimal('0.05')
     discount = Decimal('0.00')
@@ -110,85 +117,28 @@ def checkout_view(request):
         selected_address_id = request.POST.get('address')
         payment_method = request.POST.get('payment_method')
 
-        if not selected_address_id or not payment_method:
+        if not selected_address_id or payment_method not in services.PAYMENT_METHODS:
             messages.error(
                 request, "Please select address and payment method.")
             return redirect('orders:checkout')
 
         address = get_object_or_404(Address, id=selected_address_id, user=user)
 
-        order = Order.objects.create(
-            user=user,
-            address=address,
-            total_price=total,
-            payment_method=payment_method,
-            status="Pending",
-            is_paid=False,
-            coupon=coupon_obj,
-            discount_amount=discount,
-        )
-        for item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=item.product_variant.product,
-                product_variant=item.product_variant,
-                quantity=item.quantity,
-                price=item.product_variant.get_offer_price(),
-            )
-
-        if payment_method == 'COD':
-            order.is_paid = True
-            order.save()
-            if order.coupon:
-                order.coupon.times_used += 1
-                order.coupon.save()
-
-            for item in cart_items:
-                item.product_variant.stock -= item.quantity
-                item.product_variant.save()
-
-            cart_items.delete()
-            request.session.pop('applied_coupon', None)
-            request.session.pop('discount', None)
-
-            return redirect('orders:order_success', order_id=order.id)
-        
-        elif payment_method == 'WALLET':
-            wallet=Wallet.objects.get(user=user)
-            if wallet.balance >= total:
-                wallet.balance -= total
-                wallet.save()
-                order.is_paid = True
-                order.payment_method = 'Wallet'
-                order.save()
-
-                if order.coupon:
-                    order.coupon.times_used += 1
-                    order.coupon.save()
-                #wallet transaction
-                WalletTransaction.objects.create(
-                    wallet=wallet,
-                    amount=total,
-                    transaction_type='Debit',
-                    reason=f'paymentfor order #{order.id}',
-                    related_order=order
-                )
-
-                for item in cart_items:
-                    item.product_variant.stock -= item.quantity
-                    item.product_variant.save()
-
-                cart_items.delete()
-                request.session.pop('applied_coupon', None)
-                request.session.pop('discount', None)
-
-                return redirect('orders:order_success', order_id=order.id)
-            else:
-                order.delete()
-                messages.error(request, "Insufficient wallet balance.")
-                return redirect('orders:checkout')
+        try:
+            order = services.place_order(
+                user, address, cart_items, payment_method, total,
+                coupon=coupon_obj, discount=discount)
+        except stock.InsufficientStock as exc:
+            sold_out = [item.product_variant.product.name for item in cart_items
+                        if item.product_variant_id in exc.variant_ids]
+            messages.error(
+                request, f"Sorry, these items just sold out: {', '.join(sold_out)}")
+            return redirect('cart')
+        except services.InsufficientBalance:
+            messages.error(request, "Insufficient wallet balance.")
+            return redirect('orders:checkout')
 
-        elif payment_method == 'RAZORPAY':
+        if payment_method == 'RAZORPAY':
             client = razorpay.Client(
                 auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
             razorpay_order = client.order.create({
@@ -209,6 +159,10 @@ def checkout_view(request):
                 "user_name": user.get_full_name(),
             })
 
+        request.session.pop('applied_coupon', None)
+        request.session.pop('discount', None)
+        return redirect('orders:order_success', order_id=order.id)
+
     return render(request, 'order/checkout.html', {
         'cart_items': cart_items,
         'addresses': addresses,
@@ -233,11 +187,7 @@ def ajax_apply_coupon(request):
 
         cart_items = CartItem.objects.filter(user=user).select_related('product_variant', 'product_variant__product')
 
-        subtotal = sum(
-            Decimal(item.product_variant.get_offer_price()) * item.quantity
-            for item in cart_items
-            if item.product_variant and hasattr(item.product_variant, 'get_offer_price')
-        )
+        _, subtotal = price_cart(cart_items)
 
         shipping = Decimal('50.00') if subtotal < Decimal('1000.00') else Decimal('0.00')
         tax = subtotal * Decimal('0.05')
@@ -292,22 +242,23 @@ def razorpay_success(request):
             'razorpay_signature': data['razorpay_signature']
         })
 
-        order = Order.objects.get(id=data['order_id'], user=request.user)
-
-        order.is_paid = True
-        order.status = "Confirmed"
-        order.save()
-        
-        if order.coupon:
-            order.coupon.times_used += 1
-            order.coupon.save()
-
-        for item in order.items.select_related('product'):
-            if item.product:
-                item.product_variant.stock -= item.quantity
-                item.product.save()
+        with transaction.atomic():
+            # Locked so a repeated callback waits, then sees the order paid
+            # and doesn't take stock or count the coupon again
+            order = Order.objects.select_for_update().get(
+                id=data['order_id'], user=request.user)
+            if not order.is_paid:
+                order.is_paid = True
+                order.status = "Confirmed"
+                order.save()
 
-        CartItem.objects.filter(user=request.user).delete()
+                try:
+                    stock.confirm(order)
+                except stock.InsufficientStock as exc:
+                    # Paid after the reservation lapsed and the stock sold out
+                    logger.warning("Order %s was paid but variants %s sold out",
+                                   order.id, exc.variant_ids)
+                services.complete_order(order)
 
         return JsonResponse({
             'status': 'success',
@@ -316,11 +267,13 @@ def razorpay_success(request):
         })
 
     except razorpay.errors.SignatureVerificationError:
-        order = Order.objects.filter(id=data.get(
-            'order_id'), user=request.user).first()
-        if order:
-            order.status = "Failed"
-            order.save()
+        with transaction.atomic():
+            order = Order.objects.select_for_update().filter(id=data.get(
+                'order_id'), user=request.user).first()
+            if order and not order.is_paid:
+                order.status = "Failed"
+                order.save()
+                stock.release(order)
 
         return JsonResponse({
             'status': 'failure',
@@ -346,9 +299,12 @@ def mark_payment_failed(request):
         order_id = data.get('order_id')
 
         try:
-            order = Order.objects.get(id=order_id, user=request.user)
-            order.status = "Failed"
-            order.save()
+            with transaction.atomic():
+                order = Order.objects.select_for_update().get(id=order_id, user=request.user)
+                if not order.is_paid:
+                    order.status = "Failed"
+                    order.save()
+                    stock.release(order)
 
             return JsonResponse({
                 "status": "failed",
@@ -408,11 +364,17 @@ def order_list_view(request):
             Q(id__icontains=query) | Q(status__icontains=query)
         )
 
-    orders = orders.order_by('-created_at')  # Newest first
+    # Newest first
+    paginator = CursorPaginator(orders, ORDER_PAGE_SIZE, ('-created_at', '-id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
-    paginator = Paginator(orders, 10)  # 10 orders per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if request.GET.get('format') == 'json':
+        return page_json_response(page_obj, [{
+            'id': order.id,
+            'status': order.status,
+            'created_at': order.created_at,
+            'total_price': order.total_price,
+        } for order in page_obj])
 
     return render(request, 'order/order.html', {'orders': page_obj})
 
@@ -421,15 +383,18 @@ def order_list_view(request):
 @login_required
 def order_detail_view(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
-    items = OrderItem.objects.filter(order=order)
+    items = list(OrderItem.objects.filter(order=order)
+                 .select_related('product', 'product_variant__product')
+                 .prefetch_related('product_variant__options',
+                                   'product_variant__product__images'))
+    reviewed = set(Review.objects.filter(
+        user=request.user, product__in=[item.product_id for item in items],
+    ).values_list('product_id', flat=True))
 
     # Mark which items are reviewable and whether already reviewed
     for item in items:
         item.can_review = item.status in ['Delivered', 'Completed']
-        item.already_reviewed = Review.objects.filter(
-            product=item.product,
-            user=request.user
-        ).exists()
+        item.already_reviewed = item.product_id in reviewed
 
     return render(request, 'order/order_detail.html', {
         'order': order,
@@ -450,10 +415,8 @@ def cancel_item(request, item_id):
         reason_text = request.POST.get('reason_text', '')
         reason = f"{reason_select} - {reason_text}".strip(" -")
         item.status = 'Cancelled'
-        item.product_variant.stock += item.quantity
-        item.product_variant.save()
+        stock.give_back({item.product_variant_id: item.quantity})
         item.save()
-        item.order.update_status_from_items()
 
         if item.order.payment_method != 'COD':
             user = request.user
@@ -487,15 +450,11 @@ def order_cancel(request, order_id):
         reason = f"{reason_select} - {reason_text}".strip(" -")
         total_refund = 0
 
-        for item in order.items.all():
-            item.status = 'Cancelled'
-            item.product_variant.stock += item.quantity
-            item.product_variant.save()
+        items = list(order.items.all())
+        for item in items:
             total_refund += item.subtotal()
-            item.save()
-
-        order.status = 'Cancelled'
-        order.save()
+        status.transition(items, 'Cancelled')
+        stock.give_back(stock.quantities_for(items))
 
         if order.payment_method != 'COD':
             user = request.user
@@ -540,10 +499,7 @@ def return_order(request, order_id):
         else:
             # Create a return request and mark items as returned
             ReturnRequest.objects.create(order=order, reason=reason)
-            for item in order.items.all():
-                item.status = 'Returned'
-                item.save()
-            order.update_status_from_items()
+            status.transition(order.items.all(), 'Returned')
             messages.success(
                 request, "Return request submitted for the entire order.")
             return redirect('orders:order_detail', order_id=order.id)
@@ -567,7 +523,6 @@ def return_order_item(request, item_id):
             item.status = 'Returned'
             item.save()
             ReturnRequest.objects.create(order=item.order, reason=reason)
-            item.order.update_status_from_items()
             messages.success(
                 request, f"Return request submitted for item #{item.id}.")
             return redirect('orders:order_detail', order_id=item.order.id)
@@ -0,0 +1,52 @@
+"""
+Per-user cart and wishlist sizes kept in the cache.
+
+Counts are loaded from the database on a miss and then moved by +1/-1 from
+the CartItem/Wishlist signals (see shop/signals.py), so the header badges
+cost no queries once warm. Counters expire after a while so any drift from
+writes that bypass signals (bulk_create, raw SQL) heals itself.
+"""
+from django.core.cache import cache
+
+from .models import CartItem, Wishlist
+
+
+CART = 'cart'
+WISHLIST = 'wishlist'
+MODELS = {CART: CartItem, WISHLIST: Wishlist}
+
+TIMEOUT = 60 * 60
+
+
+def _key(kind, user_id):
+    return f'counts:{kind}:{user_id}'
+
+
+def get_counts(user_id):
+    """Return {'cart': n, 'wishlist': n} for a user."""
+    keys = {kind: _key(kind, user_id) for kind in MODELS}
+    found = cache.get_many(keys.values())
+    counts = {}
+    for kind, key in keys.items():
+        if key in found:
+            counts[kind] = found[key]
+        else:
+            counts[kind] = MODELS[kind].objects.filter(user_id=user_id).count()
+            cache.add(key, counts[kind], TIMEOUT)
+    return counts
+
+
+def get_count(kind, user_id):
+    return get_counts(user_id)[kind]
+
+
+def adjust(kind, user_id, delta):
+    """Move a cached count; a missing counter is left to be reloaded."""
+    try:
+        cache.incr(_key(kind, user_id), delta)
+    except ValueError:
+        pass
+
+
+def reset(kind, user_id):
+    cache.delete(_key(kind, user_id))
@@ -0,0 +1,311 @@
+"""
+Facet counts for the shop grid.
+
+For every scope (one category, or the whole catalog) and facet we cache a
+map of facet value -> bitmap, where bit N is set when the Nth visible
+product of the scope (by id) has that value. Counting any filter combination
+is then a few integer ANDs and popcounts, with no database work. The scope's
+sorted product ids are cached in its 'universe' entry, so bitmaps stay as
+wide as the scope holds products however large or sparse the ids are.
+Bitmaps are cached per (scope, facet) so a change only invalidates the
+facets it can affect.
+"""
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+
+from utils.cache import bump, get_versions, versioned_key
+
+from .models import ProductListing, ProductVariant
+
+
+BRAND = 'brand'
+GENDER = 'gender'
+AGE = 'age'
+SIZE = 'size'
+COLOR = 'color'
+PRICE = 'price'
+STOCK = 'stock'
+FACETS = (BRAND, GENDER, AGE, SIZE, COLOR, PRICE, STOCK)
+
+FACET_LABELS = {
+    BRAND: 'Brand',
+    GENDER: 'Gender',
+    AGE: 'Age',
+    SIZE: 'Size',
+    COLOR: 'Color',
+    PRICE: 'Price',
+    STOCK: 'Availability',
+}
+OPTION_ATTRIBUTES = {SIZE: 'Size', COLOR: 'Color'}
+# Facets whose values are primary keys (brands, variant options)
+ID_FACETS = (BRAND, SIZE, COLOR)
+
+# (key, label, lowest month, highest month)
+AGE_BUCKETS = [
+    ('0-6', '0–6 months', 0, 6),
+    ('6-12', '6–12 months', 6, 12),
+    ('12-24', '1–2 years', 12, 24),
+    ('24-36', '2–3 years', 24, 36),
+]
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = [
+    ('under-500', 'Under ₹500', None, 500),
+    ('500-1000', '₹500 – ₹1000', 500, 1000),
+    ('1000-2000', '₹1000 – ₹2000', 1000, 2000),
+    ('2000-plus', '₹2000 & above', 2000, None),
+]
+IN_STOCK = 'in'
+
+CACHE_TIMEOUT = 60 * 60
+ALL_SCOPE = 'all'
+
+FacetOption = namedtuple('FacetOption', ['value', 'label', 'count', 'selected'])
+Facet = namedtuple('Facet', ['name', 'label', 'options'])
+
+
+# -- selection ----------------------------------------------------------------
+
+def parse_selection(params):
+    """Read the selected facet values from request.GET, dropping ids that
+    aren't numbers."""
+    selection = {}
+    for facet in FACETS:
+        values = {value for value in params.getlist(facet) if value}
+        if facet in ID_FACETS:
+            values = {value for value in values if value.isascii() and value.isdigit()}
+        if values:
+            selection[facet] = values
+    return selection
+
+
+def _bucket_q(lo, hi, low_field, high_field):
+    # Ranges overlap when they share more than an endpoint; products without
+    # an age range suit every age
+    condition = Q(**{f'{high_field}__isnull': True}) | Q(**{f'{high_field}__gt': lo})
+    return condition & (Q(**{f'{low_field}__isnull': True}) | Q(**{f'{low_field}__lt': hi}))
+
+
+def filter_listings(listings, selection):
+    """Apply a facet selection to a ProductListing queryset."""
+    if BRAND in selection:
+        listings = listings.filter(brand_id__in=selection[BRAND])
+    if GENDER in selection:
+        listings = listings.filter(gender__in=selection[GENDER])
+    if AGE in selection:
+        condition = Q(pk__in=[])
+        for key, _, lo, hi in AGE_BUCKETS:
+            if key in selection[AGE]:
+                condition |= _bucket_q(lo, hi, 'min_age', 'max_age')
+        listings = listings.filter(condition)
+    if PRICE in selection:
+        condition = Q(pk__in=[])
+        for key, _, lo, hi in PRICE_BANDS:
+            if key in selection[PRICE]:
+                band = Q()
+                if lo is not None:
+                    band &= Q(min_price__gte=lo)
+                if hi is not None:
+                    band &= Q(min_price__lt=hi)
+                condition |= band
+        listings = listings.filter(condition)
+    for facet in (SIZE, COLOR):
+        if facet in selection:
+            listings = listings.filter(Exists(ProductVariant.objects.filter(
+                product_id=OuterRef('product_id'), options__in=selection[facet])))
+    if IN_STOCK in selection.get(STOCK, ()):
+        listings = listings.filter(total_stock__gt=0)
+    return listings
+
+
+# -- bitmap index -------------------------------------------------------------
+
+def _scope(category_id):
+    return str(category_id) if category_id else ALL_SCOPE
+
+
+def _namespace(scope, facet):
+    return f'facets:{scope}:{facet}'
+
+
+def _bits(positions):
+    bitmap = 0
+    for position in positions:
+        bitmap |= 1 << position
+    return bitmap
+
+
+def _positions(ids, product_ids):
+    """Positions in the sorted `ids` of those of `product_ids` it holds."""
+    for product_id in product_ids:
+        position = bisect_left(ids, product_id)
+        if position < len(ids) and ids[position] == product_id:
+            yield position
+
+
+def _age_keys(min_age, max_age):
+    low = min_age or 0
+    return [key for key, _, lo, hi in AGE_BUCKETS
+            if low < hi and (max_age is None or max_age > lo)]
+
+
+def _price_key(price):
+    for key, _, lo, hi in PRICE_BANDS:
+        if (lo is None or price >= lo) and (hi is None or price < hi):
+            return key
+
+
+def _build(category_id, facets, ids=None):
+    """
+    Build the bitmaps of `facets` for a scope in one pass over the listing
+    rows (plus one pass over variant options when size/color are needed).
+    Bits are positions in `ids`, the cached universe's ids; without them
+    the universe is built too.
+    """
+    listings = ProductListing.objects.filter(is_visible=True)
+    if category_id:
+        listings = listings.filter(category_id=category_id)
+    rows = list(listings.order_by('product_id').values_list(
+        'product_id', 'brand_id', 'brand__name', 'gender',
+        'min_age', 'max_age', 'min_price', 'total_stock'))
+
+    index = {facet: {'bitmaps': {}, 'labels': {}} for facet in facets}
+    if ids is None:
+        ids = array('q', (row[0] for row in rows))
+        index['universe'] = {'bitmaps': {'all': (1 << len(ids)) - 1}, 'labels': {},
+                             'ids': ids, 'prices': []}
+    positions = {product_id: position for position, product_id in enumerate(ids)}
+
+    def add(facet, value, label, product_id):
+        position = positions.get(product_id)
+        if facet in index and position is not None:
+            entry = index[facet]
+            entry['bitmaps'][value] = entry['bitmaps'].get(value, 0) | (1 << position)
+            entry['labels'].setdefault(value, label)
+
+    for product_id, brand_id, brand_name, gender, min_age, max_age, min_price, total_stock in rows:
+        if brand_id:
+            add(BRAND, str(brand_id), brand_name, product_id)
+        add(GENDER, gender, gender, product_id)
+        for key in _age_keys(min_age, max_age):
+            add(AGE, key, key, product_id)
+        add(PRICE, _price_key(min_price), '', product_id)
+        if total_stock > 0:
+            add(STOCK, IN_STOCK, 'In stock', product_id)
+    if 'universe' in index:
+        index['universe']['prices'] = sorted(
+            (row[6], positions[row[0]]) for row in rows)
+
+    wanted = [name for facet, name in OPTION_ATTRIBUTES.items() if facet in facets]
+    if wanted:
+        VariantOptions = ProductVariant.options.through
+        options = (VariantOptions.objects
+                   .filter(productvariant__product_id__in=listings.values('product_id'),
+                           variantoption__attribute__name__in=wanted)
+                   .values_list('productvariant__product_id', 'variantoption_id',
+                                'variantoption__value', 'variantoption__attribute__name')
+                   .distinct())
+        by_attribute = {name: facet for facet, name in OPTION_ATTRIBUTES.items()}
+        for product_id, option_id, value, attribute in options:
+            add(by_attribute[attribute], str(option_id), value, product_id)
+    return index
+
+
+def get_index(category_id, facets=FACETS):
+    """Return {facet: {'bitmaps': ..., 'labels': ...}} for a scope, building
+    whatever is missing from the cache."""
+    scope = _scope(category_id)
+    names = list(facets) + ['universe']
+    versions = get_versions([_namespace(scope, name) for name in names])
+    keys = {name: versioned_key(_namespace(scope, name), 'index',
+                                version=versions[_namespace(scope, name)])
+            for name in names}
+    cached = cache.get_many(keys.values())
+
+    index = {name: cached[key] for name, key in keys.items() if key in cached}
+    if 'universe' not in index:
+        # Cached bitmaps are positions in the old universe; rebuild them all
+        index = {}
+    missing = [name for name in names if name not in index]
+    if missing:
+        ids = index['universe']['ids'] if index else None
+        built = _build(category_id, [name for name in missing if name != 'universe'], ids)
+        fresh = {name: built[name] for name in missing}
+        cache.set_many({keys[name]: entry for name, entry in fresh.items()}, CACHE_TIMEOUT)
+        index.update(fresh)
+    return index
+
+
+def invalidate(category_ids, facets=FACETS, universe=True):
+    """Drop the cached bitmaps of `facets` for the given categories and for
+    the catalog-wide scope. Pass universe=False when neither the set of
+    visible products nor their prices changed."""
+    scopes = {_scope(category_id) for category_id in category_ids} | {ALL_SCOPE}
+    names = list(facets) + (['universe'] if universe else [])
+    bump(*(_namespace(scope, name) for scope in scopes for name in names))
+
+
+# -- counting -----------------------------------------------------------------
+
+def _selected_bitmap(entry, values):
+    bitmap = 0
+    for value in values:
+        bitmap |= entry['bitmaps'].get(value, 0)
+    return bitmap
+
+
+def _price_range_bitmap(prices, price_min, price_max):
+    start = bisect_left(prices, (Decimal(price_min), -1))
+    bitmap = 0
+    for price, position in prices[start:]:
+        if price > Decimal(price_max):
+            break
+        bitmap |= 1 << position
+    return bitmap
+
+
+def facet_counts(category_id, selection, product_ids=None, price_range=None):
+    """
+    Count every facet value under the current selection. As is usual for
+    multi-select facets, a facet's own selection is ignored when counting
+    that facet, so shoppers can see how many results another value adds.
+    """
+    index = get_index(category_id)
+    base = index['universe']['bitmaps'].get('all', 0)
+    if product_ids is not None:
+        base &= _bits(_positions(index['universe']['ids'], product_ids))
+    if price_range:
+        base &= _price_range_bitmap(index['universe']['prices'], *price_range)
+
+    selected = {facet: _selected_bitmap(index[facet], values)
+                for facet, values in selection.items() if facet in index}
+
+    result = []
+    for facet in FACETS:
+        others = base
+        for other, bitmap in selected.items():
+            if other != facet:
+                others &= bitmap
+
+        entry = index[facet]
+        options = []
+        for value, label in _ordered_values(facet, entry):
+            count = (entry['bitmaps'].get(value, 0) & others).bit_count()
+            chosen = value in selection.get(facet, ())
+            if count or chosen:
+                options.append(FacetOption(value, label, count, chosen))
+        if options:
+            result.append(Facet(facet, FACET_LABELS[facet], options))
+    return result
+
+
+def _ordered_values(facet, entry):
+    if facet == AGE:
+        return [(key, label) for key, label, _, _ in AGE_BUCKETS]
+    if facet == PRICE:
+        return [(key, label) for key, label, _, _ in PRICE_BANDS]
+    return sorted(entry['labels'].items(), key=lambda item: str(item[1]))
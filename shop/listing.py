@@ -0,0 +1,164 @@
+from decimal import Decimal
+
+from django.utils import timezone
+
+from .models import Product, ProductImage, ProductListing, ProductVariant
+from .pricing import offer_price
+
+
+LISTING_FIELDS = [
+    'name', 'category', 'brand', 'gender', 'min_age', 'max_age', 'is_visible',
+    'created_at', 'min_price', 'min_offer_price', 'offer_percentage',
+    'offer_source', 'total_stock', 'default_variant', 'primary_image_url',
+    'primary_image_derivatives', 'rating', 'review_count', 'updated_at',
+]
+
+# Columns that decide which products the home feed lists and in what order
+FEED_FIELDS = ['is_visible', 'min_age', 'max_age', 'gender', 'category_id', 'created_at']
+
+BATCH_SIZE = 1000
+
+
+def listing_rating(rating_sum, review_count):
+    """Average rating to two places, 0 for an unreviewed product."""
+    if not review_count:
+        return Decimal('0')
+    return (Decimal(rating_sum) / review_count).quantize(Decimal('0.01'))
+
+
+def _stock_fields(variants):
+    """(total stock, cheapest variant in stock) for (id, price, stock) tuples."""
+    in_stock = [(price, variant_id)
+                for variant_id, price, stock in variants if stock > 0]
+    return sum(stock for _, _, stock in variants), min(in_stock)[1] if in_stock else None
+
+
+def build_listing(product, variants, image_name, image_derivatives=None):
+    """
+    Build an unsaved ProductListing for `product`.
+
+    `variants` is a list of (id, price, stock) tuples for the product,
+    `image_name` the stored name of its first image (or None) and
+    `image_derivatives` that image's resized copies.
+    """
+    offer_source, offer_percentage = product.get_active_offer()
+
+    min_price = min((price for _, price, _ in variants), default=Decimal('0'))
+    total_stock, default_variant_id = _stock_fields(variants)
+
+    image_url = ''
+    if image_name:
+        image_url = ProductImage._meta.get_field('image').storage.url(image_name)
+
+    return ProductListing(
+        product=product,
+        name=product.name,
+        category_id=product.category_id,
+        brand_id=product.brand_id,
+        gender=product.gender,
+        min_age=product.min_age,
+        max_age=product.max_age,
+        is_visible=product.status == 'Active' and not product.is_deleted,
+        created_at=product.created_at,
+        min_price=min_price,
+        min_offer_price=offer_price(min_price, offer_percentage),
+        offer_percentage=offer_percentage,
+        offer_source=offer_source if offer_percentage else '',
+        total_stock=total_stock,
+        default_variant_id=default_variant_id,
+        primary_image_url=image_url,
+        primary_image_derivatives=image_derivatives or {},
+        rating=listing_rating(product.rating_sum, product.review_count),
+        review_count=product.review_count,
+    )
+
+
+def refresh_listings(product_ids):
+    """
+    Recompute the listing rows for the given products with a fixed number of
+    queries, whatever the number of products. Rows of products that no
+    longer exist are removed.
+
+    Returns (ids of the categories the products were or now are listed in,
+    ids of the products whose FEED_FIELDS changed or whose row was added or
+    removed).
+    """
+    product_ids = {pk for pk in product_ids if pk}
+    if not product_ids:
+        return set(), set()
+
+    before = {product_id: tuple(values) for product_id, *values in (
+        ProductListing.objects.filter(product_id__in=product_ids)
+        .values_list('product_id', *FEED_FIELDS))}
+    category = FEED_FIELDS.index('category_id')
+    categories = {values[category] for values in before.values()}
+    products = list(Product.objects.filter(
+        id__in=product_ids).select_related('category'))
+
+    variants = {}
+    for variant_id, product_id, price, stock in (
+            ProductVariant.objects.filter(product_id__in=product_ids)
+            .values_list('id', 'product_id', 'price', 'stock')):
+        variants.setdefault(product_id, []).append((variant_id, price, stock))
+
+    images = {}
+    for product_id, image_name, derivatives in (
+            ProductImage.objects.filter(product_id__in=product_ids)
+            .order_by('id').values_list('product_id', 'image', 'derivatives')):
+        images.setdefault(product_id, (image_name, derivatives))
+
+    rows = [
+        build_listing(product, variants.get(product.id, []), *images.get(product.id, (None, None)))
+        for product in products
+    ]
+    ProductListing.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=LISTING_FIELDS,
+    )
+
+    moved = {row.product_id for row in rows
+             if before.get(row.product_id) != tuple(getattr(row, field) for field in FEED_FIELDS)}
+    missing = product_ids - {product.id for product in products}
+    if missing:
+        ProductListing.objects.filter(product_id__in=missing).delete()
+        moved.update(missing & before.keys())
+
+    categories.update(product.category_id for product in products)
+    categories.discard(None)
+    return categories, moved
+
+
+def refresh_listing_stock(product_ids):
+    """
+    Update only the stock columns (total_stock, default_variant) of the
+    listing rows of the given products, for stock movements that can't
+    change anything else. Returns the ids of the categories of the rows.
+    """
+    variants = {}
+    for variant_id, product_id, price, stock in (
+            ProductVariant.objects.filter(product_id__in=product_ids)
+            .values_list('id', 'product_id', 'price', 'stock')):
+        variants.setdefault(product_id, []).append((variant_id, price, stock))
+
+    listings = list(ProductListing.objects.filter(product_id__in=product_ids).only(
+        'product_id', 'category_id', 'total_stock', 'default_variant'))
+    now = timezone.now()
+    for listing in listings:
+        listing.total_stock, listing.default_variant_id = _stock_fields(
+            variants.get(listing.product_id, []))
+        listing.updated_at = now
+    ProductListing.objects.bulk_update(
+        listings, ['total_stock', 'default_variant', 'updated_at'], batch_size=BATCH_SIZE)
+    return {listing.category_id for listing in listings if listing.category_id}
+
+
+def rebuild_all_listings(batch_size=BATCH_SIZE):
+    """Rebuild every listing row in batches; returns the number of products."""
+    product_ids = list(Product.objects.order_by(
+        'id').values_list('id', flat=True))
+    for start in range(0, len(product_ids), batch_size):
+        refresh_listings(product_ids[start:start + batch_size])
+    ProductListing.objects.exclude(product_id__in=Product.objects.all()).delete()
+    return len(product_ids)
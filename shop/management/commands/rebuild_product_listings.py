@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from shop.listing import BATCH_SIZE, rebuild_all_listings
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized product listing table from the catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        count = rebuild_all_listings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt listings for {count} products."))
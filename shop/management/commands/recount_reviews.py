@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shop.reviews import recount
+
+
+class Command(BaseCommand):
+    help = "Rebuild the review count, rating sum and histogram of every product from its reviews."
+
+    def handle(self, *args, **options):
+        count = recount()
+        self.stdout.write(self.style.SUCCESS(f"Recounted reviews of {count} products."))
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_listings(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductListing = apps.get_model('shop', 'ProductListing')
+    ProductImage = apps.get_model('shop', 'ProductImage')
+    storage = ProductImage._meta.get_field('image').storage
+
+    rows = []
+    for product in Product.objects.select_related('category').iterator():
+        product_offer = product.product_offer_percentage
+        category_offer = product.category.offer_percentage if product.category else 0
+        if product_offer >= category_offer:
+            offer_source, offer = 'Product Offer', product_offer
+        else:
+            offer_source, offer = 'Category Offer', category_offer
+
+        variants = list(product.variants.values_list('id', 'price', 'stock'))
+        min_price = min((price for _, price, _ in variants), default=0)
+        in_stock = [(price, pk) for pk, price, stock in variants if stock > 0]
+        image = product.images.order_by('id').first()
+
+        rows.append(ProductListing(
+            product=product,
+            name=product.name,
+            category_id=product.category_id,
+            brand_id=product.brand_id,
+            gender=product.gender,
+            min_age=product.min_age,
+            max_age=product.max_age,
+            is_visible=product.status == 'Active' and not product.is_deleted,
+            created_at=product.created_at,
+            min_price=min_price,
+            min_offer_price=min_price - (min_price * offer / 100),
+            offer_percentage=offer,
+            offer_source=offer_source if offer else '',
+            total_stock=sum(stock for _, _, stock in variants),
+            default_variant_id=min(in_stock)[1] if in_stock else None,
+            primary_image_url=storage.url(image.image.name) if image else '',
+        ))
+    ProductListing.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0030_brand_logo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductListing',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='shop.product')),
+                ('name', models.CharField(max_length=255)),
+                ('gender', models.CharField(default='Unisex', max_length=10)),
+                ('min_age', models.PositiveIntegerField(blank=True, null=True)),
+                ('max_age', models.PositiveIntegerField(blank=True, null=True)),
+                ('is_visible', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField()),
+                ('min_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('min_offer_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('offer_percentage', models.PositiveIntegerField(default=0)),
+                ('offer_source', models.CharField(blank=True, max_length=20)),
+                ('total_stock', models.PositiveIntegerField(default=0)),
+                ('primary_image_url', models.CharField(blank=True, max_length=500)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('brand', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shop.brand')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shop.category')),
+                ('default_variant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shop.productvariant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['is_visible', '-created_at'], name='listing_visible_created_idx'), models.Index(fields=['is_visible', 'min_price'], name='listing_visible_price_idx'), models.Index(fields=['is_visible', 'name'], name='listing_visible_name_idx'), models.Index(fields=['category', 'is_visible', '-created_at'], name='listing_category_created_idx'), models.Index(fields=['category', 'is_visible', 'min_price'], name='listing_category_price_idx')],
+            },
+        ),
+        migrations.RunPython(populate_listings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_documents(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductSearchDocument = apps.get_model('shop', 'ProductSearchDocument')
+    ProductVariant = apps.get_model('shop', 'ProductVariant')
+    VariantOptions = ProductVariant.options.through
+
+    documents = []
+    for product in Product.objects.select_related('category', 'brand').iterator():
+        options = ' '.join(sorted(set(VariantOptions.objects.filter(
+            productvariant__product_id=product.id).values_list('variantoption__value', flat=True))))
+        category = product.category.name if product.category else ''
+        brand = product.brand.name if product.brand else ''
+        documents.append(ProductSearchDocument(
+            product=product,
+            name=product.name,
+            category=category,
+            brand=brand,
+            options=options,
+            description=product.description or '',
+            document=' '.join(filter(None, [
+                product.name, category, brand, options, product.description])),
+            is_visible=product.status == 'Active' and not product.is_deleted,
+        ))
+    ProductSearchDocument.objects.bulk_create(documents, batch_size=1000)
+
+
+def postgres_indexes(apps):
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    return [
+        # Same expression as shop.search.postgres.DOCUMENT_VECTOR
+        GinIndex(SearchVector('document', config='english'),
+                 name='search_document_fts_idx'),
+        GinIndex(fields=['name'], opclasses=['gin_trgm_ops'],
+                 name='search_name_trgm_idx'),
+    ]
+
+
+def create_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    model = apps.get_model('shop', 'ProductSearchDocument')
+    for index in postgres_indexes(apps):
+        schema_editor.add_index(model, index)
+
+
+def drop_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    model = apps.get_model('shop', 'ProductSearchDocument')
+    for index in postgres_indexes(apps):
+        schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0031_product_listing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='shop.product')),
+                ('name', models.CharField(max_length=255)),
+                ('category', models.CharField(blank=True, max_length=255)),
+                ('brand', models.CharField(blank=True, max_length=100)),
+                ('options', models.TextField(blank=True)),
+                ('description', models.TextField(blank=True)),
+                ('document', models.TextField(blank=True)),
+                ('is_visible', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['is_visible'], name='search_visible_idx')],
+            },
+        ),
+        migrations.RunPython(populate_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_postgres_indexes, drop_postgres_indexes),
+    ]
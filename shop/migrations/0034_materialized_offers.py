@@ -0,0 +1,56 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:26
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+
+
+def populate_offers(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductVariant = apps.get_model('shop', 'ProductVariant')
+
+    products = []
+    for product in Product.objects.select_related('category'):
+        category_offer = product.category.offer_percentage if product.category else 0
+        if product.product_offer_percentage >= category_offer:
+            product.offer_source = 'Product Offer'
+            product.offer_percentage = product.product_offer_percentage
+        else:
+            product.offer_source = 'Category Offer'
+            product.offer_percentage = category_offer
+        products.append(product)
+    Product.objects.bulk_update(
+        products, ['offer_percentage', 'offer_source'], batch_size=1000)
+
+    percentages = {product.id: product.offer_percentage for product in products}
+    variants = list(ProductVariant.objects.only('id', 'product_id', 'price'))
+    for variant in variants:
+        discounted = variant.price - variant.price * percentages[variant.product_id] / 100
+        variant.offer_price = discounted.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    ProductVariant.objects.bulk_update(variants, ['offer_price'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0033_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='offer_percentage',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='offer_source',
+            field=models.CharField(default='Product Offer', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='offer_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(populate_offers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:02
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_review_aggregates(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductListing = apps.get_model('shop', 'ProductListing')
+    Review = apps.get_model('shop', 'Review')
+
+    counts = {row.pop('product_id'): row for row in (
+        Review.objects.values('product_id').annotate(
+            review_count=Count('id'), rating_sum=Sum('rating'),
+            **{f'rating_{stars}': Count('id', filter=Q(rating=stars)) for stars in range(1, 6)})
+        .order_by())}
+    fields = ['review_count', 'rating_sum', *(f'rating_{stars}' for stars in range(1, 6))]
+    products = list(Product.objects.filter(id__in=counts).only('id'))
+    for product in products:
+        for field in fields:
+            setattr(product, field, counts[product.id][field] or 0)
+    Product.objects.bulk_update(products, fields, batch_size=1000)
+
+    listings = list(ProductListing.objects.filter(product_id__in=counts).only('product_id'))
+    for listing in listings:
+        row = counts[listing.product_id]
+        listing.review_count = row['review_count']
+        listing.rating = (Decimal(row['rating_sum']) / row['review_count']).quantize(Decimal('0.01'))
+    ProductListing.objects.bulk_update(listings, ['rating', 'review_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0034_materialized_offers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productlisting',
+            name='rating',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='productlisting',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['is_visible', '-rating', '-review_count'], name='listing_visible_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_idx'),
+        ),
+        migrations.RunPython(populate_review_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0035_review_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductViewBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hour'], name='product_view_bucket_hour_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'hour'), name='product_view_bucket_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:40
+
+import utils.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0037_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='brand',
+            name='logo',
+            field=models.ImageField(blank=True, null=True, storage=utils.storage.ContentAddressedStorage(), upload_to='brand_logos/'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=utils.storage.ContentAddressedStorage(), upload_to='products/'),
+        ),
+        migrations.AlterField(
+            model_name='productvariant',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=utils.storage.ContentAddressedStorage(), upload_to='variant_images/'),
+        ),
+    ]
@@ -1,9 +1,11 @@
 from django.conf import settings
 from django.utils.text import slugify
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from utils.storage import blob_storage
+
 
 User = get_user_model()
 
@@ -65,24 +67,64 @@ class Product(models.Model):
     views = models.PositiveIntegerField(default=0)
     is_featured = models.BooleanField(default=False)
     is_listed = models.BooleanField(default=True)
+    # Effective offer, the better of the product and category offer;
+    # maintained by save() and shop.offers
+    offer_percentage = models.PositiveIntegerField(default=0, editable=False)
+    offer_source = models.CharField(max_length=20, default='Product Offer', editable=False)
+    # Running review aggregates, maintained by shop.reviews
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super().from_db(db, field_names, values)
+        product._saved_offer = product.__dict__.get('offer_percentage')
+        return product
 
-    def get_active_offer(self):
-        product_offer = self.product_offer_percentage
+    def save(self, *args, **kwargs):
+        from .pricing import best_offer
         category_offer = self.category.offer_percentage if self.category else 0
-        if product_offer >= category_offer:
-            return ('Product Offer', product_offer)
-        return ('Category Offer', category_offer)
+        self.offer_source, self.offer_percentage = best_offer(
+            self.product_offer_percentage, category_offer)
+        # Read by shop.signals.product_saved to reprice the variants
+        self._offer_changed = self.offer_percentage != getattr(self, '_saved_offer', None)
+        super().save(*args, **kwargs)
+        self._saved_offer = self.offer_percentage
+
+    def get_active_offer(self):
+        return (self.offer_source, self.offer_percentage)
 
     def __str__(self):
         return self.name
 
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return 0
+        return round(self.rating_sum / self.review_count, 1)
+
+    @property
+    def rating_histogram(self):
+        """[(stars, count, percent)] from 5 stars down to 1."""
+        return [(stars, count, round(count * 100 / self.review_count) if self.review_count else 0)
+                for stars in range(5, 0, -1)
+                for count in [getattr(self, f'rating_{stars}')]]
+
     @property
     def total_stock(self):
         return sum(variant.stock for variant in self.variants.all())
 
     @property
     def primary_image(self):
-        first_image = self.images.first()
+        if 'images' in getattr(self, '_prefetched_objects_cache', {}):
+            first_image = min(self.images.all(), key=lambda image: image.pk, default=None)
+        else:
+            first_image = self.images.first()
         return first_image.image.url if first_image else '/static/images/default-img.jpg'
 
     @property
@@ -99,7 +141,9 @@ class Product(models.Model):
 class ProductImage(models.Model):
     product = models.ForeignKey(
         Product, related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='products/')
+    image = models.ImageField(upload_to='products/', storage=blob_storage)
+    # Resized WebP/JPEG copies, written by utils.images
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     def save(self, *args, **kwargs):
         # Save original first to get file path
@@ -133,19 +177,25 @@ class ProductVariant(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
     image = models.ImageField(
-        upload_to='variant_images/', blank=True, null=True)
+        upload_to='variant_images/', storage=blob_storage, blank=True, null=True)
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    # Price after the product's effective offer; see shop.offers
+    offer_price = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0, editable=False)
 
     class Meta:
         unique_together = ('product', 'sku')
 
+    def save(self, *args, **kwargs):
+        from .pricing import offer_price
+        self.offer_price = offer_price(self.price, self.product.offer_percentage)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.product.name} - {', '.join([opt.value for opt in self.options.all()])}"
 
     def get_offer_price(self):
-        product_offer = self.product.product_offer_percentage
-        category_offer = self.product.category.offer_percentage if self.product.category else 0
-        best_offer = max(product_offer, category_offer)
-        return self.price - (self.price * best_offer / 100)
+        return self.offer_price
 
 
 class Wishlist(models.Model):
@@ -159,6 +209,10 @@ class Wishlist(models.Model):
 
     class Meta:
         unique_together = ('user', 'variant')
+        indexes = [
+            models.Index(fields=['user', '-added_at', '-id'],
+                         name='wishlist_user_added_idx'),
+        ]
         ordering = ['-added_at']
 
     def __str__(self):
@@ -193,12 +247,131 @@ class Review(models.Model):
     rating = models.IntegerField(default=5, validators=[
                                  MinValueValidator(1), MaxValueValidator(5)])
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', '-created_at', '-id'],
+                         name='review_product_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The rating as stored, so saving a changed one moves the histogram
+        instance._saved_rating = instance.__dict__.get('rating')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The product's aggregates move in the same transaction (shop.signals)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
 
 class Brand(models.Model):
     name = models.CharField(max_length=100, unique=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    logo = models.ImageField(upload_to='brand_logos/', blank=True, null=True)
+    logo = models.ImageField(upload_to='brand_logos/', storage=blob_storage, blank=True, null=True)
+    logo_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.name
+
+
+class ProductListing(models.Model):
+    """
+    Denormalized catalog row for a product, kept in sync by shop.signals.
+    The shop grid filters and sorts on these columns instead of aggregating
+    over variants and images on every request.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='listing')
+    name = models.CharField(max_length=255)
+    category = models.ForeignKey(
+        Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    brand = models.ForeignKey(
+        Brand, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    gender = models.CharField(max_length=10, default='Unisex')
+    min_age = models.PositiveIntegerField(null=True, blank=True)
+    max_age = models.PositiveIntegerField(null=True, blank=True)
+    is_visible = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    min_offer_price = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0)
+    offer_percentage = models.PositiveIntegerField(default=0)
+    offer_source = models.CharField(max_length=20, blank=True)
+    total_stock = models.PositiveIntegerField(default=0)
+    default_variant = models.ForeignKey(
+        ProductVariant, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    primary_image_url = models.CharField(max_length=500, blank=True)
+    primary_image_derivatives = models.JSONField(default=dict, blank=True)
+    rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_visible', '-created_at'],
+                         name='listing_visible_created_idx'),
+            models.Index(fields=['is_visible', 'min_price'],
+                         name='listing_visible_price_idx'),
+            models.Index(fields=['is_visible', 'name'],
+                         name='listing_visible_name_idx'),
+            models.Index(fields=['category', 'is_visible', '-created_at'],
+                         name='listing_category_created_idx'),
+            models.Index(fields=['category', 'is_visible', 'min_price'],
+                         name='listing_category_price_idx'),
+            models.Index(fields=['is_visible', '-rating', '-review_count'],
+                         name='listing_visible_rating_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class ProductSearchDocument(models.Model):
+    """
+    Flattened searchable text for a product, maintained by shop.signals and
+    read by the backends in shop.search.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    name = models.CharField(max_length=255)
+    category = models.CharField(max_length=255, blank=True)
+    brand = models.CharField(max_length=100, blank=True)
+    options = models.TextField(blank=True)
+    description = models.TextField(blank=True)
+    document = models.TextField(blank=True)
+    is_visible = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_visible'], name='search_visible_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class ProductViewBucket(models.Model):
+    """Page views of a product within one hour, written by shop.popularity."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    hour = models.DateTimeField()
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'hour'], name='product_view_bucket_key'),
+        ]
+        indexes = [
+            models.Index(fields=['hour'], name='product_view_bucket_hour_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.hour:%Y-%m-%d %H:00} product {self.product_id}: {self.views} views'
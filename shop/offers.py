@@ -0,0 +1,50 @@
+"""
+Materialized offers.
+
+Product.offer_percentage/offer_source hold the better of the product and
+category offer, and ProductVariant.offer_price the resulting price, so
+readers never recompute them. Single saves keep them current in the model
+`save` methods; `refresh_offers` rewrites them in bulk for any number of
+products, which is what a category offer change needs.
+"""
+from django.db.models import Case, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Category, Product, ProductVariant
+from .pricing import CATEGORY_OFFER, PRODUCT_OFFER, offer_price
+
+
+BATCH_SIZE = 1000
+
+
+def refresh_offers(products, batch_size=BATCH_SIZE):
+    """
+    Recompute the stored offers of a Product queryset and its variants: one
+    UPDATE for the products, one SELECT for the variants and a batched
+    bulk_update of the variant prices that actually changed.
+    """
+    category_offer = Coalesce(Subquery(
+        Category.objects.filter(pk=OuterRef('category_id')).values('offer_percentage')[:1]),
+        Value(0))
+    products.update(
+        offer_percentage=Greatest(F('product_offer_percentage'), category_offer),
+        offer_source=Case(
+            When(product_offer_percentage__gte=category_offer, then=Value(PRODUCT_OFFER)),
+            default=Value(CATEGORY_OFFER),
+        ),
+    )
+
+    # Prices are computed in Python so they match pricing.offer_price exactly
+    changed = []
+    for variant_id, price, current, percentage in (
+            ProductVariant.objects.filter(product__in=products.values('pk'))
+            .values_list('id', 'price', 'offer_price', 'product__offer_percentage')):
+        new_price = offer_price(price, percentage)
+        if new_price != current:
+            changed.append(ProductVariant(id=variant_id, offer_price=new_price))
+    ProductVariant.objects.bulk_update(changed, ['offer_price'], batch_size=batch_size)
+    return len(changed)
+
+
+def rebuild_all_offers():
+    return refresh_offers(Product.objects.all())
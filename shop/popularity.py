@@ -0,0 +1,150 @@
+"""
+Product page views and the trending list.
+
+`record_view` only adds to an in-process buffer. Every FLUSH_INTERVAL
+seconds (or FLUSH_THRESHOLD buffered views, whichever comes first) the
+request that notices hands a flush to a background thread, once its
+transaction commits, and carries on. The flush swaps the buffer out and
+moves Product.views with one F() UPDATE per distinct increment rather than
+a write per view, and adds the same counts to hourly ProductViewBucket rows.
+Views still buffered when a process dies are lost; the counts are
+popularity signals, not an audit trail.
+
+Trending products are those with the most views over the last
+TRENDING_HOURS of buckets. The ranked ids are cached for a few minutes and
+feed the home page and the shop's 'trending' sort.
+"""
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from utils.cache import get_or_set
+
+from .models import Product, ProductViewBucket
+
+
+FLUSH_INTERVAL = 30  # seconds
+FLUSH_THRESHOLD = 1000
+TRENDING_HOURS = 24
+TRENDING_SIZE = 50
+TRENDING_TIMEOUT = 5 * 60
+RETENTION = timedelta(days=7)
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='views')
+
+_lock = threading.Lock()
+_buffer = Counter()  # (product_id, hour) -> views
+_last_flush = time.monotonic()
+_scheduled_at = None  # when a flush was handed to EXECUTOR and hasn't run yet
+
+
+def _hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def record_view(product_id):
+    """Count a product page view; schedules a flush when one is due."""
+    global _scheduled_at
+    with _lock:
+        _buffer[product_id, _hour(timezone.now())] += 1
+        now = time.monotonic()
+        due = (len(_buffer) >= FLUSH_THRESHOLD or now - _last_flush >= FLUSH_INTERVAL)
+        # Schedule once; again only if that flush never ran (rolled back)
+        due = due and (_scheduled_at is None or now - _scheduled_at >= FLUSH_INTERVAL)
+        if due:
+            _scheduled_at = now
+    if due:
+        transaction.on_commit(lambda: EXECUTOR.submit(_work))
+
+
+def _work():
+    try:
+        flush()
+    except Exception:
+        logger.exception('Flushing product views failed')
+    finally:
+        # Worker threads open their own connections
+        connections.close_all()
+
+
+def _take():
+    global _buffer, _last_flush, _scheduled_at
+    with _lock:
+        pending, _buffer = _buffer, Counter()
+        _last_flush, _scheduled_at = time.monotonic(), None
+    return pending
+
+
+def _add_to_buckets(counts):
+    existing = set(ProductViewBucket.objects.filter(
+        hour__in={hour for _, hour in counts},
+        product_id__in={product_id for product_id, _ in counts},
+    ).values_list('product_id', 'hour'))
+    steps = defaultdict(list)
+    for (product_id, hour), views in counts.items():
+        if (product_id, hour) in existing:
+            steps[hour, views].append(product_id)
+    for (hour, views), product_ids in steps.items():
+        ProductViewBucket.objects.filter(hour=hour, product_id__in=product_ids).update(
+            views=F('views') + views)
+
+    missing = [ProductViewBucket(product_id=product_id, hour=hour, views=views)
+               for (product_id, hour), views in counts.items() if (product_id, hour) not in existing]
+    if not missing:
+        return
+    try:
+        with transaction.atomic():
+            ProductViewBucket.objects.bulk_create(missing)
+    except IntegrityError:
+        # Some were created by another process since the lookup above
+        for bucket in missing:
+            updated = ProductViewBucket.objects.filter(
+                product_id=bucket.product_id, hour=bucket.hour,
+            ).update(views=F('views') + bucket.views)
+            if not updated:
+                bucket.save()
+
+
+def flush():
+    """Write the buffered views to the database. Returns the number of views."""
+    pending = _take()
+    if not pending:
+        return 0
+    live = set(Product.objects.filter(
+        id__in={product_id for product_id, _ in pending}).values_list('id', flat=True))
+    pending = Counter({key: views for key, views in pending.items() if key[0] in live})
+
+    totals = Counter()
+    for (product_id, _), views in pending.items():
+        totals[product_id] += views
+    by_delta = defaultdict(list)
+    for product_id, views in totals.items():
+        by_delta[views].append(product_id)
+
+    with transaction.atomic():
+        for views, product_ids in by_delta.items():
+            Product.objects.filter(id__in=product_ids).update(views=F('views') + views)
+        _add_to_buckets(pending)
+        ProductViewBucket.objects.filter(hour__lt=timezone.now() - RETENTION).delete()
+    return sum(totals.values())
+
+
+def trending_ids(limit=TRENDING_SIZE, hours=TRENDING_HOURS):
+    """Ids of the most viewed visible products of the last `hours`, most
+    viewed first."""
+    def build():
+        since = _hour(timezone.now()) - timedelta(hours=hours - 1)
+        return list(ProductViewBucket.objects.filter(
+            hour__gte=since, product__listing__is_visible=True,
+        ).values('product_id').annotate(total=Sum('views'))
+            .order_by('-total', 'product_id').values_list('product_id', flat=True)[:limit])
+    return get_or_set('trending', [hours, limit], build, TRENDING_TIMEOUT)
@@ -0,0 +1,75 @@
+"""
+Batch variant pricing.
+
+`price_variants` reads the stored offer prices of any number of variants in
+a single query, so carts and listings price in O(1) queries instead of
+walking variant.product.category once per row. The stored values are
+maintained by shop.offers.
+"""
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+from .models import ProductVariant
+
+
+PRODUCT_OFFER = 'Product Offer'
+CATEGORY_OFFER = 'Category Offer'
+
+VariantPrice = namedtuple(
+    'VariantPrice', ['unit_price', 'offer_price', 'offer_source', 'offer_percentage'])
+
+
+def best_offer(product_percentage, category_percentage):
+    """Return (source, percentage) of the better offer; ties go to the
+    product offer, as in Product.get_active_offer."""
+    category_percentage = category_percentage or 0
+    if product_percentage >= category_percentage:
+        return PRODUCT_OFFER, product_percentage
+    return CATEGORY_OFFER, category_percentage
+
+
+def offer_price(price, percentage):
+    """Price after a percentage discount, rounded to the paisa."""
+    price = Decimal(price)
+    discounted = price - (price * percentage / 100)
+    return discounted.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def price_variants(variants):
+    """
+    Map variant id -> VariantPrice for `variants` (instances or ids).
+    Unknown ids are left out of the result.
+    """
+    variant_ids = {getattr(variant, 'pk', variant) for variant in variants}
+    if not variant_ids:
+        return {}
+
+    rows = ProductVariant.objects.filter(id__in=variant_ids).values_list(
+        'id', 'price', 'offer_price', 'product__offer_percentage',
+        'product__offer_source')
+    prices = {}
+    for variant_id, price, discounted, percentage, source in rows:
+        prices[variant_id] = VariantPrice(
+            unit_price=price,
+            offer_price=discounted,
+            offer_source=source if percentage else '',
+            offer_percentage=percentage,
+        )
+    return prices
+
+
+def price_cart(cart_items):
+    """
+    Price a list of CartItems. Sets `unit_price`, `offer` and `total_price`
+    on each item and returns (prices, subtotal).
+    """
+    cart_items = list(cart_items)
+    prices = price_variants(item.product_variant_id for item in cart_items)
+    subtotal = Decimal('0')
+    for item in cart_items:
+        price = prices.get(item.product_variant_id)
+        item.offer = price
+        item.unit_price = price.offer_price if price else Decimal('0')
+        item.total_price = item.unit_price * item.quantity
+        subtotal += item.total_price
+    return prices, subtotal
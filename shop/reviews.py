@@ -0,0 +1,75 @@
+"""
+Running review aggregates on Product.
+
+Each product carries its review count, the sum of its ratings and a 1-5 star
+histogram, moved by F() updates as reviews are created, re-rated or deleted
+(see shop/signals.py) in the same transaction as the review itself. The
+product's listing row gets the new average and count in the same step, so
+the catalog grid shows and sorts by rating without touching Review, and the
+product page needs no aggregate over its reviews. `recount` recomputes the
+aggregates from the reviews.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .listing import listing_rating
+from .models import Product, ProductListing, Review
+
+
+STARS = range(1, 6)
+AGGREGATE_FIELDS = ['review_count', 'rating_sum', *(f'rating_{stars}' for stars in STARS)]
+
+
+def _sync_listings(product_ids):
+    aggregates = {product_id: (review_count, rating_sum) for product_id, review_count, rating_sum
+                  in Product.objects.filter(id__in=product_ids)
+                  .values_list('id', 'review_count', 'rating_sum')}
+    listings = list(ProductListing.objects.filter(product_id__in=aggregates).only('product_id'))
+    for listing in listings:
+        review_count, rating_sum = aggregates[listing.product_id]
+        listing.review_count = review_count
+        listing.rating = listing_rating(rating_sum, review_count)
+    ProductListing.objects.bulk_update(listings, ['rating', 'review_count'], batch_size=1000)
+
+
+def rating_changed(product_id, old, new):
+    """Move a product's aggregates for one review going from rating `old`
+    to `new`; None for `old` is a new review and for `new` a deleted one."""
+    if old == new:
+        return
+    changes = {}
+    if old is not None:
+        changes['review_count'] = F('review_count') - 1
+        changes['rating_sum'] = F('rating_sum') - old
+        changes[f'rating_{old}'] = F(f'rating_{old}') - 1
+    if new is not None:
+        changes['review_count'] = changes.get('review_count', F('review_count')) + 1
+        changes['rating_sum'] = changes.get('rating_sum', F('rating_sum')) + new
+        changes[f'rating_{new}'] = F(f'rating_{new}') + 1
+    with transaction.atomic():
+        Product.objects.filter(pk=product_id).update(**changes)
+        _sync_listings([product_id])
+
+
+def recount(product_ids=None):
+    """Recompute the aggregates of the given products (all if None) from
+    their reviews. Returns the number of products updated."""
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+    counts = {row.pop('product_id'): row for row in (
+        Review.objects.filter(product__in=products).values('product_id').annotate(
+            review_count=Count('id'), rating_sum=Sum('rating'),
+            **{f'rating_{stars}': Count('id', filter=Q(rating=stars)) for stars in STARS})
+        .order_by())}
+
+    rows = []
+    for product in products.only('id'):
+        row = counts.get(product.id, {})
+        for field in AGGREGATE_FIELDS:
+            setattr(product, field, row.get(field) or 0)
+        rows.append(product)
+    with transaction.atomic():
+        Product.objects.bulk_update(rows, AGGREGATE_FIELDS, batch_size=1000)
+        _sync_listings([product.id for product in rows])
+    return len(rows)
@@ -0,0 +1,74 @@
+"""
+Product search.
+
+Callers use `search`, `autocomplete` and `index_products`; the backend is
+chosen by the SEARCH_BACKEND setting (a dotted path) and otherwise defaults
+to PostgreSQL full-text search on Postgres and the in-memory inverted index
+everywhere else.
+"""
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from shop.models import Product, ProductSearchDocument
+
+from .documents import save_documents
+
+
+POSTGRES_BACKEND = 'shop.search.postgres.PostgresSearchBackend'
+MEMORY_BACKEND = 'shop.search.memory.InMemorySearchBackend'
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'SEARCH_BACKEND', None)
+                if not path:
+                    path = POSTGRES_BACKEND if connection.vendor == 'postgresql' else MEMORY_BACKEND
+                _backend = import_string(path)()
+    return _backend
+
+
+def search(query, limit=50):
+    """Return SearchHit(product_id, score) tuples, best match first."""
+    return get_backend().search(query, limit=limit)
+
+
+def search_product_ids(query, limit=50):
+    return [hit.product_id for hit in search(query, limit=limit)]
+
+
+def autocomplete(prefix, limit=8):
+    """Return (product_id, name) suggestions for a partially typed query."""
+    return get_backend().autocomplete(prefix, limit=limit)
+
+
+def index_products(product_ids):
+    """Refresh the search documents of the given products."""
+    documents, removed = save_documents(product_ids)
+    backend = get_backend()
+    backend.update(documents)
+    if removed:
+        backend.remove(removed)
+
+
+def rebuild_index(batch_size=1000):
+    """Rebuild every search document; returns the number of products."""
+    product_ids = list(Product.objects.order_by(
+        'id').values_list('id', flat=True))
+    for start in range(0, len(product_ids), batch_size):
+        save_documents(product_ids[start:start + batch_size])
+    ProductSearchDocument.objects.exclude(
+        product_id__in=Product.objects.all()).delete()
+
+    backend = get_backend()
+    if hasattr(backend, 'reset'):
+        backend.reset()
+    return len(product_ids)
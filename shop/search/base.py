@@ -0,0 +1,35 @@
+import re
+from collections import namedtuple
+
+
+SearchHit = namedtuple('SearchHit', ['product_id', 'score'])
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class BaseSearchBackend:
+    """
+    Interface implemented by the search backends.
+
+    `search` returns SearchHit tuples ordered by descending score; the last
+    query term is matched as a prefix so results can be shown while typing.
+    `update` and `remove` are called with saved ProductSearchDocument rows
+    whenever the catalog changes.
+    """
+
+    def search(self, query, limit=50):
+        raise NotImplementedError
+
+    def autocomplete(self, prefix, limit=8):
+        """Return up to `limit` (product_id, name) suggestions."""
+        raise NotImplementedError
+
+    def update(self, documents):
+        pass
+
+    def remove(self, product_ids):
+        pass
@@ -0,0 +1,62 @@
+from shop.models import Product, ProductSearchDocument, ProductVariant
+
+
+DOCUMENT_FIELDS = [
+    'name', 'category', 'brand', 'options', 'description', 'document',
+    'is_visible', 'updated_at',
+]
+
+
+def build_documents(product_ids):
+    """Return unsaved search documents for the given products (3 queries)."""
+    products = (Product.objects.filter(id__in=product_ids)
+                .select_related('category', 'brand'))
+
+    options = {}
+    VariantOptions = ProductVariant.options.through
+    for product_id, value in (
+            VariantOptions.objects
+            .filter(productvariant__product_id__in=product_ids)
+            .values_list('productvariant__product_id', 'variantoption__value')
+            .distinct()):
+        options.setdefault(product_id, []).append(value)
+
+    documents = []
+    for product in products:
+        option_text = ' '.join(sorted(options.get(product.id, [])))
+        category = product.category.name if product.category else ''
+        brand = product.brand.name if product.brand else ''
+        documents.append(ProductSearchDocument(
+            product=product,
+            name=product.name,
+            category=category,
+            brand=brand,
+            options=option_text,
+            description=product.description or '',
+            document=' '.join(filter(None, [
+                product.name, category, brand, option_text, product.description])),
+            is_visible=product.status == 'Active' and not product.is_deleted,
+        ))
+    return documents
+
+
+def save_documents(product_ids):
+    """
+    Upsert the documents of the given products and drop those of deleted
+    products. Returns (saved documents, removed product ids).
+    """
+    product_ids = {pk for pk in product_ids if pk}
+    if not product_ids:
+        return [], set()
+
+    documents = build_documents(product_ids)
+    ProductSearchDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=DOCUMENT_FIELDS,
+    )
+    removed = product_ids - {doc.product_id for doc in documents}
+    if removed:
+        ProductSearchDocument.objects.filter(product_id__in=removed).delete()
+    return documents, removed
@@ -0,0 +1,203 @@
+import math
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from shop.models import ProductSearchDocument
+
+from .base import BaseSearchBackend, SearchHit, tokenize
+
+
+FIELD_WEIGHTS = {
+    'name': 4.0,
+    'category': 2.0,
+    'brand': 2.0,
+    'options': 1.5,
+    'description': 1.0,
+}
+PREFIX_PENALTY = 0.8
+FUZZY_PENALTY = 0.5
+MAX_EXPANSIONS = 50
+
+
+def trigrams(term):
+    padded = f'${term}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(term):
+    if len(term) < 3:
+        return 0
+    return 1 if len(term) < 6 else 2
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance, or limit + 1 once it is known to exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class InMemorySearchBackend(BaseSearchBackend):
+    """
+    Inverted index held in process memory, for SQLite and tests.
+
+    The index is loaded from ProductSearchDocument on first use and then kept
+    current through `update`/`remove`. Each process holds its own copy, so
+    writes made by other processes are only picked up after a restart.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._postings = defaultdict(dict)   # term -> {product_id: weight}
+        self._doc_terms = {}                 # product_id -> set of terms
+        self._names = {}                     # product_id -> product name
+        self._vocabulary = []                # sorted terms, for prefix scans
+        self._trigrams = defaultdict(set)    # trigram -> terms
+
+    # -- index maintenance -------------------------------------------------
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for document in ProductSearchDocument.objects.filter(is_visible=True).iterator():
+                self._add(document)
+            self._loaded = True
+
+    def _add(self, document):
+        self._discard(document.product_id)
+        weights = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(getattr(document, field)):
+                weights[term] += weight
+
+        for term, weight in weights.items():
+            if term not in self._postings:
+                insort(self._vocabulary, term)
+                for gram in trigrams(term):
+                    self._trigrams[gram].add(term)
+            self._postings[term][document.product_id] = weight
+        self._doc_terms[document.product_id] = set(weights)
+        self._names[document.product_id] = document.name
+
+    def _discard(self, product_id):
+        for term in self._doc_terms.pop(product_id, ()):
+            postings = self._postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect_left(self._vocabulary, term)]
+                for gram in trigrams(term):
+                    self._trigrams[gram].discard(term)
+        self._names.pop(product_id, None)
+
+    def update(self, documents):
+        with self._lock:
+            if not self._loaded:
+                return
+            for document in documents:
+                if document.is_visible:
+                    self._add(document)
+                else:
+                    self._discard(document.product_id)
+
+    def remove(self, product_ids):
+        with self._lock:
+            if not self._loaded:
+                return
+            for product_id in product_ids:
+                self._discard(product_id)
+
+    def reset(self):
+        """Forget the index; it is reloaded from the database on next use."""
+        with self._lock:
+            self._loaded = False
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._names.clear()
+            self._vocabulary.clear()
+            self._trigrams.clear()
+
+    # -- querying ----------------------------------------------------------
+
+    def _idf(self, term):
+        return math.log(1 + len(self._doc_terms) / len(self._postings[term]))
+
+    def _expand(self, term, prefix):
+        """Map each index term matching `term` to a score multiplier."""
+        expansions = {}
+        if term in self._postings:
+            expansions[term] = 1.0
+
+        if prefix:
+            start = bisect_left(self._vocabulary, term)
+            for candidate in self._vocabulary[start:start + MAX_EXPANSIONS]:
+                if not candidate.startswith(term):
+                    break
+                expansions.setdefault(candidate, PREFIX_PENALTY)
+
+        if not expansions:
+            limit = max_edits(term)
+            if limit:
+                candidates = set()
+                for gram in trigrams(term):
+                    candidates |= self._trigrams.get(gram, set())
+                for candidate in candidates:
+                    if edit_distance(term, candidate, limit) <= limit:
+                        expansions[candidate] = FUZZY_PENALTY
+        return expansions
+
+    def _match(self, term, prefix):
+        scores = {}
+        for candidate, factor in self._expand(term, prefix).items():
+            idf = self._idf(candidate)
+            for product_id, weight in self._postings[candidate].items():
+                score = weight * idf * factor
+                if score > scores.get(product_id, 0):
+                    scores[product_id] = score
+        return scores
+
+    def search(self, query, limit=50):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self._ensure_loaded()
+
+        with self._lock:
+            scores = None
+            last = len(terms) - 1
+            for index, term in enumerate(terms):
+                matches = self._match(term, prefix=index == last)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {product_id: scores[product_id] + score
+                              for product_id, score in matches.items()
+                              if product_id in scores}
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [SearchHit(product_id, score) for product_id, score in ranked[:limit]]
+
+    def autocomplete(self, prefix, limit=8):
+        hits = self.search(prefix, limit=limit)
+        with self._lock:
+            return [(hit.product_id, self._names[hit.product_id])
+                    for hit in hits if hit.product_id in self._names]
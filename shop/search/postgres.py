@@ -0,0 +1,74 @@
+from django.contrib.postgres.lookups import TrigramSimilar
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity)
+
+from shop.models import ProductSearchDocument
+
+from .base import BaseSearchBackend, SearchHit, tokenize
+
+
+# Must stay identical to the GIN expression index created by
+# shop/migrations/0032_product_search_document.py so Postgres can use it.
+DOCUMENT_VECTOR = SearchVector('document', config='english')
+
+WEIGHTED_VECTOR = (
+    SearchVector('name', weight='A', config='english')
+    + SearchVector('category', 'brand', weight='B', config='english')
+    + SearchVector('options', weight='C', config='english')
+    + SearchVector('description', weight='D', config='english')
+)
+
+# `name % query` is served by the trigram index on the name column
+ProductSearchDocument._meta.get_field('name').register_lookup(TrigramSimilar)
+
+
+def prefix_query(terms):
+    """Build a tsquery matching all terms, the last one as a prefix."""
+    parts = terms[:-1] + [f'{terms[-1]}:*']
+    return SearchQuery(' & '.join(parts), search_type='raw', config='english')
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Full-text search on ProductSearchDocument using tsvector ranking, with a
+    pg_trgm similarity fallback on product names for misspelled queries.
+    The document table itself is the index, so update/remove are no-ops.
+    """
+
+    def _documents(self):
+        return ProductSearchDocument.objects.filter(is_visible=True)
+
+    def search(self, query, limit=50):
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        tsquery = prefix_query(terms)
+        ranked = (self._documents()
+                  .annotate(vector=DOCUMENT_VECTOR)
+                  .filter(vector=tsquery)
+                  .annotate(rank=SearchRank(WEIGHTED_VECTOR, tsquery))
+                  .order_by('-rank', 'product_id')
+                  .values_list('product_id', 'rank')[:limit])
+        hits = [SearchHit(product_id, rank) for product_id, rank in ranked]
+        if hits:
+            return hits
+
+        text = ' '.join(terms)
+        similar = (self._documents()
+                   .filter(name__trigram_similar=text)
+                   .annotate(similarity=TrigramSimilarity('name', text))
+                   .order_by('-similarity', 'product_id')
+                   .values_list('product_id', 'similarity')[:limit])
+        return [SearchHit(product_id, score) for product_id, score in similar]
+
+    def autocomplete(self, prefix, limit=8):
+        terms = tokenize(prefix)
+        if not terms:
+            return []
+        return list(self._documents()
+                    .annotate(vector=DOCUMENT_VECTOR)
+                    .filter(vector=prefix_query(terms))
+                    .annotate(similarity=TrigramSimilarity('name', ' '.join(terms)))
+                    .order_by('-similarity', 'product_id')
+                    .values_list('product_id', 'name')[:limit])
@@ -0,0 +1,178 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from utils.cache import invalidate_on
+from utils.images import derivatives_ready, derive
+from utils.storage import track_references
+
+from . import counters, facets, reviews, variant_matrix
+from .listing import BATCH_SIZE, refresh_listing_stock, refresh_listings
+from .models import (
+    Brand, CartItem, Category, Product, ProductImage, ProductVariant, Review, Wishlist)
+from .offers import refresh_offers
+from .search import index_products
+
+
+invalidate_on('categories', Category)
+
+derive(ProductImage, 'image', 'derivatives', (320, 640, 960))
+derive(ProductVariant, 'image', 'image_derivatives', (320, 640))
+derive(Brand, 'logo', 'logo_derivatives', (120, 240))
+track_references(ProductImage, 'image')
+track_references(ProductVariant, 'image')
+track_references(Brand, 'logo')
+
+# Sent with `product_ids` once the listings and search index are current;
+# `feed_changed` is False when no listing column the home feed selects or
+# orders on (listing.FEED_FIELDS) changed
+catalog_changed = Signal()
+
+
+def products_changed(product_ids, changed_facets=facets.FACETS):
+    """Bring every derived catalog structure up to date for these products."""
+    product_ids = list(product_ids)
+    feed_changed = False
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        batch = product_ids[start:start + BATCH_SIZE]
+        categories, moved = refresh_listings(batch)
+        feed_changed = feed_changed or bool(moved)
+        index_products(batch)
+        if changed_facets:
+            facets.invalidate(categories, changed_facets)
+    catalog_changed.send(sender=Product, product_ids=product_ids, feed_changed=feed_changed)
+
+
+def stock_changed(product_ids):
+    """Lighter products_changed for stock movements (orders, reservations):
+    only the listings' stock columns, the stock facet and the variant
+    matrices can be affected."""
+    product_ids = list(product_ids)
+    facets.invalidate(refresh_listing_stock(product_ids), (facets.STOCK,), universe=False)
+    variant_matrix.invalidate(product_ids)
+
+
+@receiver(catalog_changed)
+def product_version_changed(sender, product_ids, **kwargs):
+    variant_matrix.invalidate(product_ids)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        # Fixtures; run manage.py rebuild_product_listings afterwards
+        return
+    if not created and getattr(instance, '_offer_changed', True):
+        # Product.save() stored the new effective offer; reprice its variants
+        refresh_offers(Product.objects.filter(pk=instance.pk))
+    products_changed([instance.id])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    index_products([instance.id])
+    facets.invalidate([instance.category_id])
+    catalog_changed.send(sender=Product, product_ids=[instance.id], feed_changed=True)
+
+
+def deleting_product(origin):
+    """True when a delete was cascaded from a product (or a queryset of
+    them); its listing goes with it and must not be rebuilt."""
+    model = getattr(origin, 'model', type(origin))
+    return model is Product
+
+
+@receiver(post_save, sender=ProductVariant)
+def variant_saved(sender, instance, **kwargs):
+    products_changed([instance.product_id], (facets.PRICE, facets.STOCK))
+
+
+@receiver(post_delete, sender=ProductVariant)
+def variant_deleted(sender, instance, origin=None, **kwargs):
+    if not deleting_product(origin):
+        products_changed([instance.product_id])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_changed(sender, instance, origin=None, **kwargs):
+    if not deleting_product(origin):
+        products_changed([instance.product_id], changed_facets=())
+
+
+@receiver(derivatives_ready, sender=ProductImage)
+def product_image_derived(sender, instance_id, **kwargs):
+    # The listing row carries the primary image's derivatives
+    refresh_listings(ProductImage.objects.filter(pk=instance_id).values_list('product_id', flat=True))
+
+
+@receiver(m2m_changed, sender=ProductVariant.options.through)
+def variant_options_changed(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and isinstance(instance, ProductVariant):
+        index_products([instance.product_id])
+        facets.invalidate(
+            Product.objects.filter(id=instance.product_id).values_list('category_id', flat=True),
+            (facets.SIZE, facets.COLOR),
+        )
+        variant_matrix.invalidate([instance.product_id])
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    old = None if created else getattr(instance, '_saved_rating', None)
+    if not created and old is None:
+        # Saved without being loaded; nothing to compare against
+        reviews.recount([instance.product_id])
+    else:
+        reviews.rating_changed(instance.product_id, old, int(instance.rating))
+    instance._saved_rating = int(instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, origin=None, **kwargs):
+    if not deleting_product(origin):
+        stored = getattr(instance, '_saved_rating', None) or int(instance.rating)
+        reviews.rating_changed(instance.product_id, stored, None)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    # Category names are searchable and category offers feed product prices
+    if not created:
+        products = Product.objects.filter(category=instance)
+        refresh_offers(products)
+        products_changed(products.values_list('id', flat=True), changed_facets=())
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    # Products of a deleted category lose its offer (category is SET_NULL)
+    products = Product.objects.filter(category__isnull=True)
+    refresh_offers(products)
+    products_changed(products.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Brand)
+def brand_saved(sender, instance, created, **kwargs):
+    if not created:
+        index_products(Product.objects.filter(
+            brand=instance).values_list('id', flat=True))
+        facets.invalidate(Category.objects.values_list('id', flat=True), (facets.BRAND,))
+
+
+COUNTER_KINDS = {CartItem: counters.CART, Wishlist: counters.WISHLIST}
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_save, sender=Wishlist)
+def basket_item_added(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: counters.adjust(
+            COUNTER_KINDS[sender], instance.user_id, 1))
+
+
+@receiver(post_delete, sender=CartItem)
+@receiver(post_delete, sender=Wishlist)
+def basket_item_removed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: counters.adjust(
+        COUNTER_KINDS[sender], instance.user_id, -1))
@@ -1,3 +1,599 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.signals import post_save
+from django.http import QueryDict
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.context_processors import shared_counts
+from shop import facets, popularity, reviews, variant_matrix
+from shop.listing import rebuild_all_listings
+from shop.models import (
+    Brand, CartItem, Category, Product, ProductListing, ProductVariant, ProductViewBucket,
+    Review, VariantAttribute, VariantOption)
+from shop.offers import refresh_offers
+from shop.pricing import price_variants
+from shop.search import autocomplete, get_backend, search_product_ids
+from user.models import CustomUser
+from utils.testing import QueryBudgetMixin
+
+
+class ProductListingTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Toys', offer_percentage=10)
+        self.product = Product.objects.create(
+            name='Rattle', category=self.category, product_offer_percentage=5)
+
+    def test_listing_created_with_product(self):
+        listing = ProductListing.objects.get(product=self.product)
+        self.assertTrue(listing.is_visible)
+        self.assertEqual(listing.total_stock, 0)
+        self.assertIsNone(listing.default_variant_id)
+
+    def test_variant_changes_update_listing(self):
+        cheap = ProductVariant.objects.create(
+            product=self.product, sku='R-1', price=Decimal('100.00'), stock=0)
+        ProductVariant.objects.create(
+            product=self.product, sku='R-2', price=Decimal('200.00'), stock=3)
+
+        listing = ProductListing.objects.get(product=self.product)
+        self.assertEqual(listing.min_price, Decimal('100.00'))
+        self.assertEqual(listing.min_offer_price, Decimal('90.00'))
+        self.assertEqual(listing.offer_source, 'Category Offer')
+        self.assertEqual(listing.total_stock, 3)
+        self.assertNotEqual(listing.default_variant_id, cheap.id)
+
+        cheap.stock = 2
+        cheap.save()
+        listing.refresh_from_db()
+        self.assertEqual(listing.default_variant_id, cheap.id)
+
+    def test_category_offer_change_updates_listing(self):
+        ProductVariant.objects.create(
+            product=self.product, sku='R-1', price=Decimal('100.00'), stock=1)
+        self.category.offer_percentage = 50
+        self.category.save()
+        listing = ProductListing.objects.get(product=self.product)
+        self.assertEqual(listing.min_offer_price, Decimal('50.00'))
+
+    def test_soft_deleted_product_hidden(self):
+        self.product.is_deleted = True
+        self.product.save()
+        self.assertFalse(ProductListing.objects.get(product=self.product).is_visible)
+
+    def test_deleting_product_removes_listing(self):
+        ProductVariant.objects.create(
+            product=self.product, sku='R-1', price=Decimal('100.00'), stock=1)
+        self.product.delete()
+        self.assertFalse(ProductListing.objects.filter(product_id=self.product.id).exists())
+
+    def test_rebuild_all_listings(self):
+        ProductListing.objects.all().delete()
+        self.assertEqual(rebuild_all_listings(), 1)
+        self.assertTrue(ProductListing.objects.filter(product=self.product).exists())
+
+
+class ShopViewTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Bath')
+        for i in range(12):
+            product = Product.objects.create(name=f'Towel {i}', category=category)
+            ProductVariant.objects.create(
+                product=product, sku=f'T-{i}', price=Decimal(100 + i), stock=i)
+
+    def test_shop_view_query_count_is_constant(self):
+        self.client.get(reverse('shop'))  # warm the facet, count and category caches
+        # Only the page query itself (no COUNT/OFFSET)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('shop'), {'sort': 'price_low'})
+        self.assertEqual(response.status_code, 200)
+        listings = list(response.context['page_obj'])
+        self.assertEqual(listings[0].name, 'Towel 0')
+        self.assertEqual(len(listings), 9)
+
+    def test_product_detail_query_budget(self):
+        product = Product.objects.get(name='Towel 3')
+        size = VariantAttribute.objects.create(name='Size')
+        color = VariantAttribute.objects.create(name='Color')
+        for i in range(4):
+            variant = ProductVariant.objects.create(product=product, sku=f'TS-{i}', price=50)
+            variant.options.add(VariantOption.objects.create(attribute=size, value=f'S{i}'),
+                                VariantOption.objects.get_or_create(attribute=color, value='Blue')[0])
+        with self.assertQueryBudget(12):
+            response = self.client.get(reverse('product_detail', args=[product.pk]))
+        self.assertEqual(len(response.context['variant_matrix']['variants']), 4)
+
+    def test_cursor_pages_forward_and_back(self):
+        first = self.client.get(reverse('shop'), {'sort': 'name_desc'}).context['page_obj']
+        self.assertFalse(first.has_previous)
+        self.assertTrue(first.has_next)
+
+        second = self.client.get(reverse('shop'), {
+            'sort': 'name_desc', 'cursor': first.next_cursor}).context['page_obj']
+        self.assertEqual(len(second), 3)
+        self.assertFalse(second.has_next)
+        names = [listing.name for listing in first] + [listing.name for listing in second]
+        self.assertEqual(len(set(names)), 12)
+        self.assertEqual(names, sorted(names, reverse=True))
+
+        back = self.client.get(reverse('shop'), {
+            'sort': 'name_desc', 'cursor': second.previous_cursor}).context['page_obj']
+        self.assertEqual([listing.name for listing in back], [listing.name for listing in first])
+        self.assertFalse(back.has_previous)
+
+    def test_invalid_cursor_shows_first_page(self):
+        response = self.client.get(reverse('shop'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(len(response.context['page_obj']), 9)
+
+    def test_json_variant_for_infinite_scroll(self):
+        data = self.client.get(reverse('shop'), {'sort': 'price_high', 'format': 'json'}).json()
+        self.assertEqual(len(data['results']), 9)
+        self.assertEqual(data['results'][0]['name'], 'Towel 11')
+        self.assertTrue(data['has_next'])
+
+        data = self.client.get(reverse('shop'), {
+            'sort': 'price_high', 'format': 'json', 'cursor': data['next_cursor']}).json()
+        self.assertEqual([row['name'] for row in data['results']],
+                         ['Towel 2', 'Towel 1', 'Towel 0'])
+        self.assertFalse(data['has_next'])
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        get_backend().reset()
+        self.addCleanup(get_backend().reset)
+        toys = Category.objects.create(name='Toys')
+        brand = Brand.objects.create(name='Tiny Steps')
+        self.rattle = Product.objects.create(
+            name='Wooden Rattle', category=toys, brand=brand,
+            description='A soft sound for newborns')
+        self.blanket = Product.objects.create(
+            name='Muslin Blanket', description='Pairs well with a rattle')
+        color = VariantAttribute.objects.create(name='Color')
+        red = VariantOption.objects.create(attribute=color, value='Crimson')
+        variant = ProductVariant.objects.create(
+            product=self.blanket, sku='MB-1', price=Decimal('300.00'), stock=2)
+        variant.options.set([red])
+
+    def test_name_match_ranks_above_description_match(self):
+        self.assertEqual(search_product_ids('rattle'),
+                         [self.rattle.id, self.blanket.id])
+
+    def test_category_brand_and_option_values_are_searchable(self):
+        self.assertEqual(search_product_ids('toys'), [self.rattle.id])
+        self.assertEqual(search_product_ids('tiny steps'), [self.rattle.id])
+        self.assertEqual(search_product_ids('crimson'), [self.blanket.id])
+
+    def test_typo_tolerance(self):
+        self.assertEqual(search_product_ids('woodne'), [self.rattle.id])
+
+    def test_prefix_autocomplete(self):
+        self.assertEqual(autocomplete('musl'), [(self.blanket.id, 'Muslin Blanket')])
+
+    def test_index_updates_incrementally(self):
+        search_product_ids('rattle')  # load the index
+        self.rattle.name = 'Wooden Teether'
+        self.rattle.save()
+        self.assertEqual(search_product_ids('teether'), [self.rattle.id])
+
+        self.rattle.is_deleted = True
+        self.rattle.save()
+        self.assertEqual(search_product_ids('teether'), [])
+
+    def test_search_view_lists_ranked_results(self):
+        response = self.client.get(reverse('search'), {'q': 'rattle'})
+        self.assertEqual([listing.product_id for listing in response.context['results']],
+                         [self.rattle.id, self.blanket.id])
+
+    def test_autocomplete_endpoint(self):
+        response = self.client.get(reverse('search_autocomplete'), {'q': 'wood'})
+        self.assertEqual(response.json()['suggestions'],
+                         [{'id': self.rattle.id, 'name': 'Wooden Rattle'}])
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Clothing')
+        self.acme = Brand.objects.create(name='Acme')
+        self.bloom = Brand.objects.create(name='Bloom')
+        size = VariantAttribute.objects.create(name='Size')
+        self.small = VariantOption.objects.create(attribute=size, value='S')
+        self.large = VariantOption.objects.create(attribute=size, value='L')
+
+        self.romper = self._product('Romper', self.acme, 'Female', 0, 6, '400', 5, [self.small])
+        self.onesie = self._product('Onesie', self.acme, 'Unisex', 0, 12, '800', 0, [self.large])
+        self.jacket = self._product('Jacket', self.bloom, 'Male', 12, 24, '1500', 2, [self.small, self.large])
+
+    def _product(self, name, brand, gender, min_age, max_age, price, stock, options):
+        product = Product.objects.create(
+            name=name, category=self.category, brand=brand, gender=gender,
+            min_age=min_age, max_age=max_age)
+        variant = ProductVariant.objects.create(
+            product=product, sku=f'{name}-1', price=Decimal(price), stock=stock)
+        variant.options.set(options)
+        return product
+
+    def _counts(self, selection=None, **kwargs):
+        result = facets.facet_counts(self.category.id, selection or {}, **kwargs)
+        return {facet.name: {option.value: option.count for option in facet.options}
+                for facet in result}
+
+    def test_counts_for_every_facet(self):
+        counts = self._counts()
+        self.assertEqual(counts['brand'], {str(self.acme.id): 2, str(self.bloom.id): 1})
+        self.assertEqual(counts['gender'], {'Female': 1, 'Male': 1, 'Unisex': 1})
+        self.assertEqual(counts['age'], {'0-6': 2, '6-12': 1, '12-24': 1})
+        self.assertEqual(counts['size'], {str(self.small.id): 2, str(self.large.id): 2})
+        self.assertEqual(counts['price'], {'under-500': 1, '500-1000': 1, '1000-2000': 1})
+        self.assertEqual(counts['stock'], {'in': 2})
+
+    def test_selection_filters_other_facets_only(self):
+        counts = self._counts({'brand': {str(self.acme.id)}})
+        self.assertEqual(counts['brand'], {str(self.acme.id): 2, str(self.bloom.id): 1})
+        self.assertEqual(counts['stock'], {'in': 1})
+
+    def test_non_numeric_ids_ignored(self):
+        params = QueryDict(f'brand=abc&brand={self.acme.id}&size=%C2%B2&color=1.5&gender=Male')
+        self.assertEqual(facets.parse_selection(params),
+                         {'brand': {str(self.acme.id)}, 'gender': {'Male'}})
+        self.assertEqual(self.client.get(reverse('shop'), {'brand': 'abc', 'size': 'x'}).status_code, 200)
+
+    def test_age_filter_matches_counts(self):
+        listings = facets.filter_listings(ProductListing.objects.all(), {'age': {'6-12'}})
+        self.assertEqual([listing.product_id for listing in listings], [self.onesie.id])
+
+    def test_filter_listings_matches_counts(self):
+        listings = facets.filter_listings(
+            ProductListing.objects.all(),
+            {'size': {str(self.large.id)}, 'stock': {'in'}})
+        self.assertEqual([listing.product_id for listing in listings], [self.jacket.id])
+
+    def test_counts_served_from_cache(self):
+        self._counts()
+        with self.assertNumQueries(0):
+            self._counts()
+
+    def test_bitmaps_as_wide_as_the_scope_with_sparse_ids(self):
+        sparse = Product.objects.create(pk=10 ** 6, name='Hat', category=self.category,
+                                        brand=self.bloom)
+        ProductVariant.objects.create(product=sparse, sku='Hat-1', price=Decimal('300'), stock=1)
+        index = facets.get_index(self.category.id)
+        self.assertEqual(index['universe']['bitmaps']['all'].bit_length(), 4)
+        self.assertEqual(self._counts(product_ids=[sparse.id, self.jacket.id])['brand'],
+                         {str(self.bloom.id): 2})
+        self.assertEqual(self._counts(price_range=('200', '500'))['brand'],
+                         {str(self.acme.id): 1, str(self.bloom.id): 1})
+
+        # Only the stock facet rebuilt; its bits follow the cached universe
+        facets.invalidate([self.category.id], (facets.STOCK,), universe=False)
+        self.assertEqual(self._counts({'brand': {str(self.bloom.id)}})['stock'], {'in': 2})
+
+    def test_stock_change_invalidates_counts(self):
+        self._counts()
+        variant = self.onesie.variants.get()
+        variant.stock = 3
+        variant.save()
+        self.assertEqual(self._counts()['stock'], {'in': 3})
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Feeding', offer_percentage=20)
+        self.variants = []
+        for i in range(50):
+            product = Product.objects.create(
+                name=f'Bottle {i}', category=self.category,
+                product_offer_percentage=30 if i % 2 else 0)
+            self.variants.append(ProductVariant.objects.create(
+                product=product, sku=f'B-{i}', price=Decimal('100.00'), stock=5))
+
+    def test_price_variants_in_one_query(self):
+        with self.assertNumQueries(1):
+            prices = price_variants(self.variants)
+        self.assertEqual(len(prices), 50)
+        for variant in self.variants:
+            self.assertEqual(prices[variant.id].offer_price, variant.get_offer_price())
+
+    def test_best_offer_source(self):
+        prices = price_variants([self.variants[0].id, self.variants[1].id])
+        self.assertEqual(prices[self.variants[0].id].offer_source, 'Category Offer')
+        self.assertEqual(prices[self.variants[1].id].offer_source, 'Product Offer')
+        self.assertEqual(prices[self.variants[1].id].unit_price, Decimal('100.00'))
+
+    def test_cart_view_prices_in_constant_queries(self):
+        user = CustomUser.objects.create_user(
+            username='geetha', email='geetha@example.com', password='securepass')
+        self.client.login(username='geetha', password='securepass')
+        CartItem.objects.create(user=user, product_variant=self.variants[0], quantity=2)
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(response.context['total_price'], Decimal('160.00'))
+
+        url = reverse('ajax_update_cart_quantity', args=[self.variants[0].id])
+        with CaptureQueriesContext(connection) as small_cart:
+            self.client.post(url, {'quantity': 3})
+        CartItem.objects.bulk_create([
+            CartItem(user=user, product_variant=variant) for variant in self.variants[1:]])
+        with CaptureQueriesContext(connection) as large_cart:
+            response = self.client.post(url, {'quantity': 2})
+        self.assertEqual(len(large_cart), len(small_cart))
+        self.assertEqual(Decimal(response.json()['new_total']), Decimal('3830.00'))
+
+
+class MaterializedOfferTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Bedding')
+        self.products = [
+            Product.objects.create(name=f'Sheet {i}', category=self.category,
+                                   product_offer_percentage=10)
+            for i in range(5)
+        ]
+        self.variants = [
+            ProductVariant.objects.create(product=product, sku=f'S-{i}',
+                                          price=Decimal('99.99'), stock=1)
+            for i, product in enumerate(self.products)
+        ]
+
+    def test_variant_stores_offer_price_on_save(self):
+        self.assertEqual(self.variants[0].offer_price, Decimal('89.99'))
+        self.assertEqual(self.products[0].get_active_offer(), ('Product Offer', 10))
+
+    def test_category_offer_change_reprices_every_variant(self):
+        self.category.offer_percentage = 25
+        self.category.save()
+        self.assertEqual(
+            set(ProductVariant.objects.values_list('offer_price', flat=True)), {Decimal('74.99')})
+        product = Product.objects.get(pk=self.products[0].pk)
+        self.assertEqual(product.get_active_offer(), ('Category Offer', 25))
+        self.assertEqual(ProductListing.objects.get(product=product).min_offer_price, Decimal('74.99'))
+
+    def test_product_offer_change_reprices_its_variants(self):
+        product = self.products[0]
+        product.product_offer_percentage = 50
+        product.save()
+        self.assertEqual(ProductVariant.objects.get(pk=self.variants[0].pk).offer_price,
+                         Decimal('50.00'))
+        self.assertEqual(ProductVariant.objects.get(pk=self.variants[1].pk).offer_price,
+                         Decimal('89.99'))
+
+    def test_save_without_offer_change_skips_repricing(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.name = 'Fitted sheet'
+        with mock.patch('shop.signals.refresh_offers') as refresh:
+            product.save()
+            self.assertFalse(refresh.called)
+            product.product_offer_percentage = 20
+            product.save()
+            self.assertTrue(refresh.called)
+
+    def test_saved_signal_without_save_reprices(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        Product.objects.filter(pk=product.pk).update(offer_percentage=50)
+        post_save.send(sender=Product, instance=product, created=False)
+        self.assertEqual(ProductVariant.objects.get(pk=self.variants[0].pk).offer_price,
+                         Decimal('89.99'))
+        post_save.send(sender=Product, instance=product, created=False, raw=True)
+
+    def test_category_refresh_query_count_does_not_grow(self):
+        Category.objects.filter(pk=self.category.pk).update(offer_percentage=40)
+        with self.assertNumQueries(3):
+            refresh_offers(Product.objects.filter(category=self.category))
+        self.assertEqual(
+            set(ProductVariant.objects.values_list('offer_price', flat=True)), {Decimal('59.99')})
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username='geetha', email='geetha@example.com', password='securepass')
+        self.client.login(username='geetha', password='securepass')
+        product = Product.objects.create(name='Bib')
+        self.variants = [
+            ProductVariant.objects.create(product=product, sku=f'BIB-{i}',
+                                          price=Decimal('150.00'), stock=3)
+            for i in range(3)
+        ]
+
+    def _counts(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        return shared_counts(request)
+
+    def test_counts_served_from_cache(self):
+        CartItem.objects.create(user=self.user, product_variant=self.variants[0])
+        self.assertEqual(self._counts(), {'cart_count': 1, 'wishlist_count': 0})
+        with self.assertNumQueries(0):
+            self._counts()
+
+    def test_views_move_counters(self):
+        self._counts()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('ajax_add_to_cart'), {'variant_id': self.variants[0].id})
+            self.client.post(reverse('ajax_add_to_cart'), {'variant_id': self.variants[1].id})
+            self.client.post(reverse('ajax_add_to_wishlist'), {'variant_id': self.variants[2].id})
+        with self.assertNumQueries(0):
+            self.assertEqual(self._counts(), {'cart_count': 2, 'wishlist_count': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('ajax_update_cart_quantity', args=[self.variants[0].id]),
+                             {'quantity': 0})
+        self.assertEqual(self._counts()['cart_count'], 1)
+
+    def test_clearing_the_cart_resets_count(self):
+        for variant in self.variants:
+            CartItem.objects.create(user=self.user, product_variant=variant)
+        self.assertEqual(self._counts()['cart_count'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            CartItem.objects.filter(user=self.user).delete()
+        self.assertEqual(self._counts()['cart_count'], 0)
+
+
+class VariantMatrixTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Romper')
+        size = VariantAttribute.objects.create(name='Size')
+        color = VariantAttribute.objects.create(name='Color')
+        self.variants = {}
+        for size_value in ('M', 'S'):
+            for color_value in ('Blue', 'Red'):
+                variant = ProductVariant.objects.create(
+                    product=self.product, sku=f'R-{size_value}-{color_value}', price=200, stock=3)
+                variant.options.add(
+                    VariantOption.objects.get_or_create(attribute=size, value=size_value)[0],
+                    VariantOption.objects.get_or_create(attribute=color, value=color_value)[0])
+                self.variants[size_value, color_value] = variant
+
+    def test_matrix_built_once_and_cached(self):
+        with self.assertNumQueries(4):  # product, variants, options, attributes
+            matrix = variant_matrix.get_matrix(self.product.pk)
+        self.assertEqual((matrix['sizes'], matrix['colors']), (['M', 'S'], ['Blue', 'Red']))
+        self.assertEqual(matrix['grid']['S']['Red'], self.variants['S', 'Red'].id)
+        self.assertEqual(matrix['variants'][0]['offer_price'], 200.0)
+        with self.assertNumQueries(0):
+            variant_matrix.get_matrix(self.product.pk)
+
+    def test_stock_and_option_changes_bump_version(self):
+        variant_matrix.get_matrix(self.product.pk)
+        version = variant_matrix.version(self.product.pk)
+
+        variant = self.variants['M', 'Blue']
+        variant.stock = 0
+        variant.save()
+        self.assertGreater(variant_matrix.version(self.product.pk), version)
+        stock = {v['id']: v['stock'] for v in variant_matrix.get_matrix(self.product.pk)['variants']}
+        self.assertEqual(stock[variant.id], 0)
+
+        variant.options.clear()
+        self.assertNotIn('Blue', variant_matrix.get_matrix(self.product.pk)['grid']['M'])
+
+    def test_endpoint(self):
+        url = reverse('product_variants', args=[self.product.pk])
+        response = self.client.get(url)
+        self.assertEqual(len(response.json()['variants']), 4)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        detail = self.client.get(reverse('product_detail', args=[self.product.pk]))
+        self.assertContains(detail, 'id="variant-matrix"')
+
+        self.product.status = 'Inactive'
+        self.product.save()
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(reverse('product_variants', args=[0])).status_code, 404)
+
+
+class ReviewAggregateTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Bib')
+        self.users = [CustomUser.objects.create_user(
+            username=f'reviewer{n}', email=f'reviewer{n}@example.com', password='x')
+            for n in range(3)]
+
+    def review(self, user, rating):
+        return Review.objects.create(product=self.product, user=user, rating=rating)
+
+    def test_aggregates_follow_create_rerate_and_delete(self):
+        first = self.review(self.users[0], 5)
+        self.review(self.users[1], 3)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.review_count, self.product.rating_sum), (2, 8))
+        self.assertEqual(self.product.average_rating, 4.0)
+        self.assertEqual(self.product.rating_histogram[0], (5, 1, 50))
+
+        first = Review.objects.get(pk=first.pk)
+        first.rating = 1
+        first.save()
+        first.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(
+            [getattr(self.product, f'rating_{stars}') for stars in range(1, 6)], [0, 0, 1, 0, 0])
+        listing = ProductListing.objects.get(product=self.product)
+        self.assertEqual((listing.rating, listing.review_count), (Decimal('3.00'), 1))
+
+    def test_recount_matches_running_totals(self):
+        for user, rating in zip(self.users, (4, 4, 1)):
+            self.review(user, rating)
+        Product.objects.filter(pk=self.product.pk).update(review_count=0, rating_sum=0, rating_4=0)
+        reviews.recount([self.product.pk])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.review_count, self.product.rating_sum,
+                          self.product.rating_4, self.product.rating_1), (3, 9, 2, 1))
+
+    def test_shop_sorts_by_rating(self):
+        other = Product.objects.create(name='Blanket')
+        Review.objects.create(product=other, user=self.users[0], rating=5)
+        self.review(self.users[1], 2)
+        response = self.client.get(reverse('shop'), {'sort': 'rating', 'format': 'json'})
+        self.assertEqual([row['id'] for row in response.json()['results']],
+                         [other.pk, self.product.pk])
+
+    def test_reviews_page_and_endpoint(self):
+        for user, rating in zip(self.users, (5, 4, 3)):
+            self.review(user, rating)
+        with mock.patch('shop.views.REVIEW_PAGE_SIZE', 2):
+            detail = self.client.get(reverse('product_detail', args=[self.product.pk]))
+            url = reverse('product_reviews', args=[self.product.pk])
+            page = self.client.get(url, {'cursor': detail.context['reviews'].next_cursor}).json()
+        self.assertEqual(detail.context['review_count'], 3)
+        self.assertEqual(len(detail.context['reviews']), 2)
+        self.assertEqual([row['rating'] for row in page['results']], [5])
+        self.assertFalse(page['has_next'])
+        self.assertEqual(self.client.get(reverse('product_reviews', args=[0])).status_code, 404)
+
+
+class PopularityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        popularity.flush()
+        self.products = [Product.objects.create(name=f'Toy {i}') for i in range(3)]
+
+    def test_views_buffered_then_flushed_in_batches(self):
+        for product, views in zip(self.products, (3, 3, 1)):
+            for _ in range(views):
+                popularity.record_view(product.pk)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).views, 0)
+
+        # live ids, one UPDATE per distinct count, bucket lookup and insert,
+        # prune, and the savepoints around them
+        with self.assertNumQueries(10):
+            self.assertEqual(popularity.flush(), 7)
+        self.assertEqual([Product.objects.get(pk=p.pk).views for p in self.products], [3, 3, 1])
+
+        popularity.record_view(self.products[2].pk)
+        popularity.flush()
+        bucket = ProductViewBucket.objects.get(product=self.products[2])
+        self.assertEqual(bucket.views, 2)
+
+    def test_due_flush_runs_off_the_request(self):
+        with mock.patch.object(popularity, 'FLUSH_THRESHOLD', 2), \
+                self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(0):
+            for product in self.products:
+                popularity.record_view(product.pk)
+        self.assertEqual(len(callbacks), 1)  # scheduled once
+        with mock.patch.object(popularity.EXECUTOR, 'submit') as submit:
+            callbacks[0]()
+        submit.assert_called_once_with(popularity._work)
+        self.assertEqual(popularity.flush(), 3)
+
+    def test_trending_uses_recent_buckets_only(self):
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        ProductViewBucket.objects.create(product=self.products[0], hour=hour, views=5)
+        ProductViewBucket.objects.create(product=self.products[1], hour=hour, views=9)
+        ProductViewBucket.objects.create(
+            product=self.products[2], hour=hour - timedelta(days=2), views=100)
+        self.assertEqual(popularity.trending_ids(), [self.products[1].pk, self.products[0].pk])
+
+        response = self.client.get(reverse('shop'), {'sort': 'trending', 'format': 'json'})
+        self.assertEqual([row['id'] for row in response.json()['results']],
+                         [self.products[1].pk, self.products[0].pk, self.products[2].pk])
+        self.assertEqual([card.product_id for card in self.client.get(reverse('home')).context['trending']],
+                         [self.products[1].pk, self.products[0].pk])
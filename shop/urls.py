@@ -6,6 +6,8 @@ urlpatterns = [
     # 🛍️ Shop Pages
     path('', views.shop_view, name='shop'),
     path('product/<int:pk>/', views.product_detail, name='product_detail'),
+    path('product/<int:pk>/variants/', views.product_variants, name='product_variants'),
+    path('product/<int:pk>/reviews/', views.product_reviews, name='product_reviews'),
 
     # Wishlist
     path('wishlist/', views.wishlist_view, name='wishlist'),
@@ -0,0 +1,69 @@
+"""
+Size x colour matrix of a product's variants for the product page.
+
+The matrix (sizes, colours, and price, offer price and stock per
+combination) is built from one variant query with its options prefetched
+and cached under the product's own namespace. Its version is the product
+version: shop/signals.py bumps it whenever products_changed (variant and
+offer changes) or stock_changed (orders moving stock) runs for the product,
+or a variant's options change. The page embeds the matrix as JSON and
+/product/<pk>/variants/ serves it with the version as ETag.
+"""
+from utils.cache import bump, get_or_set, get_version
+
+from .facets import COLOR, OPTION_ATTRIBUTES, SIZE
+from .models import Product, ProductVariant
+
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def _namespace(product_id):
+    return f'product:{product_id}'
+
+
+def version(product_id):
+    return get_version(_namespace(product_id))
+
+
+def invalidate(product_ids):
+    bump(*(_namespace(product_id) for product_id in product_ids))
+
+
+def build(product_id):
+    status = Product.objects.filter(pk=product_id).values_list('status', flat=True).first()
+    if status is None:
+        return None
+    variants = []
+    for variant in (ProductVariant.objects.filter(product_id=product_id)
+                    .prefetch_related('options__attribute').order_by('id')):
+        options = {option.attribute.name: option.value for option in variant.options.all()}
+        size, color = options.get(OPTION_ATTRIBUTES[SIZE]), options.get(OPTION_ATTRIBUTES[COLOR])
+        if size and color:
+            variants.append({
+                'id': variant.id,
+                'size': size,
+                'color': color,
+                'price': float(variant.price),
+                'offer_price': float(variant.offer_price),
+                'stock': variant.stock,
+            })
+
+    grid = {}
+    for variant in variants:
+        grid.setdefault(variant['size'], {})[variant['color']] = variant['id']
+    return {
+        'product_id': product_id,
+        'available': status == 'Active',
+        'sizes': sorted(grid),
+        'colors': sorted({variant['color'] for variant in variants}),
+        'grid': grid,
+        'variants': variants,
+    }
+
+
+def get_matrix(product_id):
+    """{'available', 'sizes', 'colors', 'grid': {size: {color: variant id}},
+    'variants'}, or None for a missing product."""
+    return get_or_set(_namespace(product_id), ['variant_matrix'],
+                      lambda: build(product_id), CACHE_TIMEOUT)
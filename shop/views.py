@@ -1,19 +1,43 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import etag, require_POST
 import json
-from django.db.models import Avg
 
 from orders.models import OrderItem
 
-from .models import Product, Category, Wishlist, CartItem, Review, ProductVariant
+from .models import Product, Category, Wishlist, CartItem, Review, ProductVariant, ProductListing
 
 
-from django.db.models import Min, Q
+from django.db.models import Case, IntegerField, Min, Q, Value, When
 
+from utils.cache import cached_queryset
+from utils.pagination import CursorPaginator, page_json_response
+
+from . import counters, popularity, variant_matrix
+from .facets import facet_counts, filter_listings, parse_selection
+from .pricing import price_cart
+from .search import search_product_ids
+
+SEARCH_RESULT_LIMIT = 500
+SHOP_PAGE_SIZE = 9
+WISHLIST_PAGE_SIZE = 6
+REVIEW_PAGE_SIZE = 5
+
+@cached_queryset('categories')
+def all_categories():
+    return Category.objects.all()
+
+
+SHOP_ORDERINGS = {
+    'price_low': ('min_price', 'product_id'),
+    'price_high': ('-min_price', '-product_id'),
+    'name_asc': ('name', 'product_id'),
+    'name_desc': ('-name', '-product_id'),
+    'rating': ('-rating', '-review_count', '-product_id'),
+}
+TRENDING_ORDERING = ('trending_rank', '-created_at', '-product_id')
 
 def shop_view(request):
     search_query = request.GET.get('search', '')
@@ -22,52 +46,86 @@ def shop_view(request):
     price_max = request.GET.get('price_max', '')
     sort_by = request.GET.get('sort', '')
 
-    # Base queryset with only active, non-deleted products
-    products = Product.objects.filter(status='Active', is_deleted=False)
-    products = products.annotate(min_variant_price=Min('variants__price'))
+    # Denormalized listing rows of active, non-deleted products
+    products = ProductListing.objects.filter(
+        is_visible=True).select_related('product')
 
-    # Search by product name
+    # Full-text search; results keep their relevance order unless sorted
+    ranked_ids = []
     if search_query:
-        products = products.filter(name__icontains=search_query)
+        ranked_ids = search_product_ids(search_query, limit=SEARCH_RESULT_LIMIT)
+        products = products.filter(product_id__in=ranked_ids)
 
     # Filter by category
     if category_id:
-        products = products.filter(category__id=category_id)
+        products = products.filter(category_id=category_id)
 
     # Filter by variant price range
+    price_range = None
     if price_min.isdigit() and price_max.isdigit():
+        price_range = (price_min, price_max)
         products = products.filter(
-            min_variant_price__gte=price_min,
-            min_variant_price__lte=price_max
+            min_price__gte=price_min,
+            min_price__lte=price_max
         )
 
-    # Sorting
-    if sort_by == "price_low":
-        products = products.order_by('min_variant_price')
-    elif sort_by == "price_high":
-        products = products.order_by('-min_variant_price')
-    elif sort_by == "name_asc":
-        products = products.order_by('name')
-    elif sort_by == "name_desc":
-        products = products.order_by('-name')
+    # Facet filters (brand, gender, age, size, color, price band, stock)
+    selection = parse_selection(request.GET)
+    products = filter_listings(products, selection)
+    facets = facet_counts(
+        category_id if category_id.isdigit() else None,
+        selection,
+        product_ids=ranked_ids if search_query else None,
+        price_range=price_range,
+    )
+
+    # Sorting; every ordering ends with product_id so it can drive the cursor
+    if sort_by in SHOP_ORDERINGS:
+        ordering = SHOP_ORDERINGS[sort_by]
+    elif sort_by == 'trending':
+        # Products outside the trending list follow it, newest first
+        trending = popularity.trending_ids()
+        products = products.annotate(trending_rank=Case(
+            *[When(product_id=pk, then=Value(rank)) for rank, pk in enumerate(trending)],
+            default=Value(len(trending)),
+            output_field=IntegerField(),
+        ))
+        ordering = TRENDING_ORDERING
+    elif ranked_ids:
+        products = products.annotate(search_rank=Case(
+            *[When(product_id=pk, then=Value(rank)) for rank, pk in enumerate(ranked_ids)],
+            output_field=IntegerField(),
+        ))
+        ordering = ('search_rank', 'product_id')
     else:
-        products = products.order_by('-created_at')
-
-    paginator = Paginator(products, 9)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    for product in page_obj:
-        default_variant = product.variants.filter(
-            stock__gt=0, product__status='Active').order_by('price').first()
-        product.default_variant_id = default_variant.id if default_variant else None
+        ordering = ('-created_at', '-product_id')
+
+    paginator = CursorPaginator(products, SHOP_PAGE_SIZE, ordering)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+
+    if request.GET.get('format') == 'json':
+        return page_json_response(page_obj, [{
+            'id': listing.product_id,
+            'name': listing.name,
+            'image': listing.primary_image_url,
+            'price': listing.min_price,
+            'offer_price': listing.min_offer_price,
+            'offer_percentage': listing.offer_percentage,
+            'in_stock': listing.total_stock > 0,
+            'variant_id': listing.default_variant_id,
+            'rating': listing.rating,
+            'review_count': listing.review_count,
+        } for listing in page_obj])
+
     context = {
         'page_obj': page_obj,
         'search_query': search_query,
-        'categories': Category.objects.all(),
+        'categories': all_categories(),
         'selected_category': category_id,
         'price_min': price_min,
         'price_max': price_max,
         'sort_by': sort_by,
+        'facets': facets,
     }
 
     return render(request, 'shop/shop.html', context)
@@ -75,43 +133,30 @@ def shop_view(request):
 
 def product_detail(request, pk):
     try:
-        product = Product.objects.prefetch_related(
-            'images', 'variants__options__attribute').get(pk=pk)
+        product = Product.objects.prefetch_related('images', 'variants').get(pk=pk)
 
         if product.status != 'Active':
             messages.error(request, "This product is currently unavailable.")
             return redirect('shop')
 
-        reviews = Review.objects.filter(
-            product=product).order_by('-created_at')
-        avg_rating = reviews.aggregate(avg=Avg('rating'))['avg']
-        total_reviews = reviews.count()
-
-        # Collect variants with size/color
-        variants = []
-        for variant in product.variants.all():
-            size = variant.options.filter(attribute__name='Size').first()
-            color = variant.options.filter(attribute__name='Color').first()
-            if size and color:
-                variants.append({
-                    'id': variant.id,
-                    'size': size.value,
-                    'color': color.value,
-                    'price': float(variant.price),
-                    'stock': variant.stock
-                })
-        unique_sizes = sorted(set(v['size'] for v in variants))
-        unique_colors = sorted(set(v['color'] for v in variants))
+        popularity.record_view(product.pk)
+
+        # Aggregates come from the product row; the rest of the reviews
+        # load through product_reviews
+        reviews = _review_paginator(product.pk).get_page() if product.review_count else []
+
+        matrix = variant_matrix.get_matrix(product.pk)
 
         context = {
             'product': product,
             'images': product.images.all(),
-            'variants': variants,
+            'variant_matrix': matrix,
             'reviews': reviews,
-            'avg_rating': round(avg_rating, 1) if avg_rating else 0,
-            'review_count': total_reviews,
-            'unique_sizes': unique_sizes,
-            'unique_colors': unique_colors,
+            'avg_rating': product.average_rating,
+            'review_count': product.review_count,
+            'rating_histogram': product.rating_histogram,
+            'unique_sizes': matrix['sizes'],
+            'unique_colors': matrix['colors'],
 
         }
         return render(request, 'shop/product_detail.html', context)
@@ -121,6 +166,35 @@ def product_detail(request, pk):
         return redirect('shop')
 
 
+def _review_paginator(product_id):
+    reviews = Review.objects.filter(product_id=product_id).select_related('user')
+    return CursorPaginator(reviews, REVIEW_PAGE_SIZE, ('-created_at', '-id'))
+
+
+def product_reviews(request, pk):
+    get_object_or_404(Product, pk=pk, status='Active')
+    page_obj = _review_paginator(pk).get_page(request.GET.get('cursor'))
+    return page_json_response(page_obj, [{
+        'id': review.id,
+        'user': review.user.username,
+        'rating': review.rating,
+        'comment': review.comment,
+        'created_at': review.created_at,
+    } for review in page_obj])
+
+
+def _variant_matrix_etag(request, pk):
+    return f'{pk}-{variant_matrix.version(pk)}'
+
+
+@etag(_variant_matrix_etag)
+def product_variants(request, pk):
+    matrix = variant_matrix.get_matrix(pk)
+    if not matrix or not matrix['available']:
+        raise Http404
+    return JsonResponse(matrix)
+
+
 # ------------------- WISHLIST --------------------
 @require_POST
 @login_required
@@ -156,9 +230,17 @@ def wishlist_view(request):
             Q(product__name__icontains=search_query)
         )
 
-    paginator = Paginator(wishlist_items, 6)  # 6 items per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(wishlist_items, WISHLIST_PAGE_SIZE, ('-added_at', '-id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+
+    if request.GET.get('format') == 'json':
+        return page_json_response(page_obj, [{
+            'product_id': item.product_id,
+            'variant_id': item.variant_id,
+            'name': item.product.name,
+            'price': item.variant.price if item.variant else None,
+            'stock': item.variant.stock if item.variant else 0,
+        } for item in page_obj])
 
     return render(request, 'shop/wishlist.html', {
         'wishlist_items': page_obj,
@@ -186,7 +268,7 @@ def ajax_add_to_wishlist(request):
         variant=variant
     )
 
-    wish_count = Wishlist.objects.filter(user=request.user).count()
+    wish_count = counters.get_count(counters.WISHLIST, request.user.id)
 
     return JsonResponse({
         'status': 'added' if created else 'exists',
@@ -205,7 +287,7 @@ def ajax_remove_from_wishlist(request):
 
     Wishlist.objects.filter(user=request.user, variant_id=variant_id).delete()
 
-    wish_count = Wishlist.objects.filter(user=request.user).count()
+    wish_count = counters.get_count(counters.WISHLIST, request.user.id)
 
     return JsonResponse({
         "status": "success",
@@ -255,10 +337,9 @@ def cart_view(request):
             Q(product_variant__product__name__icontains=search_query)
         )
 
-    for item in cart_items:
-        item.total_price = item.quantity * item.product_variant.get_offer_price()
-
-    total_price = round(sum(item.total_price for item in cart_items), 2)
+    cart_items = list(cart_items)
+    _, subtotal = price_cart(cart_items)
+    total_price = round(subtotal, 2)
 
     return render(request, 'shop/cart.html', {
         'cart_items': cart_items,
@@ -293,7 +374,7 @@ def ajax_add_to_cart(request):
         cart_item.quantity += 1
         cart_item.save()
 
-    cart_count = CartItem.objects.filter(user=request.user).count()
+    cart_count = counters.get_count(counters.CART, request.user.id)
 
     return JsonResponse({'status': 'success', 'cart_count': cart_count})
 
@@ -320,15 +401,12 @@ def ajax_update_cart_quantity(request, variant_id):
     try:
         quantity = int(request.POST.get('quantity', 1))
 
-        cart_item = CartItem.objects.get(
+        cart_item = CartItem.objects.select_related('product_variant__product').get(
             user=request.user, product_variant_id=variant_id)
 
         if quantity < 1:
             cart_item.delete()
-            total_price = sum(
-                i.quantity * i.product_variant.get_offer_price()
-                for i in CartItem.objects.filter(user=request.user)
-            )
+            _, total_price = price_cart(CartItem.objects.filter(user=request.user))
             return JsonResponse({
                 "status": "removed",
                 "message": "Item removed from cart",
@@ -344,16 +422,14 @@ def ajax_update_cart_quantity(request, variant_id):
         cart_item.quantity = quantity
         cart_item.save()
 
-        total_price = sum(
-            i.quantity * i.product_variant.get_offer_price()
-            for i in CartItem.objects.filter(user=request.user)
-        )
+        prices, total_price = price_cart(CartItem.objects.filter(user=request.user))
+        unit_price = prices[cart_item.product_variant_id].offer_price
 
         return JsonResponse({
             "status": "success",
             "message": f"Quantity updated for {cart_item.product_variant.product.name}.",
-            "item_total": cart_item.quantity * cart_item.product_variant.get_offer_price(),
-            "unit_price": cart_item.product_variant.get_offer_price(),
+            "item_total": cart_item.quantity * unit_price,
+            "unit_price": unit_price,
             "new_total": total_price
         })
 
@@ -400,6 +476,9 @@ def add_review_from_order_item(request, item_id):
     if request.method == 'POST':
         rating = request.POST.get('rating')
         comment = request.POST.get('comment', '')
+        if rating not in ('1', '2', '3', '4', '5'):
+            messages.error(request, "Please choose a rating from 1 to 5.")
+            return redirect('orders:order_detail', order_id=item.order.id)
         Review.objects.create(
             product=item.product,
             user=request.user,
@@ -11,7 +11,7 @@ from django.contrib.auth import get_user_model
 from django.contrib import messages
 import re
 import random
-from django.core.mail import send_mail
+from core.mail import queue_mail
 from django.utils import timezone
 from django.utils.timezone import now, timedelta
 from datetime import timezone as dt_timezone
@@ -115,12 +115,12 @@ def otp_signup_request(request):
             timezone.now() + timedelta(minutes=2)).isoformat()
         print(f"🔐 OTP for {email} is: {otp}")
 
-        send_mail(
-        subject='Your OTP for BabyMuse Signup',
-        message=f'Your OTP is {otp}',
-        from_email=settings.EMAIL_HOST_USER,  # <-- Use the authenticated email address
-        recipient_list=[email],
-    )
+        queue_mail(
+            subject='Your OTP for BabyMuse Signup',
+            message=f'Your OTP is {otp}',
+            from_email=settings.EMAIL_HOST_USER,  # <-- Use the authenticated email address
+            recipient_list=[email],
+        )
 
         return redirect('user:verify_otp')
     return render(request, 'user/otp_request.html')
@@ -276,6 +276,12 @@ def edit_profile(request):
                 request.session['otp_sent_time'] = timezone.now().isoformat()
 
                 print(f"📧 OTP for {new_email}: {otp}")
+                queue_mail(
+                    'Verify your new BabyMuse email',
+                    f'Hello {user.first_name},\n\nYour OTP to confirm this email address is: {otp}',
+                    [new_email],
+                    from_email=settings.EMAIL_HOST_USER,
+                )
                 messages.info(
                     request, f"We've sent an OTP to {new_email}. Please verify to update your email."
                 )
@@ -346,7 +352,12 @@ def resend_email_otp(request):
     request.session['otp_sent_time'] = timezone.now().isoformat()
 
     print(f"🔁 Resent OTP for {new_email}: {otp}")
-    # TODO: Send OTP via email
+    queue_mail(
+        'Verify your new BabyMuse email',
+        f'Hello {request.user.first_name},\n\nYour new OTP is: {otp}',
+        [new_email],
+        from_email=settings.EMAIL_HOST_USER,
+    )
 
     messages.success(request, f"OTP resent to {new_email}.")
     return redirect('user:verify_email_otp')
@@ -435,12 +446,11 @@ def forgot_password(request):
                 timezone.now() + timedelta(minutes=1)).isoformat()
             print(f"📧 Email change OTP for {email} is: {otp}")
 
-            send_mail(
+            queue_mail(
                 'Your BabyMuse Password Reset OTP',
                 f'Hello {user.first_name},\n\nYour OTP for password reset is: {otp}\n\nThis OTP is valid for 2 minutes.',
-                settings.EMAIL_HOST_USER,  # <-- Use the authenticated email address
                 [email],
-                fail_silently=False,
+                from_email=settings.EMAIL_HOST_USER,  # <-- Use the authenticated email address
             )
             return redirect('user:verify_reset_otp')
         except User.DoesNotExist:
@@ -478,12 +488,11 @@ def resend_reset_otp(request):
                 timezone.now() + timedelta(minutes=1)).isoformat()
             print(f"📧 Email change OTP for {email} is: {otp}")
 
-            send_mail(
+            queue_mail(
                 'Your New OTP for BabyMuse Password Reset',
                 f'Hello {user.first_name},\n\nYour new OTP is: {otp}\n\nIt is valid for 2 minutes.',
-               settings.EMAIL_HOST_USER,  # <-- Use the authenticated email address
                 [email],
-                fail_silently=False,
+                from_email=settings.EMAIL_HOST_USER,  # <-- Use the authenticated email address
             )
             messages.success(request, 'New OTP sent.')
         except:
@@ -0,0 +1,132 @@
+"""
+Versioned cache namespaces.
+
+Every cached value lives under a namespace ('banners', 'categories', ...)
+whose current version is part of the key. Invalidating a namespace bumps
+its version, which orphans all of its keys at once without having to know
+them; the orphans simply expire. `invalidate_on` bumps namespaces from
+model post_save/post_delete signals.
+
+A version missing from the cache (never set, or culled by the backend) is
+started from the current time in nanoseconds rather than from 0, so it
+can't land on a version whose keys or ETags may still be around.
+"""
+import functools
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+
+
+DEFAULT_TIMEOUT = 60 * 15
+
+
+def _version_key(namespace):
+    return f'ns:{namespace}:version'
+
+
+def _seed(keys):
+    """Start the versions stored under `keys`; return {key: version}."""
+    seed = time.time_ns()
+    for key in keys:
+        # Never expire versions, or old keys could become current again
+        cache.add(key, seed, None)
+    # Another process may have started them first
+    found = cache.get_many(keys)
+    return {key: found.get(key, seed) for key in keys}
+
+
+def get_versions(namespaces):
+    """Return {namespace: version} with one cache round trip (two when a
+    version has to be started)."""
+    keys = {namespace: _version_key(namespace) for namespace in namespaces}
+    found = cache.get_many(keys.values())
+    missing = [key for key in keys.values() if key not in found]
+    if missing:
+        found.update(_seed(missing))
+    return {namespace: found[key] for namespace, key in keys.items()}
+
+
+def get_version(namespace):
+    return get_versions([namespace])[namespace]
+
+
+def bump(*namespaces):
+    """Invalidate everything cached under the given namespaces."""
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # A fresh start is already a new version
+            _seed([key])
+
+
+def versioned_key(namespace, *parts, version=None):
+    if version is None:
+        version = get_version(namespace)
+    suffix = ':'.join(str(part) for part in parts)
+    if len(suffix) > 150:
+        suffix = hashlib.md5(suffix.encode()).hexdigest()
+    return f'{namespace}:v{version}:{suffix}'
+
+
+def get_or_set(namespace, parts, builder, timeout=DEFAULT_TIMEOUT):
+    """Return the cached value for (namespace, *parts), building and storing
+    it with `builder()` on a miss."""
+    key = versioned_key(namespace, *parts)
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.set(key, value, timeout)
+    return value
+
+
+def cached(namespace, timeout=DEFAULT_TIMEOUT, key=None):
+    """
+    Cache a function's return value under `namespace`. The key is built from
+    the call arguments, or from `key(*args, **kwargs)` when given. Results
+    must be picklable and not None.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if key is not None:
+                parts = key(*args, **kwargs)
+                parts = parts if isinstance(parts, (list, tuple)) else [parts]
+            else:
+                parts = [*args, *(f'{name}={value}' for name, value in sorted(kwargs.items()))]
+            return get_or_set(namespace, [func.__qualname__, *parts],
+                              lambda: func(*args, **kwargs), timeout)
+        wrapper.invalidate = lambda: bump(namespace)
+        return wrapper
+    return decorator
+
+
+def cached_queryset(namespace, timeout=DEFAULT_TIMEOUT, key=None):
+    """Like `cached`, for functions returning a queryset: the rows are
+    fetched once and cached as a list."""
+    def decorator(func):
+        @functools.wraps(func)
+        def evaluate(*args, **kwargs):
+            return list(func(*args, **kwargs))
+        return cached(namespace, timeout, key)(evaluate)
+    return decorator
+
+
+def invalidate_on(namespaces, *models):
+    """Bump `namespaces` whenever an instance of any of `models` is saved or
+    deleted."""
+    if isinstance(namespaces, str):
+        namespaces = [namespaces]
+
+    def receiver(sender, **kwargs):
+        bump(*namespaces)
+
+    label = ','.join(namespaces)
+    for model in models:
+        for name, signal in (('save', post_save), ('delete', post_delete)):
+            signal.connect(receiver, sender=model, weak=False,
+                           dispatch_uid=f'cache:{label}:{model._meta.label}:{name}')
+    return receiver
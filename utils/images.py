@@ -0,0 +1,195 @@
+"""
+Responsive image derivatives.
+
+`derive(model, field, target, widths)` registers an image field: once a
+save with a new image commits, a worker thread opens the upload, applies its
+EXIF orientation and writes one copy per width (never wider than the
+original) as WebP and in a fallback format (JPEG, or PNG when the image has
+transparency). Copies are written without EXIF, ICC or text metadata. The
+result is stored in the JSON field `target`:
+
+    {'source': 'products/a.jpg', 'width': 1600, 'height': 1200,
+     'files': {'webp': [[320, 'derivatives/products/a-320.webp'], ...],
+               'jpeg': [[320, 'derivatives/products/a-320.jpg'], ...]}}
+
+with one UPDATE that bypasses model signals, and `derivatives_ready` is
+sent. Templates turn it into a srcset with the `srcset` filter in
+core/templatetags/images.py. `manage.py generate_image_derivatives`
+processes whatever the workers missed (existing images, crashes).
+"""
+import logging
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+logger = logging.getLogger(__name__)
+
+WORKERS = 2
+PREFIX = 'derivatives'
+WEBP = 'webp'
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg', 'png': 'png'}
+QUALITY = {'webp': 80, 'jpeg': 85}
+
+EXECUTOR = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='images')
+
+# Sent with `instance_id` once an instance's derivatives are stored
+derivatives_ready = Signal()
+
+Spec = namedtuple('Spec', ['model', 'field', 'target', 'widths'])
+SPECS = {}
+
+
+def _key(model, field):
+    return f'{model._meta.label}.{field}'
+
+
+def is_pending(instance, spec):
+    """True when the instance has an image its derivatives weren't made from."""
+    name = getattr(instance, spec.field).name
+    return bool(name) and (getattr(instance, spec.target) or {}).get('source') != name
+
+
+def derive(model, field, target, widths):
+    """Generate derivatives of `model.field` into the JSON field `target`
+    after every save that changes the image."""
+    spec = Spec(model, field, target, tuple(sorted(widths)))
+    key = _key(model, field)
+    SPECS[key] = spec
+
+    def saved(sender, instance, **kwargs):
+        if is_pending(instance, spec) and getattr(settings, 'IMAGE_DERIVATIVES_ON_COMMIT', True):
+            transaction.on_commit(lambda: EXECUTOR.submit(_work, key, instance.pk))
+
+    def deleted(sender, instance, **kwargs):
+        names = file_names(getattr(instance, target))
+        if names:
+            transaction.on_commit(lambda: delete_files(names, getattr(instance, field).storage))
+
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=f'images:{key}:save')
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=f'images:{key}:delete')
+    return spec
+
+
+def file_names(derivatives):
+    return [name for files in (derivatives or {}).get('files', {}).values()
+            for _, name in files]
+
+
+def delete_files(names, storage):
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.warning('Could not delete image derivative %s', name)
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _encode(image, fmt):
+    image = image.convert('RGBA' if fmt != 'jpeg' and _has_alpha(image) else 'RGB')
+    # Only what is passed to save() is written; drop what the source carried
+    image.info = {}
+    buffer = BytesIO()
+    image.save(buffer, format=fmt.upper(), optimize=True, **(
+        {'quality': QUALITY[fmt]} if fmt in QUALITY else {}))
+    return buffer.getvalue()
+
+
+def generate(field_file, widths):
+    """Write the derivatives of an image and return their description."""
+    storage = field_file.storage
+    with field_file.open('rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    fallback = 'png' if _has_alpha(image) else 'jpeg'
+
+    sizes = [width for width in widths if width < image.width] or [image.width]
+    base = f'{PREFIX}/{os.path.splitext(field_file.name)[0]}'
+    files = {WEBP: [], fallback: []}
+    for width in sizes:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS) if width < image.width else image
+        for fmt in files:
+            name = storage.save(f'{base}-{width}.{EXTENSIONS[fmt]}',
+                                ContentFile(_encode(resized, fmt)))
+            files[fmt].append([width, name])
+    return {'source': field_file.name, 'width': image.width, 'height': image.height,
+            'files': files}
+
+
+def process(key, pk, force=False):
+    """Generate and store the derivatives of one instance. Returns True when
+    new derivatives were stored."""
+    spec = SPECS[key]
+    instance = spec.model.objects.filter(pk=pk).only('pk', spec.field, spec.target).first()
+    if instance is None or not (force or is_pending(instance, spec)):
+        return False
+    field_file = getattr(instance, spec.field)
+    if not field_file.name:
+        return False
+    previous = getattr(instance, spec.target) or {}
+
+    try:
+        derivatives = generate(field_file, spec.widths)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as exc:
+        logger.warning('No derivatives for %s %s: %s', key, pk, exc)
+        derivatives = {'source': field_file.name, 'error': str(exc)}
+
+    # Only store them if the image wasn't replaced in the meantime
+    stored = spec.model.objects.filter(pk=pk, **{spec.field: field_file.name}).update(
+        **{spec.target: derivatives})
+    if not stored:
+        delete_files(file_names(derivatives), field_file.storage)
+        return False
+    # Every name of the previous run holds a reference of its own, even when
+    # the new run stored the same content under the same name
+    delete_files(file_names(previous), field_file.storage)
+    derivatives_ready.send(sender=spec.model, instance_id=pk)
+    return 'error' not in derivatives
+
+
+def _work(key, pk):
+    try:
+        process(key, pk)
+    except Exception:
+        logger.exception('Generating image derivatives for %s %s failed', key, pk)
+    finally:
+        # Worker threads open their own connections
+        connections.close_all()
+
+
+def process_pending(force=False):
+    """Generate derivatives for every registered image still missing them
+    (all of them with `force`). Returns the number of images processed."""
+    done = 0
+    for key, spec in SPECS.items():
+        instances = spec.model.objects.exclude(**{spec.field: ''}).exclude(
+            **{f'{spec.field}__isnull': True}).only('pk', spec.field, spec.target)
+        for instance in instances.iterator():
+            if (force or is_pending(instance, spec)) and process(key, instance.pk, force):
+                done += 1
+    return done
+
+
+def srcset(derivatives, fmt=None):
+    """'url 320w, url 640w' for one format of a derivatives description;
+    the fallback format when `fmt` is not given."""
+    files = (derivatives or {}).get('files') or {}
+    if fmt is None:
+        fmt = next((name for name in files if name != WEBP), None)
+    # Derivatives are stored next to their source, under MEDIA_ROOT/MEDIA_URL
+    return ', '.join(f'{default_storage.url(name)} {width}w'
+                     for width, name in files.get(fmt, []))
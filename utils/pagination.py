@@ -0,0 +1,169 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of COUNT(*) + OFFSET, each page is fetched with a WHERE clause on the
+sort key of the last row seen, so page 1000 costs the same as page 1 when the
+ordering is backed by an index. The last ordering field must be unique (the
+primary key) so that rows with equal sort values are never skipped.
+"""
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import JsonResponse
+
+
+COUNT_CACHE_TIMEOUT = 5 * 60
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder drops microseconds past the millisecond, which would
+    # skip rows created within the same millisecond as a page's last row
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def cached_count(queryset, timeout=COUNT_CACHE_TIMEOUT):
+    """COUNT(*) of a queryset, remembered for a few minutes per query."""
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(f'{sql}{params!r}'.encode()).hexdigest()
+    key = f'pagination:count:{queryset.model._meta.label_lower}:{digest}'
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+class CursorPage:
+    def __init__(self, paginator, object_list, has_next, has_previous,
+                 next_cursor, previous_cursor):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    @property
+    def count(self):
+        return self.paginator.count
+
+
+class CursorPaginator:
+    """
+    Paginate `queryset` by `ordering`, a sequence of field or annotation
+    names each optionally prefixed with '-', ending with a unique field.
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    @property
+    def count(self):
+        return cached_count(self.queryset.order_by())
+
+    def _field(self, name):
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return self.queryset.model._meta.get_field(name)
+
+    def _position(self, obj):
+        return [getattr(obj, name) for name, _ in self.ordering]
+
+    def encode_cursor(self, position, backwards=False):
+        payload = {'v': position, 'b': backwards}
+        data = json.dumps(payload, cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            payload = json.loads(data)
+            values = payload['v']
+            if len(values) != len(self.ordering):
+                raise InvalidCursor(cursor)
+            position = [None if value is None else self._field(name).to_python(value)
+                        for (name, _), value in zip(self.ordering, values)]
+            return position, bool(payload.get('b'))
+        except (binascii.Error, ValueError, KeyError, TypeError, ValidationError) as exc:
+            raise InvalidCursor(cursor) from exc
+
+    def _after(self, position, backwards):
+        """Q matching rows strictly after `position` in the (possibly
+        reversed) ordering: a > x OR (a = x AND b > y) OR ..."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, position):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _order_by(self, backwards):
+        return [f'-{name}' if descending != backwards else name
+                for name, descending in self.ordering]
+
+    def get_page(self, cursor=None):
+        """Return the page after (or before) `cursor`; a missing or
+        malformed cursor gives the first page."""
+        position, backwards = None, False
+        if cursor:
+            try:
+                position, backwards = self.decode_cursor(cursor)
+            except InvalidCursor:
+                position = None
+
+        queryset = self.queryset.order_by(*self._order_by(backwards))
+        if position is not None:
+            queryset = queryset.filter(self._after(position, backwards))
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+            has_previous, has_next = more, True
+        else:
+            has_previous, has_next = position is not None, more
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(self._position(rows[-1]))
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor(self._position(rows[0]), backwards=True)
+        return CursorPage(self, rows, has_next, has_previous, next_cursor, previous_cursor)
+
+
+def page_json_response(page, results):
+    """JSON body for infinite-scroll clients: the serialized rows of a
+    CursorPage and the cursor of the next one."""
+    return JsonResponse({
+        'results': results,
+        'has_next': page.has_next,
+        'next_cursor': page.next_cursor,
+    })
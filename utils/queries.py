@@ -0,0 +1,64 @@
+"""
+Recording the SQL a block of code runs.
+
+QueryLog hooks every database connection with an execute wrapper, so it
+works with DEBUG off, and keeps the number of queries, the time spent in
+the database and how often each query shape ran. A shape is the SQL with
+literals and IN lists collapsed, so the per-row queries of an N+1 loop all
+share one shape and show up as a repeat.
+"""
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.db import connections
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_IN_LISTS = re.compile(r'\((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)')
+
+
+def shape(sql):
+    """The SQL with its literals and parameter lists replaced by '?'."""
+    sql = _LITERALS.sub('?', sql)
+    return _IN_LISTS.sub('(?)', sql)
+
+
+class QueryLog:
+    """
+    Context manager recording the queries run on all connections:
+
+        with QueryLog() as log:
+            ...
+        log.count, log.duration, log.repeated(5)
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[shape(sql)] += 1
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def repeated(self, limit):
+        """{shape: times} of SELECTs run more than `limit` times."""
+        return {sql: times for sql, times in self.shapes.most_common()
+                if times > limit and sql.lstrip().upper().startswith('SELECT')}
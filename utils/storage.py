@@ -0,0 +1,148 @@
+"""
+Content-addressed media storage.
+
+ContentAddressedStorage hashes every saved file and stores it once under
+blobs/<aa>/<bb>/<sha256><ext>, whatever name or upload_to it was saved
+with, so re-uploading the same cropped photo for another product or variant
+reuses the stored file. Only the catalog and banner images use it
+(`blob_storage`), each registered with `track_references` so that every
+reference taken is also given back. core.MediaBlob counts the references:
+each save adds one and each delete() removes one, and the file itself is
+deleted once the last reference is gone and the transaction commits. Files saved before
+the switch keep their names and are deleted outright when released.
+
+A blob's name changes with its content, so its URL can be cached forever:
+core.views.media_blob serves blobs with far-future, immutable cache
+headers. `track_references` releases the file of a model's file fields when
+the field is cleared or changed, or the row deleted; a field using this
+storage without it would never free its files.
+"""
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+
+
+PREFIX = 'blobs'
+BLOB_NAME = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]{1,10})?$')
+
+
+def blob_name(digest, ext=''):
+    return f'{PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+
+def is_blob(name):
+    return bool(name and BLOB_NAME.match(name))
+
+
+def _digest(content):
+    sha = hashlib.sha256()
+    size = 0
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        sha.update(chunk)
+        size += len(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha.hexdigest(), size
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage deduplicating files by their SHA-256."""
+
+    def save(self, name, content, max_length=None):
+        from core.models import MediaBlob
+
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        ext = os.path.splitext(name or getattr(content, 'name', '') or '')[1].lower()
+        if not re.fullmatch(r'(\.[a-z0-9]{1,10})?', ext):
+            ext = ''
+        digest, size = _digest(content)
+        name = blob_name(digest, ext)
+
+        with transaction.atomic():
+            if MediaBlob.objects.filter(name=name).update(refs=F('refs') + 1):
+                return name
+            if not self.exists(name):
+                stored = self._save(name, content)
+                if stored != name:
+                    # Written concurrently by another save; keep theirs
+                    super().delete(stored)
+            try:
+                with transaction.atomic():
+                    MediaBlob.objects.create(name=name, size=size, refs=1)
+            except IntegrityError:
+                MediaBlob.objects.filter(name=name).update(refs=F('refs') + 1)
+        return name
+
+    def delete(self, name):
+        """Drop one reference; the file goes with the last one."""
+        from core.models import MediaBlob
+
+        if not is_blob(name):
+            return super().delete(name)
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                return
+            if blob.refs > 1:
+                MediaBlob.objects.filter(name=name).update(refs=F('refs') - 1)
+                return
+            blob.delete()
+            transaction.on_commit(lambda: self._remove(name))
+
+    def _remove(self, name):
+        from core.models import MediaBlob
+
+        # Unless saved again since
+        if not MediaBlob.objects.filter(name=name).exists():
+            super().delete(name)
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def _release_later(storage, name):
+    transaction.on_commit(lambda: storage.delete(name))
+
+
+def _file_names(instance, fields):
+    # Deferred fields are left out: what they hold isn't known
+    return {field: getattr(instance.__dict__[field], 'name', instance.__dict__[field]) or ''
+            for field in fields if field in instance.__dict__}
+
+
+def track_references(model, *fields):
+    """Release the stored file of each of `fields` when a save replaces or
+    clears it and when an instance is deleted."""
+    label = model._meta.label
+    storages = {field: model._meta.get_field(field).storage for field in fields}
+
+    def loaded(sender, instance, **kwargs):
+        # The names as stored, like OrderItem._saved_status
+        instance._stored_files = _file_names(instance, fields)
+
+    def saved(sender, instance, created, raw=False, **kwargs):
+        current = _file_names(instance, fields)
+        if not (created or raw):
+            for field, name in getattr(instance, '_stored_files', {}).items():
+                if name and name != current.get(field, name):
+                    _release_later(storages[field], name)
+        instance._stored_files = current
+
+    def deleted(sender, instance, **kwargs):
+        for field in fields:
+            name = getattr(instance, field).name
+            if name:
+                _release_later(storages[field], name)
+
+    post_init.connect(loaded, sender=model, weak=False, dispatch_uid=f'storage:{label}:init')
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=f'storage:{label}:save')
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=f'storage:{label}:delete')
@@ -0,0 +1,116 @@
+"""
+Helpers for tests.
+"""
+import email
+import socketserver
+import threading
+from contextlib import contextmanager
+
+from django.test import override_settings
+
+from .queries import QueryLog
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply('220 localhost ready')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip().strip('<>')
+                if address in server.rejected:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                for data in self.rfile:
+                    if data == b'.\r\n':
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                server.messages.append(email.message_from_bytes(b''.join(lines)))
+                self.reply('250 OK')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    A minimal SMTP server on localhost that keeps what it receives, for
+    tests that need real SMTP traffic:
+
+        with LocalSMTPServer() as server, server.settings():
+            ...
+        server.messages  # email.message.Message objects
+
+    Recipients in `rejected` are refused with a 550.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, rejected=()):
+        super().__init__(('127.0.0.1', 0), _SMTPHandler)
+        self.rejected = set(rejected)
+        self.messages = []
+        self.connections = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def settings(self):
+        return override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+        )
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class QueryBudgetMixin:
+    """TestCase mixin for asserting how many queries a block may run."""
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, max_repeats=1):
+        """Fail if the block runs more than `max_queries` queries or any
+        SELECT shape more than `max_repeats` times."""
+        with QueryLog() as log:
+            yield log
+        repeated = log.repeated(max_repeats)
+        details = ''.join(f'\n  {times}x {sql}' for sql, times in repeated.items())
+        if log.count > max_queries:
+            self.fail(f"{log.count} queries run, budget {max_queries}{details}")
+        if repeated:
+            self.fail(f"Queries repeated more than {max_repeats} times:{details}")